@@ -1,13 +1,15 @@
 # backend/api/admin_api.py
 from __future__ import annotations
-import os, json, datetime as dt, sqlite3
+import os, datetime as dt, sqlite3, shutil, zipfile
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
 
 # Imports theo gói backend
 from backend.api.admin_auth import require_admin, make_token, ADMIN_USER, ADMIN_PASS
-from backend.rag.parser import parse_docx_as_table, infer_year_from_doc
-from backend.ingest.ingest_lib import append_events, rebuild_events
+from backend.rag.parser import parse_docx_cached
+from backend.ingest.ingest_lib import _to_iso
+from backend.ingest.job_queue import enqueue, ensure_tables, list_jobs
+from backend.rag.db import read_conn, write_conn
 
 from fastapi import Query
 
@@ -41,10 +43,8 @@ def upload_preview(
     tmp_path.write_bytes(file.file.read())
 
     try:
-        from docx import Document
-        doc = Document(tmp_path.as_posix())
-        default_year = year or infer_year_from_doc(doc) or dt.date.today().year
-        events = parse_docx_as_table(tmp_path.as_posix(), default_year)
+        # year trống → parser tự dò năm; kết quả được cache cạnh file để /ingest dùng lại
+        events, cached = parse_docx_cached(tmp_path.as_posix(), year)
     except Exception as e:
         raise HTTPException(400, f"parse_error: {e}")
 
@@ -52,14 +52,14 @@ def upload_preview(
         "file": safe_name,
         "temp_path": tmp_path.as_posix(),
         "count": len(events),
+        "cached": cached,
         "events": events[:300],
     }
 
 @router.post("/ingest")
 def do_ingest(
-    bg: BackgroundTasks,
     temp_path: str = Form(...),
-    mode: str = Form("append"),           # append | rebuild
+    mode: str = Form("append"),           # append | replace | rebuild
     tag: str | None = Form(None),
     dedupe: bool = True,
     admin: str = Depends(require_admin),
@@ -74,78 +74,100 @@ def do_ingest(
         raise HTTPException(400, detail=f"temp_path invalid or not found: {p.as_posix()}")
 
     mode = (mode or "append").lower()
-    if mode not in ("append", "rebuild"):
-        raise HTTPException(400, detail="mode must be 'append' or 'rebuild'")
+    if mode not in ("append", "replace", "rebuild"):
+        raise HTTPException(400, detail="mode must be 'append', 'replace' or 'rebuild'")
 
-    task_id = int(dt.datetime.now().timestamp())
-    # log trạng thái queued để UI thấy ngay
-    _log_upload(task_id, filename=p.name, tag=tag, mode=mode, status="queued")
-    bg.add_task(_ingest_task, p.as_posix(), mode, tag, dedupe, task_id)
-    return {"task_id": task_id, "status": "queued"}
+    # chỉ xếp hàng; worker ingest (python -m backend.ingest.worker) là nơi duy nhất ghi store
+    task_id, job_id = enqueue(DB_PATH, "docx", mode, p.as_posix(), tag=tag, dedupe=dedupe, filename=p.name)
+    return {"task_id": task_id, "job_id": job_id, "status": "queued"}
 
-def _ingest_task(temp_path: str, mode: str, tag: str | None, dedupe: bool, task_id: int):
+@router.post("/ingest/bulk")
+def do_bulk_ingest(
+    file: UploadFile = File(...),         # .zip chứa nhiều file .docx (vd cả năm lịch tuần)
+    mode: str = Form("append"),           # append | replace
+    tag: str | None = Form(None),
+    year: int | None = Form(None),
+    dedupe: bool = True,
+    admin: str = Depends(require_admin),
+):
+    safe_name = Path(file.filename).name
+    if not safe_name.lower().endswith(".zip"):
+        raise HTTPException(400, "Only .zip is supported")
+    mode = (mode or "append").lower()
+    if mode not in ("append", "replace"):
+        raise HTTPException(400, detail="mode must be 'append' or 'replace'")
+
+    zip_path = UPLOAD_DIR / f"bulk_{int(dt.datetime.now().timestamp() * 1000)}_{safe_name}"
+    with zip_path.open("wb") as f:
+        shutil.copyfileobj(file.file, f)
+    if not zipfile.is_zipfile(zip_path):
+        zip_path.unlink(missing_ok=True)
+        raise HTTPException(400, "invalid zip file")
+
+    task_id, job_id = enqueue(DB_PATH, "bulk", mode, zip_path.as_posix(), tag=tag, dedupe=dedupe, year=year,
+                              filename=safe_name)
+    return {"task_id": task_id, "job_id": job_id, "status": "queued"}
+
+@router.get("/jobs")
+def list_ingest_jobs(admin: str = Depends(require_admin), limit: int = Query(50, ge=1, le=500)):
+    """Hàng đợi ingest: job đang chờ/đang chạy/xong (tiến độ chi tiết nằm ở uploads.stage/chunks_*)."""
+    conn = write_conn(DB_PATH)
     try:
-        p = Path(temp_path)
-        if not p.exists():
-            raise FileNotFoundError(f"temp_path not found: {temp_path!r}")
-
-        from docx import Document
-        import datetime as _dt
-        from backend.rag.parser import parse_docx_as_table, infer_year_from_doc
-
-        doc = Document(p.as_posix())
-        default_year = infer_year_from_doc(doc) or _dt.date.today().year
-        events = parse_docx_as_table(p.as_posix(), default_year)
-
-        if mode == "rebuild":
-            res = rebuild_events(events, STORE_DIR)
-        else:
-            res = append_events(events, STORE_DIR, dedupe=dedupe)
-
-        _log_upload(
-            task_id,
-            filename=p.name,
-            tag=tag,
-            mode=mode,
-            added=res.get("added", 0),
-            total=res.get("total_after", 0),
-            status="done",
-            log=json.dumps(res, ensure_ascii=False),
-        )
-    except Exception:
-        import traceback
-        err = traceback.format_exc()
-        _log_upload(task_id, status="failed", log=err)
-        print("[INGEST_TASK][FAILED]\n", err)
-
-def _log_upload(task_id: int, filename: str | None=None, tag: str | None=None, mode: str | None=None,
-                status: str="queued", added: int | None=None, total: int | None=None, log: str | None=None):
-    Path(STORE_DIR).mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""CREATE TABLE IF NOT EXISTS uploads(
-      id INTEGER PRIMARY KEY,
-      filename TEXT, tag TEXT, mode TEXT, total_events INTEGER, added_events INTEGER,
-      status TEXT, log TEXT, created_at TEXT, updated_at TEXT)""")
-    now = dt.datetime.now().isoformat(timespec="seconds")
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM uploads WHERE id=?", (task_id,))
-    if cur.fetchone():
-        cur.execute("""UPDATE uploads SET status=?, added_events=COALESCE(?,added_events),
-                       total_events=COALESCE(?,total_events), log=COALESCE(?,log), updated_at=? WHERE id=?""",
-                    (status, added, total, log, now, task_id))
-    else:
-        cur.execute("""INSERT INTO uploads(id,filename,tag,mode,total_events,added_events,status,log,created_at,updated_at)
-                       VALUES(?,?,?,?,?,?,?,?,?,?)""",
-                    (task_id, filename, tag, mode, total, added, status, log, now, now))
-    conn.commit(); conn.close()
+        ensure_tables(conn)
+        return {"items": list_jobs(conn, limit)}
+    finally:
+        conn.close()
+
+@router.post("/events/delete")
+def delete_events_api(
+    date_from: str | None = Form(None),   # dd/mm/yyyy
+    date_to: str | None = Form(None),
+    tag: str | None = Form(None),
+    hashes: str | None = Form(None),      # nhiều hash cách nhau bởi dấu phẩy
+    admin: str = Depends(require_admin),
+):
+    hash_list = [h.strip() for h in (hashes or "").split(",") if h.strip()]
+    if not (date_from or date_to or tag or hash_list):
+        raise HTTPException(400, detail="need at least one of date_from, date_to, tag, hashes")
+    try:
+        for d in (date_from, date_to):
+            if d:
+                _to_iso(d)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    # xoá cũng ghi FAISS/SQLite → xếp hàng cho worker ingest như /ingest, không chạy trong API
+    params = {"date_from": date_from, "date_to": date_to, "tag": tag, "hashes": hash_list or None}
+    label = " ".join(f"{k}={v}" for k, v in (("from", date_from), ("to", date_to), ("tag", tag)) if v)
+    if hash_list:
+        label += f" hashes={len(hash_list)}"
+    task_id, job_id = enqueue(DB_PATH, "delete", "delete", "", params=params,
+                              filename=f"delete: {label.strip()}")
+    return {"task_id": task_id, "job_id": job_id, "status": "queued"}
+
+@router.get("/cache")
+def cache_stats(admin: str = Depends(require_admin)):
+    """Bộ đếm hit/miss của cache câu trả lời trong worker đang phục vụ request này."""
+    try:
+        from backend.rag.answer_cache import answer_cache
+    except Exception as e:
+        raise HTTPException(503, detail=f"RAG not ready: {e}")
+    return answer_cache.stats()
+
+@router.get("/prompt")
+def prompt_stats(admin: str = Depends(require_admin)):
+    """Kích thước prompt RAG (ước lượng token), số ngữ cảnh giữ lại, độ trễ retrieval/LLM trong worker này."""
+    try:
+        from backend.rag.context_packer import prompt_stats as stats
+    except Exception as e:
+        raise HTTPException(503, detail=f"RAG not ready: {e}")
+    return stats.stats()
 
 @router.get("/uploads")
 def list_uploads(admin: str = Depends(require_admin)):
-    conn = sqlite3.connect(DB_PATH); conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    cur = read_conn(DB_PATH).cursor(); cur.row_factory = sqlite3.Row
     cur.execute("SELECT * FROM uploads ORDER BY id DESC LIMIT 50")
     rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
     return {"items": rows}
 
 # Phân trang
@@ -159,9 +181,8 @@ def list_uploads(
     page_size: int = Query(8, ge=1, le=200),         # mặc định 8
     tag: str | None = Query(None),
 ):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    cur = read_conn(DB_PATH).cursor()
+    cur.row_factory = sqlite3.Row
 
     # total
     if tag:
@@ -193,7 +214,6 @@ def list_uploads(
             (page_size, offset),
         )
     items = [dict(r) for r in cur.fetchall()]
-    conn.close()
 
     return {
         "items": items,
@@ -1,28 +1,48 @@
 # backend/api/user_api.py
 from __future__ import annotations
+import asyncio
+import json
 import traceback
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import os
 
 # Lazy Import RAG
 RAGAsk = None
 rag_ask = None
+rag_ask_stream = None
 rag_import_error = None
 
 def _lazy_import_rag():
     """Import trễ để tránh crash khi FAISS/chunks chưa build."""
-    global RAGAsk, rag_ask, rag_import_error
+    global RAGAsk, rag_ask, rag_ask_stream, rag_import_error
     if RAGAsk and rag_ask:
         return
     try:
-        from backend.rag.service import Ask as _Ask, ask as _ask
+        from backend.rag.service import Ask as _Ask, ask as _ask, ask_stream as _ask_stream
         RAGAsk = _Ask
         rag_ask = _ask
+        rag_ask_stream = _ask_stream
         rag_import_error = None
     except Exception as e:
         rag_import_error = f"{e}\n{traceback.format_exc()}"
 
+async def _run_until_disconnect(request: Request, coro, poll_sec: float = 0.5):
+    """Chạy coro; nếu client ngắt kết nối giữa chừng thì huỷ luôn (kể cả lời gọi Gemini đang chờ)."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_sec)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
 # ========== Router ==========
 router = APIRouter(prefix="/api", tags=["chat"])
 
@@ -34,7 +54,7 @@ class ChatResponse(BaseModel):
     answer: str
 
 @router.post("/chat", response_model=ChatResponse)
-def api_chat(req: ChatRequest):
+async def api_chat(req: ChatRequest, request: Request):
     _lazy_import_rag()
     if rag_import_error:
         raise HTTPException(
@@ -47,24 +67,61 @@ def api_chat(req: ChatRequest):
         raise HTTPException(status_code=400, detail="message is empty")
 
     try:
-        res = rag_ask(RAGAsk(question=msg))
+        res = await _run_until_disconnect(request, rag_ask(RAGAsk(question=msg)))
         answer = (res.get("answer") or "").strip()
         if not answer:
             answer = "Mình không tìm thấy thông tin trong lịch tuần này."
         return ChatResponse(answer=answer)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, detail=f"internal_error: {e}")
 
+def _sse(data: dict, event: str | None = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def api_chat_stream(req: ChatRequest):
+    """
+    Server-Sent Events: mỗi đoạn trả lời là `data: {"delta": "..."}`,
+    kết thúc bằng `event: done` (hoặc `event: error`).
+    Client ngắt kết nối → Starlette huỷ generator → huỷ luôn lời gọi Gemini đang stream.
+    """
+    _lazy_import_rag()
+    if rag_import_error:
+        raise HTTPException(status_code=500, detail=f"RAG init failed: {rag_import_error}")
+
+    msg = (req.message or "").strip()
+    if not msg:
+        raise HTTPException(status_code=400, detail="message is empty")
+
+    async def events():
+        try:
+            async for piece in rag_ask_stream(RAGAsk(question=msg)):
+                yield _sse({"delta": piece})
+            yield _sse({}, event="done")
+        except Exception as e:
+            yield _sse({"detail": f"internal_error: {e}"}, event="error")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ====== Legacy /ask (optional) ======
 class AskIn(BaseModel):
     question: str
 
 @router.post("/ask")
-def api_ask_compat(req: AskIn):
+async def api_ask_compat(req: AskIn, request: Request):
     _lazy_import_rag()
     if rag_import_error:
         raise HTTPException(500, detail=f"RAG init failed: {rag_import_error}")
     try:
-        return rag_ask(RAGAsk(question=req.question))
+        return await _run_until_disconnect(request, rag_ask(RAGAsk(question=req.question)))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, detail=f"internal_error: {e}")
\ No newline at end of file
@@ -0,0 +1,88 @@
+# backend/bench/bench_ann.py — recall@k và độ trễ của các loại FAISS index so với Flat
+#
+#   STORE_DIR=rag_store python -m backend.bench.bench_ann --k 20 --queries 200
+#   STORE_DIR=rag_store python -m backend.bench.bench_ann --scale 50000   # nhân bản tập thật để xem khi lịch lớn dần
+#
+# Vector lấy thẳng từ emb_cache của store (không cần sentence-transformers).
+# Câu hỏi = vector chunk ngẫu nhiên + nhiễu nhỏ rồi chuẩn hoá; ground truth = top-k của Flat.
+# Các index dựng bằng đúng factory ingest dùng (ingest_lib._make_index), nên FAISS_* trong .env có hiệu lực.
+import argparse, os, sqlite3, time
+
+import faiss
+import numpy as np
+
+from backend.ingest.ingest_lib import INDEX_TYPES, _make_index
+
+def load_vectors(store_dir: str) -> np.ndarray:
+    conn = sqlite3.connect(os.path.join(store_dir, "chunks.sqlite"))
+    model = (conn.execute("SELECT v FROM meta WHERE k='emb_model'").fetchone() or [None])[0]
+    rows = conn.execute(
+        "SELECT e.vec FROM chunks c JOIN emb_cache e ON e.hash = c.hash AND e.model = ? ORDER BY c.id",
+        (model,)).fetchall()
+    conn.close()
+    if not rows:
+        raise SystemExit("emb_cache is empty for this store; run an ingest/rebuild first")
+    return np.stack([np.frombuffer(r[0], dtype="float32") for r in rows])
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype="float32")
+    faiss.normalize_L2(x)
+    return x
+
+def scale_up(base: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    if n <= len(base):
+        return base
+    picks = base[rng.integers(0, len(base), n - len(base))]
+    return np.vstack([base, _unit(picks + rng.normal(0, 0.05, picks.shape))])
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+def bench(xb: np.ndarray, xq: np.ndarray, k: int, types, nprobe: int, ef: int):
+    ids = np.arange(len(xb), dtype="int64")
+    truth = None
+    print(f"corpus={len(xb)} dim={xb.shape[1]} queries={len(xq)} k={k}")
+    print(f"  {'type':<9} {'build ms':>9} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for t in types:
+        t0 = time.perf_counter()
+        try:
+            index, resolved = _make_index(xb.shape[1], xb, ids, t)
+        except Exception as e:
+            print(f"  {t:<9} skipped: {e}")
+            continue
+        build_ms = (time.perf_counter() - t0) * 1000
+        if isinstance(index, faiss.IndexIVF):
+            index.nprobe = min(nprobe, index.nlist)
+        if hasattr(index, "id_map") and isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW):
+            faiss.downcast_index(index.index).hnsw.efSearch = ef
+        lat, found = [], []
+        for q in xq:
+            t0 = time.perf_counter()
+            _, I = index.search(q.reshape(1, -1), k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            found.append(I[0])
+        found = np.stack(found)
+        if truth is None:           # "flat" luôn chạy đầu tiên
+            truth = found
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+        label = t if resolved == t else f"{t}->{resolved}"
+        print(f"  {label:<9} {build_ms:9.1f} {recall:9.3f} {_pct(lat, 50):8.3f} {_pct(lat, 99):8.3f}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store-dir", default=os.getenv("STORE_DIR", "rag_store"))
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--scale", type=int, default=0, help="nhân bản (kèm nhiễu) tập thật tới N vector")
+    ap.add_argument("--types", default=",".join(INDEX_TYPES), help="danh sách loại index, flat luôn được thêm vào đầu")
+    ap.add_argument("--nprobe", type=int, default=16)
+    ap.add_argument("--ef-search", type=int, default=64)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    xb = scale_up(load_vectors(args.store_dir), args.scale, rng)
+    xq = _unit(xb[rng.integers(0, len(xb), args.queries)] + rng.normal(0, 0.02, (args.queries, xb.shape[1])))
+    types = ["flat"] + [t for t in args.types.split(",") if t and t != "flat"]
+    bench(xb, xq, min(args.k, len(xb)), types, args.nprobe, args.ef_search)
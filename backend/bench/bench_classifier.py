@@ -0,0 +1,123 @@
+# backend/bench/bench_classifier.py — chi phí phân loại/trích xuất mỗi câu hỏi: chuỗi regex cũ vs parse_query 1 lượt
+#
+#   python -m backend.bench.bench_classifier --repeat 2000 --rounds 5
+#   python -m backend.bench.bench_classifier --questions questions.jsonl   # mỗi dòng {"question": ...} hoặc văn bản thô
+#
+# Không cần store/model: chỉ đo phần tách câu hỏi trước khi vào calendar/RAG.
+# "legacy" chép lại đúng chuỗi kiểm tra cũ của service._route (parse_times, hôm nay/ngày mai,
+# classify_intent, rồi search lại ngày/thứ khi dispatch) để so sánh cùng một bộ câu hỏi.
+import argparse, json, re, time
+from typing import List, Optional
+
+from backend.rag.normalize import RE_DOW
+from backend.rag.query_parser import parse_query
+
+# regex của bộ phân loại cũ (trước parse_query), chỉ còn dùng để so sánh ở đây
+RE_DDMMYYYY = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b")
+RE_DDMM     = re.compile(r"\b(\d{1,2})[/-](\d{1,2})\b")
+RE_WEEK     = re.compile(r"\b(lịch\s+toàn\s+tuần|toàn\s+tuần)\b", re.IGNORECASE)
+RE_DEFINE   = re.compile(r"\b(là gì|là cái gì|what\s+is)\b", re.IGNORECASE)
+RE_TIME     = re.compile(r"\b(\d{1,2})(?:(?::|[hH])\s?(\d{2})?)\b")
+RE_CALENDAR_HINT = re.compile(
+    r"\b(lịch|họp|công tác|sự kiện|kế hoạch|khai giảng|xét tuyển|hội đồng|hôm nay|tuần này|ngày mai|thứ|ngày|giờ|địa điểm)\b",
+    re.IGNORECASE,
+)
+RE_SMALLTALK = re.compile(
+    r"\b(xin chào|chào|hello|hi|bạn là ai|giới thiệu|tên bạn|làm công việc gì|what do you do|help|giúp)\b",
+    re.IGNORECASE,
+)
+
+def parse_times(query: str) -> tuple[Optional[str], Optional[str]]:
+    matches: List[str] = []
+    for m in RE_TIME.finditer(query):
+        prev = query[max(0, m.start()-6):m.start()].lower()
+        if re.search(r"thứ\s*$", prev):  # tránh nhầm "Thứ 5" -> 05:00
+            continue
+        h, mm = m.group(1), m.group(2) or "00"
+        matches.append(f"{int(h):02d}:{int(mm):02d}")
+    if not matches: return (None, None)
+    if len(matches) == 1: return (matches[0], None)
+    matches.sort()
+    return (matches[0], matches[-1])
+
+QUESTIONS = [
+    "Thứ 5 có gì?", "lịch toàn tuần", "hôm nay là ngày mấy", "ngày mai thứ mấy", "21/08/2025 họp gì",
+    "18/08 lúc 14h", "cn có gì", "chủ nhật có gì", "từ 8h đến 10h có gì", "lịch họp lúc 14h",
+    "họp gì ở Hội trường", "EMBA ở đâu", "xin chào", "Lịch tuần là gì", "bạn là ai",
+    "Phòng họp số 1 nhà I có lịch gì", "BGH họp mấy lần trong tuần", "lễ khai giảng tổ chức khi nào",
+    "thứ 3 từ 13h30 đến 17h có họp gì", "Hội đồng xét tuyển họp vào thứ mấy",
+]
+
+def legacy(q: str):
+    t_from, t_to = parse_times(q)
+    ql = q.lower()
+    if ("hôm nay" in ql or "today" in ql) and any(k in ql for k in ["ngày", "date", "mấy", "bao nhiêu", "thứ"]):
+        return "TODAY", None, None, t_from
+    if ("ngày mai" in ql or "tomorrow" in ql) and any(k in ql for k in ["ngày", "date", "mấy", "thứ"]):
+        return "TOMORROW", None, None, t_from
+    qn = ql.strip()
+    if not qn:
+        intent = "GENERAL"
+    elif RE_SMALLTALK.search(qn):
+        intent = "SMALLTALK"
+    elif RE_DEFINE.search(qn):
+        intent = "DEFINE"
+    elif RE_DDMMYYYY.search(qn) or RE_DDMM.search(qn) or RE_DOW.search(qn):
+        intent = "SCHEDULE"
+    elif RE_WEEK.search(qn):
+        intent = "SCHEDULE_ALL"
+    elif RE_CALENDAR_HINT.search(qn):
+        intent = "SCHEDULE"
+    else:
+        intent = "GENERAL"
+    m, m2, mdow = RE_DDMMYYYY.search(q), RE_DDMM.search(q), RE_DOW.search(q)
+    date = f"{int(m.group(1)):02d}/{int(m.group(2)):02d}/{int(m.group(3)):04d}" if m else None
+    return intent, date, (mdow.group(0) if mdow else m2 and m2.group(0)), t_from
+
+def single_pass(q: str):
+    pq = parse_query(q)
+    intent = {0: "TODAY", 1: "TOMORROW"}.get(pq.relative_day, pq.intent)
+    return intent, pq.date, pq.dow_text, pq.t_from
+
+def load_questions(path: str):
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                obj = json.loads(line)
+                line = obj.get("question") or obj.get("q") or obj.get("title") or ""
+            if line:
+                out.append(line)
+    return out
+
+def _time(fn, qs, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in qs:
+            fn(q)
+    return (time.perf_counter() - t0) / (repeat * len(qs)) * 1e6
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", help="file JSONL/văn bản, mỗi dòng 1 câu hỏi (mặc định: bộ câu mẫu)")
+    ap.add_argument("--repeat", type=int, default=1000)
+    ap.add_argument("--rounds", type=int, default=5, help="số vòng xen kẽ legacy/single, lấy vòng nhanh nhất")
+    args = ap.parse_args()
+
+    qs = load_questions(args.questions) if args.questions else QUESTIONS
+    print(f"questions={len(qs)} repeat={args.repeat} rounds={args.rounds}")
+    fns = (("legacy", legacy), ("single", single_pass))
+    # chạy xen kẽ và lấy min như timeit: máy bận/đổi xung nhịp chỉ làm chậm đi, không làm nhanh lên
+    best = {name: float("inf") for name, _ in fns}
+    for _ in range(max(1, args.rounds)):
+        for name, fn in fns:
+            best[name] = min(best[name], _time(fn, qs, args.repeat))
+    for name, _ in fns:
+        print(f"  {name:<7} {best[name]:8.2f} µs/question")
+    diff = [q for q in qs if legacy(q)[0] != single_pass(q)[0]]
+    print(f"  intent differs on {len(diff)}/{len(qs)}")
+    for q in diff[:10]:
+        print(f"    {q!r}: legacy={legacy(q)[0]} single={single_pass(q)[0]}")
@@ -0,0 +1,62 @@
+# backend/bench/bench_embedding.py — cold start của câu hỏi đầu tiên + độ trễ câu hỏi lặp lại
+#
+#   STORE_DIR=rag_store python -m backend.bench.bench_embedding --runs 10
+#
+# Chạy trên store/model thật (cần sentence-transformers + rag_store đã ingest).
+#  - cold: mỗi lần 1 tiến trình mới, đo vector_search đầu tiên khi có / không có warm_up()
+#    (warm_up chạy trước khi bấm giờ, giống hook khởi động trong backend/main.py)
+#  - repeat: trong cùng tiến trình, encode lại từ đầu vs lấy từ LRU embed_query
+import argparse, json, statistics, subprocess, sys, time
+
+QUESTIONS = [
+    "Thứ 5 có gì?", "lịch toàn tuần", "hôm nay họp gì", "họp EMBA ở đâu",
+    "Phòng họp số 1 nhà I có lịch gì", "BGH họp mấy lần trong tuần", "lễ khai giảng tổ chức khi nào",
+]
+
+_CHILD = r"""
+import json, sys, time
+from backend.rag import service, io_store
+if sys.argv[1] == "warm":
+    service.warm_up()
+t0 = time.perf_counter()
+io_store.vector_search(sys.argv[2], k=20)
+print(json.dumps({"ms": (time.perf_counter() - t0) * 1000}))
+"""
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+def bench_cold(runs: int):
+    print(f"cold start: first vector_search in a fresh process (runs={runs})")
+    for mode in ("cold", "warm"):
+        times = []
+        for i in range(runs):
+            out = subprocess.run([sys.executable, "-c", _CHILD, mode, QUESTIONS[i % len(QUESTIONS)]],
+                                 capture_output=True, text=True, check=True)
+            times.append(json.loads(out.stdout.strip().splitlines()[-1])["ms"])
+        print(f"  {mode:<5} p50={_pct(times, 50):9.1f} ms  p99={_pct(times, 99):9.1f} ms")
+
+def bench_repeat(repeat: int):
+    from backend.rag import io_store
+    io_store.warm_up()
+    print(f"repeat query: embed_query latency (repeat={repeat})")
+    uncached, cached = [], []
+    for _ in range(repeat):
+        for q in QUESTIONS:
+            io_store._query_emb_cache.clear()
+            t0 = time.perf_counter(); io_store.embed_query(q); uncached.append(time.perf_counter() - t0)
+            t0 = time.perf_counter(); io_store.embed_query(q); cached.append(time.perf_counter() - t0)
+    for name, xs in (("encode", uncached), ("lru", cached)):
+        xs = [x * 1000 for x in xs]
+        print(f"  {name:<6} p50={statistics.median(xs):8.3f} ms  p99={_pct(xs, 99):8.3f} ms")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5, help="số tiến trình mới cho mỗi chế độ cold/warm")
+    ap.add_argument("--repeat", type=int, default=20, help="số vòng lặp bộ câu hỏi khi đo cache")
+    ap.add_argument("--skip-cold", action="store_true")
+    args = ap.parse_args()
+    if not args.skip_cold:
+        bench_cold(args.runs)
+    bench_repeat(args.repeat)
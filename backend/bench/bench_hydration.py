@@ -0,0 +1,74 @@
+# backend/bench/bench_hydration.py — đo độ trễ hydrate hit FAISS (từng dòng vs 1 truy vấn IN)
+#
+#   python -m backend.bench.bench_hydration --rows 5000 --repeat 2000
+#
+# Tạo store giả trong thư mục tạm nên không cần model/FAISS thật.
+import argparse, os, random, sqlite3, tempfile, time
+
+import faiss
+
+_TMP = tempfile.mkdtemp(prefix="bench_hydration_")
+os.environ["STORE_DIR"] = _TMP
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+def _make_store(n_rows: int) -> str:
+    sqlite_path = os.path.join(_TMP, "chunks.sqlite")
+    conn = sqlite3.connect(sqlite_path)
+    conn.execute("""CREATE TABLE chunks(
+        id INTEGER PRIMARY KEY, text TEXT, date TEXT, dow TEXT, start TEXT, end TEXT,
+        location TEXT, participants TEXT, title TEXT, raw TEXT, hash TEXT)""")
+    conn.execute("CREATE TABLE meta(k TEXT PRIMARY KEY, v TEXT)")
+    rows = []
+    for i in range(n_rows):
+        d = 1 + i % 28
+        rows.append((i, f"title: Sự kiện {i}\nraw: nội dung {i} " + "x" * 200,
+                     f"{d:02d}/08/2025", "Thứ 2", f"{8 + i % 9:02d}:00", None,
+                     "Phòng họp số 1", "BGH", f"Sự kiện {i}", f"nội dung {i}", f"h{i}"))
+    conn.executemany("INSERT INTO chunks VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+    conn.commit(); conn.close()
+    faiss.write_index(faiss.IndexFlatIP(8), os.path.join(_TMP, "index.faiss"))
+    return sqlite_path
+
+def _legacy_hydrate(cur, ids, scores):
+    rows = []
+    for idx, score in zip(ids, scores):
+        cur.execute("""SELECT id,text,date,dow,start,end,location,participants,title,raw
+                       FROM chunks WHERE id=?""", (int(idx),))
+        r = cur.fetchone()
+        if r:
+            rows.append({"id": r[0], "text": r[1], "date": r[2], "dow": r[3], "start": r[4],
+                         "end": r[5], "location": r[6], "participants": r[7], "title": r[8],
+                         "raw": r[9], "score": float(score)})
+    return rows
+
+def _bench(fn, cur, queries) -> float:
+    t0 = time.perf_counter()
+    for ids, scores in queries:
+        fn(cur, ids, scores)
+    return (time.perf_counter() - t0) / len(queries) * 1e6
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5000, help="số dòng trong chunks giả lập")
+    ap.add_argument("--repeat", type=int, default=2000, help="số truy vấn cho mỗi k")
+    ap.add_argument("--ks", default="10,20,100")
+    args = ap.parse_args()
+
+    sqlite_path = _make_store(args.rows)
+    from backend.rag.io_store import _hydrate
+
+    conn = sqlite3.connect(sqlite_path); cur = conn.cursor()
+    rnd = random.Random(0)
+    print(f"rows={args.rows} repeat={args.repeat}")
+    print(f"{'k':>5} {'legacy(us)':>12} {'bulk(us)':>10} {'speedup':>8}")
+    for k in (int(x) for x in args.ks.split(",")):
+        queries = []
+        for _ in range(args.repeat):
+            ids = rnd.sample(range(args.rows), min(k, args.rows))
+            queries.append((ids, sorted((rnd.random() for _ in ids), reverse=True)))
+        # cùng thứ hạng + score
+        assert _legacy_hydrate(cur, *queries[0]) == _hydrate(cur, *queries[0])
+        legacy = _bench(_legacy_hydrate, cur, queries)
+        bulk = _bench(_hydrate, cur, queries)
+        print(f"{k:>5} {legacy:>12.1f} {bulk:>10.1f} {legacy / bulk:>7.2f}x")
+    conn.close()
@@ -0,0 +1,174 @@
+# backend/ingest/bulk_import.py — nạp hàng loạt file lịch tuần (.docx) từ 1 thư mục hoặc 1 file .zip
+#
+#   python -m backend.ingest.bulk_import --src data/lich_2024_2025/ --store-dir rag_store --workers 4
+#   python -m backend.ingest.bulk_import --src lich_2025.zip --store-dir rag_store --mode replace
+#
+# Các file được parse song song trong process pool (mỗi file chỉ mở Document 1 lần, năm tự dò trong
+# parser nếu không truyền --year). Events chảy theo thứ tự file qua generator vào
+# ingest_lib.append_event_stream → encode + ghi theo lô, index được công bố 1 lần ở cuối.
+# CLI không ghi store trực tiếp: enqueue job "bulk" rồi chạy qua worker (run_job), nên không bao giờ
+# ghi song song với worker ingest đang chạy.
+from __future__ import annotations
+
+import argparse, io, json, logging, multiprocessing, os, time, zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from backend.ingest import job_queue
+from backend.rag.parser import parse_docx_as_table
+from backend.rag.settings import INGEST_BATCH_SIZE, INGEST_WORKERS, LOCAL_EMB_MODEL, STORE_DIR
+
+log = logging.getLogger(__name__)
+
+Source = Tuple[str, Union[str, bytes]]   # (tên hiển thị, đường dẫn file | nội dung file trong zip)
+
+
+def _is_docx(name: str) -> bool:
+    base = os.path.basename(name)
+    # bỏ file khoá "~$..." của Word và rác "__MACOSX/" trong zip tạo trên macOS
+    return base.lower().endswith(".docx") and not base.startswith(("~$", "._")) and "__MACOSX" not in name
+
+
+def _dir_sources(p: Path) -> Iterator[Source]:
+    for f in sorted(p.rglob("*.docx")):
+        if _is_docx(f.as_posix()):
+            yield f.relative_to(p).as_posix(), f.as_posix()
+
+
+def _zip_sources(p: Path) -> Iterator[Source]:
+    with zipfile.ZipFile(p) as zf:
+        for name in sorted(n for n in zf.namelist() if _is_docx(n)):
+            yield name, zf.read(name)
+
+
+def iter_sources(src: str) -> Iterator[Source]:
+    """
+    Các .docx trong thư mục (đệ quy) hoặc trong file zip, sắp theo tên; zip được đọc dần từng file.
+    src sai thì ValueError ngay (trước khi mở store / nạp model).
+    """
+    p = Path(src)
+    if p.is_dir():
+        return _dir_sources(p)
+    if p.is_file() and zipfile.is_zipfile(p):
+        return _zip_sources(p)
+    if p.is_file() and _is_docx(p.name):
+        return iter([(p.name, p.as_posix())])
+    raise ValueError(f"src must be a directory, a .zip or a .docx: {src!r}")
+
+
+def _parse_one(name: str, src: Union[str, bytes], year: Optional[int]) -> Tuple[Dict, List[Dict]]:
+    """Chạy trong process con: parse 1 file, trả (thống kê, events). Lỗi 1 file không dừng cả lượt nạp."""
+    t0 = time.perf_counter()
+    try:
+        events = parse_docx_as_table(io.BytesIO(src) if isinstance(src, bytes) else src, year)
+        err = None
+    except Exception as e:
+        events, err = [], f"{type(e).__name__}: {e}"
+    return {"file": name, "events": len(events), "parse_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "error": err}, events
+
+
+def parse_stream(sources: Iterator[Source], workers: int = INGEST_WORKERS, year: Optional[int] = None,
+                 file_stats: Optional[List[Dict]] = None) -> Iterator[Dict]:
+    """
+    Generator events của mọi file, giữ thứ tự file. Tối đa 2*workers file đang parse/chờ cùng lúc
+    nên zip lớn không bị nạp hết vào bộ nhớ. Thống kê từng file được append vào file_stats.
+    """
+    def _done(st: Dict) -> None:
+        if file_stats is not None:
+            file_stats.append(st)
+        if st["error"]:
+            log.warning("bulk import: %s failed: %s", st["file"], st["error"])
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for name, src in sources:
+            st, events = _parse_one(name, src, year)
+            _done(st)
+            yield from events
+        return
+
+    # spawn, không fork: worker nhúng trong API (start_embedded) gọi hàm này từ 1 thread của uvicorn,
+    # fork lúc đó có thể sao chép khoá đang bị thread khác giữ (logging, sqlite, model) → process con treo
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+        pending: deque = deque()
+        it = iter(sources)
+
+        def _fill():
+            for name, src in it:
+                pending.append(ex.submit(_parse_one, name, src, year))
+                if len(pending) >= 2 * workers:
+                    return
+
+        _fill()
+        while pending:
+            st, events = pending.popleft().result()
+            _fill()
+            _done(st)
+            yield from events
+
+
+def with_rates(file_stats: List[Dict]) -> List[Dict]:
+    """Thêm events_per_s (thông lượng parse) vào thống kê từng file."""
+    for st in file_stats:
+        st["events_per_s"] = round(st["events"] / st["parse_ms"] * 1000, 1) if st["parse_ms"] else None
+    return file_stats
+
+
+def bulk_import(src: str, store_dir: str = STORE_DIR, workers: int = INGEST_WORKERS,
+                year: Optional[int] = None, mode: str = "append", tag: Optional[str] = None,
+                dedupe: bool = True, batch_size: int = INGEST_BATCH_SIZE,
+                local_emb: str = LOCAL_EMB_MODEL) -> Dict:
+    """
+    Parse + nạp mọi .docx trong src vào store qua hàng đợi ingest (job "bulk", chạy bằng worker.run_job).
+    mode: append | replace (thay các ngày có trong file). Trả kết quả của job: append_event_stream kèm
+    "files" (events, parse_ms, events_per_s từng file), files_failed và tổng thời gian.
+    """
+    from backend.ingest.worker import run_job   # worker import module này
+
+    if mode not in ("append", "replace"):
+        raise ValueError("mode must be 'append' or 'replace'")
+    iter_sources(src)                           # src sai → ValueError trước khi xếp hàng
+    upload_id, job_id = job_queue.enqueue(
+        os.path.join(store_dir, "chunks.sqlite"), "bulk", mode, Path(src).resolve().as_posix(), tag=tag,
+        dedupe=dedupe, year=year, filename=Path(src).name,
+        params={"workers": workers, "batch_size": batch_size, "local_emb": local_emb})
+    return run_job(store_dir, upload_id, job_id)
+
+
+def _print_report(res: Dict) -> None:
+    print(f"{'file':<48} {'events':>7} {'parse_ms':>9} {'ev/s':>8}")
+    for st in res["files"]:
+        rate = "-" if st["events_per_s"] is None else f"{st['events_per_s']:.0f}"
+        line = f"{st['file'][-48:]:<48} {st['events']:>7} {st['parse_ms']:>9.1f} {rate:>8}"
+        print(line + (f"  ERROR {st['error']}" if st["error"] else ""))
+    print(f"files={len(res['files'])} failed={res['files_failed']} events={res['seen']} "
+          f"added={res['added']} removed={res['removed']} skipped={res['skipped']} batches={res['batches']}")
+    print(f"encode_ms={res['encode_ms']} write_ms={res['write_ms']} elapsed_s={res['elapsed_s']} "
+          f"events_per_s={res['events_per_s']} total_after={res['total_after']}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", required=True, help="thư mục chứa .docx (đệ quy) hoặc file .zip")
+    ap.add_argument("--store-dir", default=STORE_DIR, help="directory for FAISS/SQLite")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS, help="số tiến trình parse (0 = số CPU)")
+    ap.add_argument("--year", type=int, default=None, help="năm mặc định; bỏ trống thì dò trong từng file")
+    ap.add_argument("--mode", choices=("append", "replace"), default="append")
+    ap.add_argument("--tag", default=None)
+    ap.add_argument("--no-dedupe", action="store_true", help="disable duplicate checking by hash")
+    ap.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="số event mỗi lô encode + ghi")
+    ap.add_argument("--local-emb", default=LOCAL_EMB_MODEL)
+    ap.add_argument("--json", action="store_true", help="in kết quả dạng JSON thay vì bảng")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = bulk_import(args.src, args.store_dir, workers=args.workers, year=args.year, mode=args.mode,
+                         tag=args.tag, dedupe=not args.no_dedupe, batch_size=args.batch_size,
+                         local_emb=args.local_emb)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        _print_report(result)
@@ -1,14 +1,31 @@
 # rag/ingest_lib.py
 from __future__ import annotations
 
+import logging
+import math
 import os
+import re
 import hashlib
 import sqlite3
-from typing import List, Dict, Tuple
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Tuple
 
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+
+from backend.rag.db import write_conn
+from backend.rag.models import get_embedder, embedding_dim
+from backend.rag.normalize import dow_key, event_norm, iso_date, time_minutes
+from backend.rag.settings import (
+    LOCAL_EMB_MODEL, FAISS_INDEX_TYPE, FAISS_ANN_THRESHOLD, FAISS_IVF_NLIST, FAISS_PQ_M, FAISS_HNSW_M,
+    INGEST_BATCH_SIZE, INGEST_EMBED_BATCH,
+)
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+log = logging.getLogger(__name__)
 
 # thêm ở đầu file (tiện ích nhỏ)
 def _backfill_hashes(conn: sqlite3.Connection):
@@ -24,54 +41,240 @@ def _backfill_hashes(conn: sqlite3.Connection):
     conn.commit()
     return len(rows)
 
-def _rebuild_faiss_from_sqlite(conn: sqlite3.Connection, faiss_path: str,
-                               model: SentenceTransformer) -> int:
-    """Khi lệch rows vs ntotal, build lại FAISS theo SQLite để đồng bộ."""
+def _backfill_norm(conn: sqlite3.Connection) -> int:
+    """Tính cột norm/dow_key cho các dòng cũ còn NULL."""
+    cur = conn.cursor()
+    cur.execute("SELECT id, title, participants, location, raw, dow FROM chunks WHERE norm IS NULL")
+    rows = cur.fetchall()
+    cur.executemany("UPDATE chunks SET norm=?, dow_key=? WHERE id=?", [
+        (event_norm({"title": t, "participants": p, "location": l, "raw": r}), dow_key(d or ""), rid)
+        for rid, t, p, l, r, d in rows
+    ])
+    return len(rows)
+
+def _backfill_dates(conn: sqlite3.Connection) -> int:
+    """Tính date_iso/start_min/end_min cho các dòng cũ còn NULL (ngày sai định dạng thì vẫn NULL)."""
+    cur = conn.cursor()
+    cur.execute("SELECT id, date, start, end FROM chunks WHERE date_iso IS NULL AND date IS NOT NULL")
+    rows = [(iso_date(d), time_minutes(s), time_minutes(e), rid) for rid, d, s, e in cur.fetchall()]
+    rows = [r for r in rows if r[0] is not None]
+    cur.executemany("UPDATE chunks SET date_iso=?, start_min=?, end_min=? WHERE id=?", rows)
+    return len(rows)
+
+def _derived_cols(ev: Dict) -> Tuple:
+    """Các cột tính sẵn từ event: (norm, dow_key, date_iso, start_min, end_min)."""
+    return (event_norm(ev), dow_key(ev.get("dow") or ""), iso_date(ev.get("date")),
+            time_minutes(ev.get("start")), time_minutes(ev.get("end")))
+
+def _encode_cached(conn: sqlite3.Connection, model: SentenceTransformer, model_name: str,
+                   hashes: List[str], texts: List[str], commit: bool = True) -> np.ndarray:
+    """
+    Embedding (float32, đã chuẩn hoá) theo thứ tự hashes; lấy từ bảng emb_cache theo (model, hash),
+    chỉ chạy encoder cho đoạn text chưa từng gặp rồi lưu lại cho lần rebuild/self-heal sau.
+    commit=False khi đang giữa transaction chờ _publish.
+    """
+    found: Dict[str, np.ndarray] = {}
+    uniq = list(dict.fromkeys(hashes))
+    cur = conn.cursor()
+    for i in range(0, len(uniq), 500):
+        part = uniq[i:i + 500]
+        cur.execute(f"SELECT hash, vec FROM emb_cache WHERE model=? AND hash IN ({','.join('?' * len(part))})",
+                    [model_name, *part])
+        for h, blob in cur.fetchall():
+            found[h] = np.frombuffer(blob, dtype="float32")
+
+    text_of = dict(zip(hashes, texts))
+    missing = [h for h in uniq if h not in found]
+    if missing:
+        embs = np.asarray(model.encode([text_of[h] for h in missing], batch_size=INGEST_EMBED_BATCH,
+                                       normalize_embeddings=True), dtype="float32")
+        cur.executemany("INSERT OR REPLACE INTO emb_cache(model, hash, dim, vec) VALUES (?,?,?,?)",
+                        [(model_name, h, int(v.shape[0]), v.tobytes()) for h, v in zip(missing, embs)])
+        if commit:
+            conn.commit()
+        found.update(zip(missing, embs))
+    if not hashes:
+        return np.zeros((0, embedding_dim(model)), dtype="float32")
+    return np.stack([found[h] for h in hashes]).astype("float32", copy=False)
+
+def _new_index(dim: int) -> faiss.Index:
+    """Index FAISS mang id 64-bit tường minh = chunks.id (xoá/thay từng dòng không cần đánh số lại)."""
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+# ====== LOẠI INDEX (FAISS_INDEX_TYPE) =========================================
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+_IVF_MIN_TRAIN = 256    # PQ 8 bit cần >= 256 điểm train; ít hơn thì IVF cũng không đáng
+
+
+def _resolve_index_type(n: int, index_type: str | None = None) -> str:
+    t = (index_type or FAISS_INDEX_TYPE or "auto").lower()
+    if t == "auto":
+        t = "flat" if n < FAISS_ANN_THRESHOLD else "ivf_flat"
+    if t not in INDEX_TYPES:
+        raise ValueError(f"FAISS_INDEX_TYPE must be auto or one of {INDEX_TYPES}, got {t!r}")
+    if t.startswith("ivf") and n < _IVF_MIN_TRAIN:
+        log.warning("only %s vectors, too few to train %s; using flat", n, t)
+        t = "flat"
+    return t
+
+
+def _ivf_nlist(n: int) -> int:
+    return FAISS_IVF_NLIST or max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    # số sub-quantizer phải chia hết dim; mặc định ~dim/4 (mỗi sub-vector 4 chiều)
+    return FAISS_PQ_M or max(m for m in range(1, dim // 4 + 1) if dim % m == 0)
+
+
+def _make_index(dim: int, embs: np.ndarray, ids: np.ndarray,
+                index_type: str | None = None) -> Tuple[faiss.Index, str]:
+    """
+    Dựng index loại đã chọn (train IVF trên chính embs) và add với id tường minh.
+    flat/hnsw bọc IndexIDMap2; IVF tự mang id trong inverted list nên add_with_ids trực tiếp.
+    """
+    t = _resolve_index_type(len(ids), index_type)
+    if t == "flat":
+        index = _new_index(dim)
+    elif t == "hnsw":
+        index = faiss.IndexIDMap2(faiss.IndexHNSWFlat(dim, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT))
+    else:
+        quantizer = faiss.IndexFlatIP(dim)
+        nlist = _ivf_nlist(len(ids))
+        if t == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8, faiss.METRIC_INNER_PRODUCT)
+        index.train(embs)
+    if len(ids):
+        index.add_with_ids(embs, ids)
+    return index, t
+
+
+def _supports_remove(index: faiss.Index) -> bool:
+    """HNSW không xoá được vector → sau khi gỡ dòng phải dựng lại index từ SQLite (emb_cache)."""
+    inner = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+    return not isinstance(inner, faiss.IndexHNSW)
+
+
+def _index_ids(index: faiss.Index) -> np.ndarray | None:
+    """Các id trong index; None nếu là index cũ kiểu vị trí (id = vị trí 0..n-1)."""
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map).astype("int64", copy=False)
+    if isinstance(index, faiss.IndexIVF):
+        inv = index.invlists
+        parts = [faiss.rev_swig_ptr(inv.get_ids(l), inv.list_size(l)).copy()
+                 for l in range(index.nlist) if inv.list_size(l)]
+        return np.concatenate(parts).astype("int64") if parts else np.zeros(0, dtype="int64")
+    return None
+
+
+def _chunk_ids(conn: sqlite3.Connection) -> np.ndarray:
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM chunks ORDER BY id")
+    return np.fromiter((r[0] for r in cur), dtype="int64")
+
+
+def _load_index(conn: sqlite3.Connection, faiss_path: str) -> faiss.Index | None:
+    """
+    Đọc index từ đĩa. Index cũ kiểu vị trí được bọc sang IndexIDMap2 (id = vị trí, lấy lại vector
+    bằng reconstruct, không encode lại) nếu bất biến id 0..n-1 còn đúng; ngược lại trả None để rebuild.
+    """
+    path = _current_index_path(conn, faiss_path)
+    if not os.path.exists(path):
+        return None
+    index = faiss.read_index(path)
+    if _index_ids(index) is not None:
+        return index
+    n = index.ntotal
+    if not np.array_equal(_chunk_ids(conn), np.arange(n, dtype="int64")):
+        return None
+    wrapped = _new_index(index.d)
+    if n:
+        wrapped.add_with_ids(index.reconstruct_n(0, n), np.arange(n, dtype="int64"))
+    return wrapped
+
+
+def _index_from_sqlite(conn: sqlite3.Connection, model: SentenceTransformer, model_name: str,
+                       index_type: str | None = None) -> faiss.Index:
+    """
+    Dựng index theo đúng các dòng chunks thấy trên conn (kể cả thay đổi chưa commit), id giữ nguyên,
+    vector lấy từ emb_cache nếu có. Ghi meta index_type nhưng không commit — để _publish công bố.
+    """
     cur = conn.cursor()
     cur.execute("SELECT id, text FROM chunks ORDER BY id ASC")
     rows = cur.fetchall()
-    if not rows:
-        index = faiss.IndexFlatIP(model.get_sentence_embedding_dimension())
-        faiss.write_index(index, faiss_path)
+    ids, texts = zip(*rows) if rows else ((), ())
+    embs = _encode_cached(conn, model, model_name, [_sha1(t or "") for t in texts], list(texts), commit=False)
+    index, t = _make_index(embedding_dim(model), embs, np.asarray(ids, dtype="int64"), index_type)
+    _set_meta(conn, "index_type", t, commit=False)
+    return index
+
+
+def _rebuild_faiss_from_sqlite(conn: sqlite3.Connection, faiss_path: str,
+                               model: SentenceTransformer, model_name: str) -> faiss.Index:
+    """Đường phục hồi: build lại FAISS theo đúng các dòng SQLite rồi công bố như một generation mới."""
+    index = _index_from_sqlite(conn, model, model_name)
+    _publish(conn, faiss_path, index)
+    return index
+
+
+def _open_index(conn: sqlite3.Connection, faiss_path: str, model_name: str,
+                force_rebuild: bool = False) -> faiss.Index:
+    """
+    Index khớp đúng tập chunks.id trong SQLite. Lệch (thiếu file, index cũ đã bị đánh số lộn xộn,
+    tập id khác nhau) thì tự-heal bằng 1 lần rebuild; model chỉ được nạp khi thật sự phải rebuild.
+    """
+    index = None if force_rebuild else _load_index(conn, faiss_path)
+    chunk_ids = _chunk_ids(conn)
+    if index is None or not np.array_equal(np.sort(_index_ids(index)), chunk_ids):
+        if not len(chunk_ids):
+            # store trống: index rỗng trong bộ nhớ; lượt ingest này tự _publish, khỏi công bố 1 generation rỗng
+            return _new_index(embedding_dim(get_embedder(model_name)))
+        log.warning("FAISS index in %s missing or out of sync with SQLite; rebuilding", os.path.dirname(faiss_path))
+        index = _rebuild_faiss_from_sqlite(conn, faiss_path, get_embedder(model_name), model_name)
+    return index
+
+
+def _select_ids(conn: sqlite3.Connection, date_from: str | None = None, date_to: str | None = None,
+                tag: str | None = None, hashes: List[str] | None = None,
+                dates: List[str] | None = None) -> List[int]:
+    """id các dòng khớp MỌI điều kiện đã cho (ngày 'dd/mm/yyyy', so theo cột date_iso có index)."""
+    where, params = [], []
+    if date_from:
+        where.append("date_iso >= ?"); params.append(_to_iso(date_from))
+    if date_to:
+        where.append("date_iso <= ?"); params.append(_to_iso(date_to))
+    if tag:
+        where.append("tag = ?"); params.append(tag)
+    if hashes:
+        where.append(f"hash IN ({','.join('?' * len(hashes))})"); params.extend(hashes)
+    if dates:
+        where.append(f"date IN ({','.join('?' * len(dates))})"); params.extend(dates)
+    if not where:
+        raise ValueError("need at least one of date_from/date_to/tag/hashes")
+    cur = conn.cursor()
+    cur.execute(f"SELECT id FROM chunks WHERE {' AND '.join(where)} ORDER BY id", params)
+    return [r[0] for r in cur.fetchall()]
+
+
+def _remove_ids(conn: sqlite3.Connection, index: faiss.Index, ids: List[int]) -> int:
+    """
+    Gỡ các id khỏi FAISS (trong bộ nhớ) và SQLite (chưa commit) — công bố bằng _publish.
+    Index không hỗ trợ xoá (HNSW) chỉ gỡ phía SQLite; người gọi dựng lại index (_index_from_sqlite).
+    """
+    if not ids:
         return 0
-    ids, texts = zip(*rows)
-    # đảm bảo id = 0..n-1 liên tục; nếu không, reindex
-    need_reindex = any(i != idx for idx, i in enumerate(ids))
-    if need_reindex:
-        # tạo bảng tạm và ghi lại id liên tục
-        cur.execute("BEGIN")
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS chunks_new(
-              id INTEGER PRIMARY KEY,
-              text TEXT,
-              date TEXT, dow TEXT, start TEXT, end TEXT,
-              location TEXT, participants TEXT, title TEXT, raw TEXT,
-              hash TEXT
-            )
-        """)
-        cur.execute("INSERT INTO chunks_new(id,text,date,dow,start,end,location,participants,title,raw,hash) "
-                    "SELECT ROW_NUMBER() OVER (ORDER BY id)-1, text,date,dow,start,end,location,participants,title,raw,hash FROM chunks")
-        # SQLite không có WINDOW ROW_NUMBER() cũ; fallback thủ công:
-        cur.execute("DELETE FROM chunks_new")  # xoá nếu dòng trên không chạy trên SQLite cũ
-        cur.execute("SELECT text,date,dow,start,end,location,participants,title,raw,hash FROM chunks ORDER BY id")
-        data = cur.fetchall()
-        cur.execute("DELETE FROM chunks")
-        for i, row in enumerate(data):
-            cur.execute("""INSERT OR REPLACE INTO chunks(
-                id,text,date,dow,start,end,location,participants,title,raw,hash
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?)""", (i,)+row)
-        conn.commit()
-        # load lại texts sau reindex
-        cur.execute("SELECT id, text FROM chunks ORDER BY id ASC")
-        rows = cur.fetchall()
-        ids, texts = zip(*rows)
-
-    embs = model.encode(list(texts), normalize_embeddings=True)
-    embs = np.asarray(embs, dtype="float32")
-    index = faiss.IndexFlatIP(embs.shape[1])
-    index.add(embs)
-    faiss.write_index(index, faiss_path)
-    return index.ntotal
+    removed = len(ids)
+    if _supports_remove(index):
+        removed = index.remove_ids(np.asarray(ids, dtype="int64"))
+    cur = conn.cursor()
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        cur.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(part))})", part)
+    return int(removed)
 
 # ====== ĐƯỜNG DẪN / SCHEMA ====================================================
 
@@ -109,15 +312,96 @@ def _ensure_schema(conn: sqlite3.Connection) -> None:
     if "hash" not in cols:
         cur.execute("ALTER TABLE chunks ADD COLUMN hash TEXT")
         # có thể điền dần hash về sau; UNIQUE sẽ tạo trên cột hash để dedupe nhanh
+    # nhãn upload để xoá/thay theo đợt nhập (DB cũ: NULL)
+    if "tag" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN tag TEXT")
+    if "upload_id" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN upload_id INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_tag ON chunks(tag)")
+    # dạng chuẩn hoá tính sẵn lúc ingest (rag/normalize.py): so khớp từ khoá / thứ khỏi xử lý lại mỗi request
+    if "norm" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN norm TEXT")
+    if "dow_key" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN dow_key TEXT")
+    _backfill_norm(conn)
+    # ngày ISO + phút bắt đầu/kết thúc: lọc khoảng ngày / sắp theo giờ bằng index thay vì parse chuỗi
+    if "date_iso" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN date_iso TEXT")
+    if "start_min" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN start_min INTEGER")
+    if "end_min" not in cols:
+        cur.execute("ALTER TABLE chunks ADD COLUMN end_min INTEGER")
+    _backfill_dates(conn)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_date_start ON chunks(date_iso, start_min)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_dow ON chunks(dow_key, date_iso)")
     # đảm bảo chỉ mục unique cho hash (nếu chưa có)
     cur.execute("""
     CREATE UNIQUE INDEX IF NOT EXISTS idx_chunks_hash_unique
       ON chunks(hash);
     """)
 
+    # embedding đã tính theo (model, hash nội dung) → rebuild chỉ encode đoạn mới
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS emb_cache(
+      model TEXT NOT NULL,
+      hash  TEXT NOT NULL,
+      dim   INTEGER,
+      vec   BLOB,
+      PRIMARY KEY(model, hash)
+    );
+    """)
+
+    _ensure_fts(conn)
     conn.commit()
 
 
+_FTS_COLS = "title, participants, location, raw"
+
+
+def _ensure_fts(conn: sqlite3.Connection) -> None:
+    """
+    Bảng FTS5 (BM25) trên title/participants/location/raw, external content = chunks;
+    trigger giữ đồng bộ với mọi INSERT/UPDATE/DELETE trên chunks. SQLite không có FTS5 thì bỏ qua
+    (io_store.lexical_search khi đó trả rỗng, chỉ còn tìm vector).
+    """
+    cur = conn.cursor()
+    existed = cur.execute("SELECT 1 FROM sqlite_master WHERE name='chunks_fts'").fetchone()
+    try:
+        cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+          {_FTS_COLS},
+          content='chunks', content_rowid='id',
+          tokenize='unicode61 remove_diacritics 2'
+        );
+        """)
+    except sqlite3.OperationalError as e:
+        log.warning("FTS5 unavailable, lexical search disabled: %s", e)
+        return
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_ai AFTER INSERT ON chunks BEGIN
+      INSERT INTO chunks_fts(rowid, {_FTS_COLS})
+        VALUES (new.id, new.title, new.participants, new.location, new.raw);
+    END;
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_ad AFTER DELETE ON chunks BEGIN
+      INSERT INTO chunks_fts(chunks_fts, rowid, {_FTS_COLS})
+        VALUES ('delete', old.id, old.title, old.participants, old.location, old.raw);
+    END;
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS chunks_fts_au AFTER UPDATE ON chunks BEGIN
+      INSERT INTO chunks_fts(chunks_fts, rowid, {_FTS_COLS})
+        VALUES ('delete', old.id, old.title, old.participants, old.location, old.raw);
+      INSERT INTO chunks_fts(rowid, {_FTS_COLS})
+        VALUES (new.id, new.title, new.participants, new.location, new.raw);
+    END;
+    """)
+    if not existed:
+        # DB cũ: nạp toàn bộ chunks hiện có vào FTS 1 lần
+        cur.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+
+
 def _get_meta(conn: sqlite3.Connection, key: str) -> str | None:
     cur = conn.cursor()
     cur.execute("SELECT v FROM meta WHERE k=?", (key,))
@@ -125,14 +409,67 @@ def _get_meta(conn: sqlite3.Connection, key: str) -> str | None:
     return row[0] if row else None
 
 
-def _set_meta(conn: sqlite3.Connection, key: str, val: str) -> None:
+def _set_meta(conn: sqlite3.Connection, key: str, val: str, commit: bool = True) -> None:
     cur = conn.cursor()
     cur.execute("""
         INSERT INTO meta(k, v) VALUES(?, ?)
         ON CONFLICT(k) DO UPDATE SET v=excluded.v
     """, (key, val))
+    if commit:
+        conn.commit()
+
+
+def _next_generation(conn: sqlite3.Connection) -> int:
+    """Generation kế tiếp; _publish ghi nó vào meta để các worker phục vụ nạp lại FAISS/cache."""
+    try:
+        return int(_get_meta(conn, "generation") or 0) + 1
+    except ValueError:
+        return 1
+
+
+_RE_INDEX_FILE = re.compile(r"^index\.(\d+)\.faiss(\.tmp)?$")
+
+
+def _current_index_path(conn: sqlite3.Connection, faiss_path: str) -> str:
+    """File index đang được công bố (meta.faiss_file); store cũ chưa có manifest thì dùng index.faiss."""
+    name = _get_meta(conn, "faiss_file")
+    if name:
+        path = os.path.join(os.path.dirname(faiss_path), name)
+        if os.path.exists(path):
+            return path
+    return faiss_path
+
+
+def _publish(conn: sqlite3.Connection, faiss_path: str, index: faiss.Index) -> int:
+    """
+    Công bố 2 pha:
+      1) ghi index.<gen>.faiss (file .tmp rồi os.replace) — chưa ai tham chiếu tới file này
+      2) commit MỘT transaction SQLite gồm các thay đổi chunks đang chờ + meta generation
+         + meta faiss_file trỏ sang file mới
+    Crash trước (2) chỉ để lại file mồ côi, reader vẫn thấy cặp (rows, index) cũ nhất quán.
+    Người gọi không được commit giữa lúc sửa chunks và lúc gọi hàm này.
+    """
+    store_dir = os.path.dirname(faiss_path)
+    gen = _next_generation(conn)
+    prev = _get_meta(conn, "faiss_file")
+    name = f"index.{gen}.faiss"
+    path = os.path.join(store_dir, name)
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+    _set_meta(conn, "generation", str(gen), commit=False)
+    _set_meta(conn, "faiss_file", name, commit=False)
     conn.commit()
 
+    # giữ file hiện tại + file trước đó (worker có thể đang nạp dở generation cũ)
+    for fn in os.listdir(store_dir):
+        if _RE_INDEX_FILE.match(fn) and fn not in (name, prev):
+            try:
+                os.remove(os.path.join(store_dir, fn))
+            except OSError:
+                pass
+    return gen
+
 
 # UTILITIES 
 
@@ -140,6 +477,17 @@ def _sha1(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8")).hexdigest()
 
 
+def _to_iso(date_str: str) -> str:
+    """'dd/mm/yyyy' (hoặc 'yyyy-mm-dd') -> 'yyyy-mm-dd'; sai định dạng thì ValueError."""
+    s = (date_str or "").strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"invalid date: {date_str!r} (expected dd/mm/yyyy)")
+
+
 def _chunk_text_fields(ev: Dict) -> str:
     """Ghép các trường có giá trị thành 1 đoạn văn để embedding."""
     fields = []
@@ -162,228 +510,431 @@ def _load_events_texts(events: List[Dict]) -> List[Tuple[str, str, Dict]]:
     return out
 
 
+def _insert_records(cur: sqlite3.Cursor, first_id: int, records: List[Tuple[str, str, Dict]],
+                    tag: str | None, upload_id: int | None, table: str = "chunks") -> None:
+    """
+    INSERT các (hash, text, ev) với id liên tiếp từ first_id (chưa commit).
+    ev có khoá tag/upload_id thì dùng thay giá trị chung (worker gộp nhiều upload vào 1 lượt nạp).
+    table: bảng đích (append_event_stream ghi vào bảng tạm rồi chuyển sang chunks một lần).
+    """
+    rows = []
+    for i, (h, txt, ev) in enumerate(records):
+        rows.append((
+            first_id + i, txt,
+            ev.get("date"), ev.get("dow"), ev.get("start"), ev.get("end"),
+            ev.get("location"), ev.get("participants"), ev.get("title"), ev.get("raw"),
+            h, ev.get("tag", tag), ev.get("upload_id", upload_id), *_derived_cols(ev)
+        ))
+    cur.executemany(f"""
+        INSERT INTO {table}(
+            id, text, date, dow, start, end, location, participants, title, raw, hash, tag, upload_id,
+            norm, dow_key, date_iso, start_min, end_min
+        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """, rows)
+
+
+def _batches(events: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    """Cắt luồng events thành các lô size phần tử (lô cuối có thể ngắn hơn)."""
+    batch: List[Dict] = []
+    for ev in events:
+        batch.append(ev)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 # CORE: APPEND / REBUILD
 
 def append_events(
     events: List[Dict],
     store_dir: str,
-    local_emb: str = "sentence-transformers/all-MiniLM-L6-v2",
+    local_emb: str = LOCAL_EMB_MODEL,
     dedupe: bool = True,
+    tag: str | None = None,
+    upload_id: int | None = None,
+    replace: bool = False,
 ) -> Dict:
+    """
+    Thêm events vào store, id mới = MAX(id)+1 trở đi (không đánh số lại dòng cũ).
+      - dedupe=False: đoạn trùng hash với dòng đã có sẽ thay dòng cũ (nhận tag/upload mới)
+      - replace=True: trước khi thêm, gỡ mọi dòng thuộc các ngày có mặt trong events
+        (nạp lại 1 tuần đã sửa mà không đụng các tuần khác)
+    """
     sqlite_path, faiss_path = _paths(store_dir)
 
-    conn = sqlite3.connect(sqlite_path)
-    _ensure_schema(conn)
-    cur = conn.cursor()
+    conn = write_conn(sqlite_path)
+    try:
+        _ensure_schema(conn)
+        cur = conn.cursor()
 
-    # backfill hash cho DB cũ (giúp dedupe hoạt động chuẩn)
-    _backfill_hashes(conn)
+        # backfill hash cho DB cũ (giúp dedupe hoạt động chuẩn)
+        _backfill_hashes(conn)
 
-    model = SentenceTransformer(local_emb)
-    try:
-        dim = model.get_sentence_embedding_dimension()
-    except Exception:
-        dim = int(model.encode(["a"]).shape[1])
+        model = get_embedder(local_emb)
+        dim = embedding_dim(model)
 
-    if os.path.exists(faiss_path):
-        index = faiss.read_index(faiss_path)
-        n_old = index.ntotal
-    else:
-        index = faiss.IndexFlatIP(dim)
-        n_old = 0
-
-    # meta nhất quán
-    prev_model = _get_meta(conn, "emb_model")
-    prev_dim   = _get_meta(conn, "emb_dim")
-    if prev_model and prev_model != local_emb:
-        # tự rebuild FAISS theo SQLite cho an toàn
-        n_old = _rebuild_faiss_from_sqlite(conn, faiss_path, model)
-        index = faiss.read_index(faiss_path)
-    if prev_dim and prev_dim != str(dim):
-        n_old = _rebuild_faiss_from_sqlite(conn, faiss_path, model)
-        index = faiss.read_index(faiss_path)
-
-    # sanity: đồng bộ rows vs ntotal (tự-heal nếu lệch)
-    cur.execute("SELECT COUNT(*) FROM chunks")
-    rows_cnt_before = cur.fetchone()[0]
-    if rows_cnt_before != n_old:
-        n_old = _rebuild_faiss_from_sqlite(conn, faiss_path, model)
-        index = faiss.read_index(faiss_path)
+        # meta nhất quán + đồng bộ tập id SQLite vs FAISS: lệch kiểu nào cũng chỉ tự-heal (rebuild) 1 lần
+        prev_model = _get_meta(conn, "emb_model")
+        prev_dim   = _get_meta(conn, "emb_dim")
+        index = _open_index(conn, faiss_path, local_emb,
+                            force_rebuild=bool((prev_model and prev_model != local_emb)
+                                               or (prev_dim and prev_dim != str(dim))))
         cur.execute("SELECT COUNT(*) FROM chunks")
         rows_cnt_before = cur.fetchone()[0]
 
-    # materialize records
-    pending = _load_events_texts(events)
+        # materialize records (hash là UNIQUE trong bảng nên luôn bỏ trùng trong cùng batch)
+        pending = list({h: (h, txt, ev) for (h, txt, ev) in _load_events_texts(events)}.values())
+
+        # chỉ chọn id cần gỡ ở đây; mọi thay đổi chunks dồn vào 1 transaction lúc _publish
+        drop_ids = set()
+        if replace:
+            dates = sorted({ev.get("date") for (_h, _t, ev) in pending if ev.get("date")})
+            if dates:
+                drop_ids.update(_select_ids(conn, dates=dates))
+
+        existing = {h: rid for (rid, h) in cur.execute("SELECT id, hash FROM chunks") if h and rid not in drop_ids}
+        if dedupe:
+            new_records = [(h, txt, ev) for (h, txt, ev) in pending if h not in existing]
+        else:
+            new_records = pending
+            drop_ids.update(existing[h] for (h, _t, _e) in pending if h in existing)
+
+        if not new_records and not drop_ids:
+            _set_meta(conn, "emb_model", local_emb, commit=False)
+            _set_meta(conn, "emb_dim", str(dim), commit=False)
+            conn.commit()
+            return {
+                "added": 0,
+                "removed": 0,
+                "total_before": rows_cnt_before,
+                "total_after": rows_cnt_before,
+                "sqlite_path": sqlite_path,
+                "faiss_path": faiss_path,
+            }
+
+        # encode trước (emb_cache tự commit), sau đó mới sửa chunks
+        embs = _encode_cached(conn, model, local_emb, [r[0] for r in new_records], [r[1] for r in new_records])
+
+        removed = _remove_ids(conn, index, sorted(drop_ids))
+        cur.execute("SELECT COALESCE(MAX(id), -1) + 1 FROM chunks")
+        next_id = cur.fetchone()[0]
+
+        _insert_records(cur, next_id, new_records, tag, upload_id)
+        if drop_ids and not _supports_remove(index):
+            index = _index_from_sqlite(conn, model, local_emb, _get_meta(conn, "index_type"))
+        elif new_records:
+            index.add_with_ids(embs, np.arange(next_id, next_id + len(new_records), dtype="int64"))
+        _set_meta(conn, "emb_model", local_emb, commit=False)
+        _set_meta(conn, "emb_dim", str(dim), commit=False)
+        generation = _publish(conn, faiss_path, index)
 
-    if dedupe:
-        existing = set(h for (h,) in cur.execute("SELECT hash FROM chunks") if h)
-        new_records = [(h, txt, ev) for (h, txt, ev) in pending if h not in existing]
-    else:
-        new_records = pending
+        cur.execute("SELECT COUNT(*) FROM chunks")
+        rows_cnt_after = cur.fetchone()[0]
+        # soft check: không “die”, chỉ cảnh báo nếu lệch
+        warn = None
+        if rows_cnt_after != index.ntotal:
+            warn = f"warning: sqlite_rows={rows_cnt_after} vs faiss_ntotal={index.ntotal}"
 
-    if not new_records:
-        _set_meta(conn, "emb_model", local_emb)
-        _set_meta(conn, "emb_dim", str(dim))
-        conn.commit(); conn.close()
+        faiss_file = _current_index_path(conn, faiss_path)
         return {
-            "added": 0,
+            "added": len(new_records),
+            "removed": removed,
             "total_before": rows_cnt_before,
-            "total_after": rows_cnt_before,
+            "total_after": rows_cnt_after,
             "sqlite_path": sqlite_path,
-            "faiss_path": faiss_path,
+            "faiss_path": faiss_file,
+            "generation": generation,
+            "warning": warn
         }
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    # encode + add
-    texts = [r[1] for r in new_records]
-    embs = model.encode(texts, normalize_embeddings=True)
-    embs = np.asarray(embs, dtype="float32")
-    if embs.shape[1] != dim:
-        # rebuild rồi thử lại 1 lần
-        _rebuild_faiss_from_sqlite(conn, faiss_path, model)
-        index = faiss.read_index(faiss_path)
-
-    index.add(embs)
-    faiss.write_index(index, faiss_path)
-
-    rows = []
-    for i, (h, txt, ev) in enumerate(new_records):
-        rid = rows_cnt_before + i
-        rows.append((
-            rid, txt,
-            ev.get("date"), ev.get("dow"), ev.get("start"), ev.get("end"),
-            ev.get("location"), ev.get("participants"), ev.get("title"), ev.get("raw"),
-            h
-        ))
-    cur.executemany("""
-        INSERT OR REPLACE INTO chunks(
-            id, text, date, dow, start, end, location, participants, title, raw, hash
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?)
-    """, rows)
-    conn.commit()
-
-    _set_meta(conn, "emb_model", local_emb)
-    _set_meta(conn, "emb_dim", str(dim))
-
-    cur.execute("SELECT COUNT(*) FROM chunks")
-    rows_cnt_after = cur.fetchone()[0]
-    # soft check: không “die”, chỉ cảnh báo nếu lệch
-    warn = None
-    if rows_cnt_after != index.ntotal:
-        warn = f"warning: sqlite_rows={rows_cnt_after} vs faiss_ntotal={index.ntotal}"
-
-    conn.close()
-    return {
-        "added": len(new_records),
-        "total_before": rows_cnt_before,
-        "total_after": rows_cnt_after,
-        "sqlite_path": sqlite_path,
-        "faiss_path": faiss_path,
-        "warning": warn
-    }
-
-# rag/ingest_lib.py (chỉ phần rebuild_events)
-
-def rebuild_events(events: list[dict], store_dir: str,
-                   local_emb: str = "sentence-transformers/all-MiniLM-L6-v2",
-                   dedupe: bool = True) -> dict:
-    import os, sqlite3, hashlib, numpy as np, faiss
-    from sentence_transformers import SentenceTransformer
-
-    def sha1(s: str) -> str:
-        import hashlib
-        return hashlib.sha1(s.encode("utf-8")).hexdigest()
 
-    sqlite_path = os.path.join(store_dir, "chunks.sqlite")
-    faiss_path  = os.path.join(store_dir, "index.faiss")
-    os.makedirs(store_dir, exist_ok=True)
-
-    # mở SQLite
-    conn = sqlite3.connect(sqlite_path)
-    cur  = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS chunks(
-      id INTEGER PRIMARY KEY,
-      hash TEXT UNIQUE,
-      text TEXT,
-      date TEXT, dow TEXT, start TEXT, end TEXT,
-      location TEXT, participants TEXT, title TEXT, raw TEXT
-    )""")
-    cur.execute("""CREATE TABLE IF NOT EXISTS meta(k TEXT PRIMARY KEY, v TEXT)""")
-    conn.commit()
+def append_event_stream(
+    events: Iterable[Dict],
+    store_dir: str,
+    local_emb: str = LOCAL_EMB_MODEL,
+    dedupe: bool = True,
+    tag: str | None = None,
+    upload_id: int | None = None,
+    replace: bool = False,
+    batch_size: int = INGEST_BATCH_SIZE,
+    on_batch: Callable[[Dict], None] | None = None,
+    on_publish: Callable[[], None] | None = None,
+) -> Dict:
+    """
+    Như append_events nhưng nhận một luồng events (generator) và xử lý theo lô batch_size:
+    encode (emb_cache, commit theo lô) → ghi vào bảng TEMP stage_chunks → add vào index trong bộ nhớ,
+    không giữ cả danh sách trong bộ nhớ. chunks chỉ bị sửa ở cuối: gỡ dòng bị thay + chuyển stage_chunks
+    sang chunks + _publish trong MỘT transaction ngắn (lỗi giữa chừng → chunks/index không đổi).
+    Giữa các lô không giữ khoá ghi, nên on_batch có thể ghi tiến độ/heartbeat qua kết nối khác.
+      - replace=True: ngày nào xuất hiện lần đầu trong luồng thì gỡ các dòng CŨ của ngày đó
+        (dòng vừa nạp ở lô trước, vd 2 file trùng tuần, được giữ)
+      - store đang trống: bỏ qua add từng lô, dựng index 1 lần ở cuối (IVF được train trên đủ dữ liệu)
+    on_batch(stats) được gọi sau mỗi lô (tiến độ cho CLI/admin/worker); on_publish() ngay trước
+    transaction cuối (lúc chưa giữ khoá ghi).
+    """
+    sqlite_path, faiss_path = _paths(store_dir)
+    conn = write_conn(sqlite_path)
+    try:
+        _ensure_schema(conn)
+        _backfill_hashes(conn)
+        cur = conn.cursor()
+
+        model = get_embedder(local_emb)
+        dim = embedding_dim(model)
+        prev_model = _get_meta(conn, "emb_model")
+        prev_dim   = _get_meta(conn, "emb_dim")
+        index = _open_index(conn, faiss_path, local_emb,
+                            force_rebuild=bool((prev_model and prev_model != local_emb)
+                                               or (prev_dim and prev_dim != str(dim))))
+        cur.execute("SELECT COUNT(*), COALESCE(MAX(id), -1) + 1 FROM chunks")
+        rows_cnt_before, first_id = cur.fetchone()
+        rebuild = rows_cnt_before == 0
+
+        existing = {h: rid for (rid, h) in cur.execute("SELECT id, hash FROM chunks") if h}
+        # bảng tạm riêng của kết nối này (file temp, không khoá DB chính); cùng thứ tự cột với chunks
+        cur.execute("CREATE TEMP TABLE stage_chunks AS SELECT * FROM chunks WHERE 0")
+        conn.commit()
+        seen_dates: set = set()
+        drop_all: List[int] = []
+        next_id = first_id
+        stats = {"batches": 0, "seen": 0, "added": 0, "removed": 0, "skipped": 0,
+                 "encode_ms": 0.0, "write_ms": 0.0}
+
+        def _flush(batch: List[Dict]) -> None:
+            nonlocal next_id
+            drop_ids: List[int] = []
+            if replace:
+                dates = sorted({ev.get("date") for ev in batch if ev.get("date")} - seen_dates)
+                seen_dates.update(dates)
+                if dates:
+                    drop_ids = [i for i in _select_ids(conn, dates=dates) if i < first_id]
+                    if drop_ids:
+                        gone = set(drop_ids)
+                        for h in [h for h, rid in existing.items() if rid in gone]:
+                            del existing[h]
+
+            records: Dict[str, Tuple[str, str, Dict]] = {}
+            for h, txt, ev in _load_events_texts(batch):
+                rid = existing.get(h)
+                if h in records or (rid is not None and (dedupe or rid >= first_id)):
+                    continue            # trùng trong luồng, hoặc dedupe với dòng cũ
+                if rid is not None:
+                    drop_ids.append(rid)   # dedupe=False: dòng cũ cùng hash nhường chỗ cho dòng mới
+                    del existing[h]
+                records[h] = (h, txt, ev)
+            new_records = list(records.values())
+            stats["skipped"] += len(batch) - len(new_records)
+
+            t0 = time.perf_counter()
+            embs = _encode_cached(conn, model, local_emb, [r[0] for r in new_records],
+                                  [r[1] for r in new_records])
+            t1 = time.perf_counter()
+            # dòng cũ chỉ gỡ ở transaction cuối; id mới luôn >= first_id nên không đụng nhau
+            drop_all.extend(drop_ids)
+            stats["removed"] += len(drop_ids)
+            _insert_records(cur, next_id, new_records, tag, upload_id, table="temp.stage_chunks")
+            conn.commit()
+            ids = np.arange(next_id, next_id + len(new_records), dtype="int64")
+            if new_records and not rebuild:
+                index.add_with_ids(embs, ids)
+            existing.update(zip(records, ids.tolist()))
+            next_id += len(new_records)
+            t2 = time.perf_counter()
+
+            stats["batches"] += 1
+            stats["seen"] += len(batch)
+            stats["added"] += len(new_records)
+            stats["encode_ms"] += (t1 - t0) * 1000
+            stats["write_ms"] += (t2 - t1) * 1000
+            if on_batch:
+                on_batch(dict(stats))
+
+        for batch in _batches(events, batch_size):
+            _flush(batch)
+
+        if on_publish:
+            on_publish()
+        _set_meta(conn, "emb_model", local_emb, commit=False)
+        _set_meta(conn, "emb_dim", str(dim), commit=False)
+        stats["encode_ms"], stats["write_ms"] = round(stats["encode_ms"], 1), round(stats["write_ms"], 1)
+        if not stats["added"] and not stats["removed"]:
+            conn.commit()
+            return {**stats, "total_before": rows_cnt_before, "total_after": rows_cnt_before,
+                    "sqlite_path": sqlite_path, "faiss_path": _current_index_path(conn, faiss_path)}
+
+        stats["removed"] = _remove_ids(conn, index, sorted(drop_all))
+        if drop_all and not _supports_remove(index):
+            rebuild = True
+        cur.execute("INSERT INTO chunks SELECT * FROM temp.stage_chunks")
+        if rebuild:
+            index = _index_from_sqlite(conn, model, local_emb, None if rows_cnt_before == 0
+                                       else _get_meta(conn, "index_type"))
+        generation = _publish(conn, faiss_path, index)
 
-    # clear dữ liệu cũ
-    cur.execute("DELETE FROM chunks")
-    conn.commit()
+        cur.execute("SELECT COUNT(*) FROM chunks")
+        rows_cnt_after = cur.fetchone()[0]
+        warn = None
+        if rows_cnt_after != index.ntotal:
+            warn = f"warning: sqlite_rows={rows_cnt_after} vs faiss_ntotal={index.ntotal}"
+        return {
+            **stats,
+            "total_before": rows_cnt_before,
+            "total_after": rows_cnt_after,
+            "sqlite_path": sqlite_path,
+            "faiss_path": _current_index_path(conn, faiss_path),
+            "generation": generation,
+            "warning": warn,
+        }
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    # chuẩn bị texts + dedupe theo hash
-    def materialize_text(ev):
-        parts=[]
-        for k in ("date","dow","start","end","location","participants","title"):
-            v=ev.get(k)
-            if v: parts.append(f"{k}: {v}")
-        if ev.get("raw"): parts.append(f"raw: {ev['raw']}")
-        return "\n".join(parts)
-
-    records=[]
-    if dedupe:
-        seen=set()
-        for ev in events:
-            txt = materialize_text(ev)
-            h = sha1(txt)
-            if h in seen: 
-                continue
-            seen.add(h)
-            records.append((h, txt, ev))
-    else:
-        for ev in events:
-            txt = materialize_text(ev)
-            h   = sha1(txt)
-            records.append((h, txt, ev))
-
-    # tạo FAISS mới
-    model = SentenceTransformer(local_emb)
-    dim   = model.get_sentence_embedding_dimension()
-    index = faiss.IndexFlatIP(dim)
-
-    # encode + add
-    texts = [r[1] for r in records]
-    if texts:
-        embs  = model.encode(texts, normalize_embeddings=True)
-        embs  = np.asarray(embs, dtype="float32")
-        index.add(embs)
-    faiss.write_index(index, faiss_path)
-
-    # insert rows với id khớp thứ tự index
-    for i, (h, txt, ev) in enumerate(records):
-        cur.execute("""INSERT OR REPLACE INTO chunks(
-            id, hash, text, date, dow, start, end, location, participants, title, raw
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?)""",
-        (i, h, txt, ev.get("date"), ev.get("dow"), ev.get("start"), ev.get("end"),
-         ev.get("location"), ev.get("participants"), ev.get("title"), ev.get("raw")))
-    conn.commit()
 
-    # lưu meta
-    cur.execute("INSERT INTO meta(k,v) VALUES('emb_model',?) ON CONFLICT(k) DO UPDATE SET v=excluded.v",
-                (local_emb,))
-    cur.execute("INSERT INTO meta(k,v) VALUES('emb_dim',?) ON CONFLICT(k) DO UPDATE SET v=excluded.v",
-                (str(dim),))
-    conn.commit()
+def delete_events(
+    store_dir: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    tag: str | None = None,
+    hashes: List[str] | None = None,
+    on_publish: Callable[[], None] | None = None,
+) -> Dict:
+    """
+    Xoá các dòng khớp MỌI điều kiện đã cho (khoảng ngày dd/mm/yyyy, tag upload, danh sách hash)
+    khỏi SQLite và FAISS theo id; phần còn lại của index giữ nguyên, không encode lại.
+    on_publish() được gọi ngay trước transaction xoá + công bố (lúc chưa giữ khoá ghi).
+    """
+    sqlite_path, faiss_path = _paths(store_dir)
+    conn = write_conn(sqlite_path)
+    try:
+        _ensure_schema(conn)
+        ids = _select_ids(conn, date_from=date_from, date_to=date_to, tag=tag, hashes=hashes)
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM chunks")
+        rows_cnt_before = cur.fetchone()[0]
+        if not ids:
+            return {"removed": 0, "total_before": rows_cnt_before, "total_after": rows_cnt_before}
+
+        model_name = _get_meta(conn, "emb_model") or LOCAL_EMB_MODEL
+        index = _open_index(conn, faiss_path, model_name)
+        if on_publish:
+            on_publish()
+        removed = _remove_ids(conn, index, ids)
+        if not _supports_remove(index):
+            index = _index_from_sqlite(conn, get_embedder(model_name), model_name, _get_meta(conn, "index_type"))
+        generation = _publish(conn, faiss_path, index)
 
-    # kiểm tra “mềm” và trả summary
-    rows_cnt = cur.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
-    ntotal   = index.ntotal
-    conn.close()
-
-    ok = (rows_cnt == ntotal)
-    warn = None if ok else f"warning: sqlite_rows={rows_cnt} vs faiss_ntotal={ntotal}"
-
-    return {
-        "mode": "rebuild",
-        "added": len(records),
-        "total_before": 0,
-        "total_after": rows_cnt,
-        "sqlite_path": sqlite_path,
-        "faiss_path": faiss_path,
-        "ok": ok,
-        "warning": warn
-    }
\ No newline at end of file
+        cur.execute("SELECT COUNT(*) FROM chunks")
+        rows_cnt_after = cur.fetchone()[0]
+        warn = None
+        if rows_cnt_after != index.ntotal:
+            warn = f"warning: sqlite_rows={rows_cnt_after} vs faiss_ntotal={index.ntotal}"
+        return {
+            "removed": removed,
+            "total_before": rows_cnt_before,
+            "total_after": rows_cnt_after,
+            "generation": generation,
+            "warning": warn,
+        }
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def rebuild_events(events: Iterable[Dict], store_dir: str,
+                   local_emb: str = LOCAL_EMB_MODEL,
+                   dedupe: bool = True,
+                   tag: str | None = None,
+                   upload_id: int | None = None,
+                   batch_size: int = INGEST_BATCH_SIZE,
+                   on_batch: Callable[[Dict], None] | None = None,
+                   on_publish: Callable[[], None] | None = None) -> Dict:
+    """
+    Thay toàn bộ store bằng một luồng events, theo lô như append_event_stream: encode (emb_cache) →
+    bảng TEMP stage_chunks, on_batch(stats) sau mỗi lô (giữa các lô không giữ khoá ghi). Cuối cùng dựng
+    index theo FAISS_INDEX_TYPE (IVF train trên toàn bộ tập), rồi DELETE chunks + chuyển stage_chunks
+    + _publish trong 1 transaction (on_publish() ngay trước đó). id = thứ tự bản ghi. Đoạn trùng hash trong luồng luôn bị bỏ
+    (hash UNIQUE), dedupe giữ cho tương thích API.
+    """
+    sqlite_path, faiss_path = _paths(store_dir)
+    conn = write_conn(sqlite_path)
+    try:
+        _ensure_schema(conn)
+        cur = conn.cursor()
+        rows_cnt_before = cur.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        model = get_embedder(local_emb)
+        dim   = embedding_dim(model)
+        cur.execute("CREATE TEMP TABLE stage_chunks AS SELECT * FROM chunks WHERE 0")
+        conn.commit()
+        seen: set = set()
+        parts: List[np.ndarray] = []
+        stats = {"batches": 0, "seen": 0, "added": 0, "skipped": 0, "encode_ms": 0.0, "write_ms": 0.0}
+
+        for batch in _batches(events, batch_size):
+            records = []
+            for h, txt, ev in _load_events_texts(batch):
+                if h not in seen:
+                    seen.add(h)
+                    records.append((h, txt, ev))
+            t0 = time.perf_counter()
+            embs = _encode_cached(conn, model, local_emb, [r[0] for r in records], [r[1] for r in records])
+            t1 = time.perf_counter()
+            _insert_records(cur, stats["added"], records, tag, upload_id, table="temp.stage_chunks")
+            conn.commit()
+            parts.append(embs)
+            t2 = time.perf_counter()
+
+            stats["batches"] += 1
+            stats["seen"] += len(batch)
+            stats["added"] += len(records)
+            stats["skipped"] += len(batch) - len(records)
+            stats["encode_ms"] += (t1 - t0) * 1000
+            stats["write_ms"] += (t2 - t1) * 1000
+            if on_batch:
+                on_batch(dict(stats))
+        stats["encode_ms"], stats["write_ms"] = round(stats["encode_ms"], 1), round(stats["write_ms"], 1)
+
+        # dựng index trước khi đụng chunks, để transaction ghi cuối cùng ngắn
+        embs = np.concatenate(parts) if parts else np.zeros((0, dim), dtype="float32")
+        index, index_type = _make_index(dim, embs, np.arange(len(embs), dtype="int64"))
+        del parts, embs
+
+        if on_publish:
+            on_publish()
+        # clear dữ liệu cũ — cùng transaction với các dòng mới, reader chỉ thấy bản cũ hoặc bản mới
+        cur.execute("DELETE FROM chunks")
+        cur.execute("INSERT INTO chunks SELECT * FROM temp.stage_chunks")
+        _set_meta(conn, "emb_model", local_emb, commit=False)
+        _set_meta(conn, "emb_dim", str(dim), commit=False)
+        _set_meta(conn, "index_type", index_type, commit=False)
+        generation = _publish(conn, faiss_path, index)
+
+        # kiểm tra “mềm” và trả summary
+        rows_cnt = cur.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        ok = rows_cnt == index.ntotal
+        return {
+            **stats,
+            "mode": "rebuild",
+            "index_type": index_type,
+            "total_before": rows_cnt_before,
+            "total_after": rows_cnt,
+            "sqlite_path": sqlite_path,
+            "faiss_path": _current_index_path(conn, faiss_path),
+            "ok": ok,
+            "generation": generation,
+            "warning": None if ok else f"warning: sqlite_rows={rows_cnt} vs faiss_ntotal={index.ntotal}",
+        }
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,216 @@
+# backend/ingest/job_queue.py — hàng đợi job ingest bền trong SQLite (bảng ingest_jobs, cùng file với uploads)
+#
+# API chỉ enqueue; đúng 1 tiến trình backend/ingest/worker.py (giữ lease "ingest_worker" trong bảng meta)
+# lấy job ra chạy, nên không bao giờ có 2 lượt ghi FAISS/SQLite song song. Job nằm trong SQLite nên
+# restart API/worker không mất job; job "running" của worker đã chết được đưa lại hàng đợi (recover_stale).
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from backend.rag.db import write_conn
+from backend.rag.settings import INGEST_COALESCE_MAX, INGEST_JOB_MAX_ATTEMPTS
+
+# docx: 1 file đã preview; bulk: file .zip / thư mục .docx; jsonl: events JSONL (CLI ingest_faiss); delete: xoá theo bộ lọc
+JOB_KINDS = ("docx", "bulk", "jsonl", "delete")
+LEASE_KEY = "ingest_worker"
+
+# cột tiến độ thêm vào uploads (store cũ được ALTER TABLE khi mở)
+_UPLOAD_PROGRESS_COLS = {"stage": "TEXT", "chunks_done": "INTEGER", "chunks_total": "INTEGER"}
+# cột thêm vào ingest_jobs: params = JSON tham số riêng của loại job (delete: date_from/date_to/tag/hashes;
+# bulk/jsonl từ CLI: workers/batch_size/local_emb)
+_JOB_EXTRA_COLS = {"params": "TEXT"}
+
+@dataclass
+class Job:
+    id: int
+    upload_id: int
+    kind: str
+    mode: str
+    path: str
+    tag: Optional[str]
+    dedupe: bool
+    year: Optional[int]
+    attempts: int
+    params: Optional[dict] = None
+
+_JOB_COLS = "id, upload_id, kind, mode, path, tag, dedupe, year, attempts, params"
+
+def _job(row) -> Job:
+    return Job(row[0], row[1], row[2], row[3], row[4], row[5], bool(row[6]), row[7], row[8],
+               json.loads(row[9]) if row[9] else None)
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""CREATE TABLE IF NOT EXISTS uploads(
+      id INTEGER PRIMARY KEY,
+      filename TEXT, tag TEXT, mode TEXT, total_events INTEGER, added_events INTEGER,
+      status TEXT, log TEXT, created_at TEXT, updated_at TEXT)""")
+    have = {r[1] for r in conn.execute("PRAGMA table_info(uploads)")}
+    for col, typ in _UPLOAD_PROGRESS_COLS.items():
+        if col not in have:
+            conn.execute(f"ALTER TABLE uploads ADD COLUMN {col} {typ}")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ingest_jobs(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      upload_id INTEGER NOT NULL,
+      kind TEXT NOT NULL, mode TEXT NOT NULL, path TEXT NOT NULL,
+      tag TEXT, dedupe INTEGER NOT NULL DEFAULT 1, year INTEGER,
+      status TEXT NOT NULL DEFAULT 'queued',      -- queued | running | done | failed
+      attempts INTEGER NOT NULL DEFAULT 0,
+      owner TEXT, heartbeat_at REAL, error TEXT,
+      created_at REAL, started_at REAL, finished_at REAL)""")
+    have = {r[1] for r in conn.execute("PRAGMA table_info(ingest_jobs)")}
+    for col, typ in _JOB_EXTRA_COLS.items():
+        if col not in have:
+            conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {col} {typ}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta(k TEXT PRIMARY KEY, v TEXT)")
+    conn.commit()
+
+def log_upload(conn: sqlite3.Connection, task_id: int, filename: str | None = None, tag: str | None = None,
+               mode: str | None = None, status: str = "queued", added: int | None = None,
+               total: int | None = None, log: str | None = None, stage: str | None = None,
+               chunks_done: int | None = None, chunks_total: int | None = None) -> None:
+    """Ghi/cập nhật 1 dòng uploads (trạng thái + tiến độ theo giai đoạn parse/encode/index/commit)."""
+    now = dt.datetime.now().isoformat(timespec="seconds")
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM uploads WHERE id=?", (task_id,))
+    if cur.fetchone():
+        cur.execute("""UPDATE uploads SET status=?, added_events=COALESCE(?,added_events),
+                       total_events=COALESCE(?,total_events), log=COALESCE(?,log), stage=COALESCE(?,stage),
+                       chunks_done=COALESCE(?,chunks_done), chunks_total=COALESCE(?,chunks_total),
+                       updated_at=? WHERE id=?""",
+                    (status, added, total, log, stage, chunks_done, chunks_total, now, task_id))
+    else:
+        cur.execute("""INSERT INTO uploads(id,filename,tag,mode,total_events,added_events,status,log,
+                                           stage,chunks_done,chunks_total,created_at,updated_at)
+                       VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+                    (task_id, filename, tag, mode, total, added, status, log,
+                     stage, chunks_done, chunks_total, now, now))
+    conn.commit()
+
+def enqueue(db_path: str, kind: str, mode: str, path: str, tag: str | None = None, dedupe: bool = True,
+            year: int | None = None, filename: str | None = None, params: dict | None = None) -> Tuple[int, int]:
+    """
+    Thêm job + dòng uploads 'queued' trong cùng 1 transaction; trả (upload_id, job_id).
+    upload_id = timestamp giây như trước, nhưng cấp trong BEGIN IMMEDIATE nên 2 upload cùng giây không trùng.
+    params: tham số riêng của loại job, lưu JSON (job delete: date_from, date_to, tag, hashes;
+    bulk/jsonl: workers, batch_size, local_emb).
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"kind must be one of {JOB_KINDS}")
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = write_conn(db_path)
+    try:
+        ensure_tables(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.cursor()
+        last = cur.execute("SELECT COALESCE(MAX(id), 0) FROM uploads").fetchone()[0]
+        upload_id = max(int(time.time()), last + 1)
+        cur.execute("""INSERT INTO ingest_jobs(upload_id, kind, mode, path, tag, dedupe, year, params, created_at)
+                       VALUES(?,?,?,?,?,?,?,?,?)""",
+                    (upload_id, kind, mode, path, tag, int(dedupe), year,
+                     json.dumps(params, ensure_ascii=False) if params else None, time.time()))
+        job_id = cur.lastrowid
+        log_upload(conn, upload_id, filename=filename, tag=tag,
+                   mode=mode if kind in ("docx", "delete") else f"{kind}_{mode}", status="queued", stage="queued")
+        return upload_id, job_id
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def acquire_lease(conn: sqlite3.Connection, owner: str, ttl_s: float) -> bool:
+    """Giữ/gia hạn quyền worker duy nhất (meta ingest_worker = {owner, until}); False nếu worker khác đang giữ."""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT v FROM meta WHERE k=?", (LEASE_KEY,)).fetchone()
+        lease = json.loads(row[0]) if row else {}
+        if lease.get("owner") not in (None, owner) and lease.get("until", 0) > now:
+            conn.rollback()
+            return False
+        conn.execute("INSERT INTO meta(k, v) VALUES(?, ?) ON CONFLICT(k) DO UPDATE SET v=excluded.v",
+                     (LEASE_KEY, json.dumps({"owner": owner, "until": now + ttl_s})))
+        conn.commit()
+        return True
+    except BaseException:
+        conn.rollback()
+        raise
+
+def release_lease(conn: sqlite3.Connection, owner: str) -> None:
+    row = conn.execute("SELECT v FROM meta WHERE k=?", (LEASE_KEY,)).fetchone()
+    if row and json.loads(row[0]).get("owner") == owner:
+        conn.execute("DELETE FROM meta WHERE k=?", (LEASE_KEY,))
+        conn.commit()
+
+def recover_stale(conn: sqlite3.Connection, owner: str, stale_s: float) -> int:
+    """
+    Job 'running' mà worker giữ nó đã chết (heartbeat quá stale_s, hoặc chính owner này lúc vừa khởi động)
+    → về 'queued' để chạy lại; quá INGEST_JOB_MAX_ATTEMPTS lần thì 'failed'.
+    Chạy lại an toàn vì mỗi lượt ingest chỉ công bố bằng 1 transaction ở cuối (_publish).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT id, upload_id, attempts FROM ingest_jobs WHERE status='running' "
+                "AND (owner=? OR heartbeat_at IS NULL OR heartbeat_at < ?)", (owner, time.time() - stale_s))
+    rows = cur.fetchall()
+    for job_id, upload_id, attempts in rows:
+        if attempts >= INGEST_JOB_MAX_ATTEMPTS:
+            cur.execute("UPDATE ingest_jobs SET status='failed', error=?, finished_at=? WHERE id=?",
+                        ("worker died while running job", time.time(), job_id))
+            log_upload(conn, upload_id, status="failed", log="worker died while running job")
+        else:
+            cur.execute("UPDATE ingest_jobs SET status='queued', owner=NULL WHERE id=?", (job_id,))
+            log_upload(conn, upload_id, status="queued", stage="queued")
+    conn.commit()
+    return len(rows)
+
+def claim(conn: sqlite3.Connection, owner: str) -> List[Job]:
+    """
+    Lấy job chờ lâu nhất. Nếu là docx 'append' có dedupe thì gộp luôn các job cùng loại xếp ngay sau nó
+    (tối đa INGEST_COALESCE_MAX) thành 1 lượt encode + 1 lần công bố index; replace/rebuild/bulk/delete
+    chạy riêng để giữ đúng thứ tự "file sau thắng file trước".
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(f"SELECT {_JOB_COLS} FROM ingest_jobs WHERE status='queued' ORDER BY id LIMIT ?",
+                            (max(1, INGEST_COALESCE_MAX),)).fetchall()
+        jobs: List[Job] = []
+        for j in map(_job, rows):
+            if jobs and not (_coalescable(jobs[0]) and _coalescable(j)):
+                break
+            jobs.append(j)
+            if not _coalescable(j):
+                break
+        now = time.time()
+        conn.executemany("UPDATE ingest_jobs SET status='running', owner=?, attempts=attempts+1, "
+                         "started_at=?, heartbeat_at=? WHERE id=?", [(owner, now, now, j.id) for j in jobs])
+        conn.commit()
+        return jobs
+    except BaseException:
+        conn.rollback()
+        raise
+
+def _coalescable(job: Job) -> bool:
+    return job.kind == "docx" and job.mode == "append" and job.dedupe
+
+def heartbeat(conn: sqlite3.Connection, jobs: List[Job], owner: str, ttl_s: float) -> None:
+    now = time.time()
+    conn.executemany("UPDATE ingest_jobs SET heartbeat_at=? WHERE id=?", [(now, j.id) for j in jobs])
+    conn.execute("UPDATE meta SET v=? WHERE k=?", (json.dumps({"owner": owner, "until": now + ttl_s}), LEASE_KEY))
+    conn.commit()
+
+def finish(conn: sqlite3.Connection, jobs: List[Job], status: str, error: str | None = None) -> None:
+    conn.executemany("UPDATE ingest_jobs SET status=?, error=?, finished_at=? WHERE id=?",
+                     [(status, error, time.time(), j.id) for j in jobs])
+    conn.commit()
+
+def list_jobs(conn: sqlite3.Connection, limit: int = 50) -> List[dict]:
+    cur = conn.cursor(); cur.row_factory = sqlite3.Row
+    cur.execute("SELECT * FROM ingest_jobs ORDER BY id DESC LIMIT ?", (limit,))
+    return [dict(r) for r in cur.fetchall()]
@@ -0,0 +1,263 @@
+# backend/ingest/worker.py — tiến trình ingest duy nhất: lấy job từ hàng đợi SQLite (job_queue) và nạp vào store
+#
+#   python -m backend.ingest.worker                  # chạy nền, poll hàng đợi mỗi INGEST_POLL_INTERVAL giây
+#   python -m backend.ingest.worker --once           # chạy hết job đang chờ rồi thoát (cron / script)
+#
+# CLI bulk_import / ingest_faiss cũng không ghi store trực tiếp: enqueue rồi run_job (chạy qua run_once,
+# hoặc chờ worker đang giữ lease chạy hộ).
+#
+# Mỗi lượt: events chảy từ parser (cache parse của lần preview / process pool của zip) thẳng vào
+# ingest_lib.append_event_stream / rebuild_events: encode + ghi bảng tạm theo lô, sau mỗi lô ghi tiến độ,
+# cuối cùng chunks + FAISS + _publish trong 1 transaction ngắn. Job delete gọi ingest_lib.delete_events.
+# Suốt lượt chạy, 1 thread riêng gia hạn heartbeat/lease (kể cả delete, dựng index, transaction cuối).
+from __future__ import annotations
+
+import argparse, json, logging, os, socket, sqlite3, threading, time, traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from backend.ingest import job_queue
+from backend.ingest.job_queue import Job
+from backend.ingest.bulk_import import iter_sources, parse_stream, with_rates
+from backend.ingest.ingest_lib import append_event_stream, delete_events, rebuild_events
+from backend.rag.db import write_conn
+from backend.rag.parser import parse_docx_cached
+from backend.rag.settings import INGEST_JOB_STALE_S, INGEST_POLL_INTERVAL, INGEST_WORKERS, STORE_DIR
+
+log = logging.getLogger(__name__)
+
+# ghi tiến độ (+ heartbeat) tối đa ~1 lần/giây giữa các lô encode
+_PROGRESS_EVERY_S = 1.0
+# nhịp heartbeat nền: vài lần trong 1 khoảng INGEST_JOB_STALE_S để lỡ 1-2 nhịp (store đang khoá ghi) vẫn an toàn
+_HEARTBEAT_EVERY_S = max(1.0, INGEST_JOB_STALE_S / 5)
+# params của job bulk/jsonl (từ CLI) được chuyển thẳng cho append_event_stream / rebuild_events
+_INGEST_OPTS = ("batch_size", "local_emb")
+
+
+def _jsonl_events(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class IngestWorker:
+    def __init__(self, store_dir: str = STORE_DIR, owner: Optional[str] = None):
+        self.store_dir = store_dir
+        self.db_path = os.path.join(store_dir, "chunks.sqlite")
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        Path(store_dir).mkdir(parents=True, exist_ok=True)
+        self.conn = write_conn(self.db_path)
+        job_queue.ensure_tables(self.conn)
+
+    def close(self) -> None:
+        job_queue.release_lease(self.conn, self.owner)
+        self.conn.close()
+
+    # ---- vòng lặp ----
+
+    def run_once(self) -> int:
+        """Chạy các job đang chờ tới khi hết; trả số job đã xử lý (0 nếu worker khác đang giữ lease)."""
+        if not job_queue.acquire_lease(self.conn, self.owner, INGEST_JOB_STALE_S):
+            return 0
+        n = job_queue.recover_stale(self.conn, self.owner, INGEST_JOB_STALE_S)
+        if n:
+            log.warning("requeued %s stale ingest job(s)", n)
+        done = 0
+        while True:
+            jobs = job_queue.claim(self.conn, self.owner)
+            if not jobs:
+                return done
+            self._run(jobs)
+            done += len(jobs)
+            job_queue.acquire_lease(self.conn, self.owner, INGEST_JOB_STALE_S)
+
+    def run_forever(self, stop: Optional[threading.Event] = None, poll_s: float = INGEST_POLL_INTERVAL) -> None:
+        stop = stop or threading.Event()
+        log.info("ingest worker %s polling %s", self.owner, self.db_path)
+        while not stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("ingest worker loop failed")
+            stop.wait(poll_s)
+
+    # ---- 1 lượt (1 job, hoặc nhiều job append đã gộp) ----
+
+    def _progress(self, jobs: List[Job], **kw) -> None:
+        for j in jobs:
+            job_queue.log_upload(self.conn, j.upload_id, status="running", **kw)
+        job_queue.heartbeat(self.conn, jobs, self.owner, INGEST_JOB_STALE_S)
+
+    @contextmanager
+    def _heartbeat(self, jobs: List[Job]):
+        """
+        Gia hạn heartbeat của jobs + lease worker từ 1 thread riêng (kết nối riêng) trong lúc lượt ingest chạy,
+        để delete/rebuild/transaction công bố dài hơn INGEST_JOB_STALE_S không bị worker khác recover_stale.
+        """
+        stop = threading.Event()
+
+        def _beat():
+            conn = write_conn(self.db_path)
+            try:
+                while not stop.wait(_HEARTBEAT_EVERY_S):
+                    try:
+                        job_queue.heartbeat(conn, jobs, self.owner, INGEST_JOB_STALE_S)
+                    except sqlite3.OperationalError as e:
+                        # ingest đang giữ khoá ghi quá busy_timeout → thử lại ở nhịp sau
+                        conn.rollback()
+                        log.warning("ingest heartbeat skipped: %s", e)
+            finally:
+                conn.close()
+
+        t = threading.Thread(target=_beat, name="ingest-heartbeat", daemon=True)
+        t.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            t.join()
+
+    def _events(self, jobs: List[Job], file_stats: Dict[int, List[Dict]], totals: Dict[str, int]) -> Iterator[Dict]:
+        """Events của các job theo thứ tự, parse dần (zip: process pool); totals["known"] = số event docx đã biết."""
+        for j in jobs:
+            if j.kind == "bulk":
+                evs = parse_stream(iter_sources(j.path), workers=(j.params or {}).get("workers", INGEST_WORKERS),
+                                   year=j.year, file_stats=file_stats.setdefault(j.id, []))
+            elif j.kind == "jsonl":
+                evs = _jsonl_events(j.path)
+            else:
+                if not Path(j.path).exists():
+                    raise FileNotFoundError(f"temp_path not found: {j.path!r}")
+                evs, _ = parse_docx_cached(j.path, j.year)
+                totals["known"] += len(evs)
+            # mỗi event mang tag/upload_id của job mình (ingest_lib._insert_records) khi các job được gộp
+            for ev in evs:
+                yield {**ev, "tag": j.tag, "upload_id": j.upload_id}
+        # hết luồng: lô cuối + dựng index; stage "commit" do on_publish ghi ngay trước transaction cuối
+        self._progress(jobs, stage="index")
+
+    def _run(self, jobs: List[Job]) -> None:
+        ids = [j.id for j in jobs]
+        log.info("ingest jobs %s (%s/%s)", ids, jobs[0].kind, jobs[0].mode)
+        t0 = time.perf_counter()
+        try:
+            head = jobs[0]
+            opts = {k: v for k, v in (head.params or {}).items() if k in _INGEST_OPTS}
+            file_stats: Dict[int, List[Dict]] = {}
+            totals = {"known": 0}
+            last = 0.0
+
+            def _batch(stats: Dict) -> None:
+                # append_event_stream / rebuild_events không giữ khoá ghi giữa các lô → ghi được uploads + heartbeat
+                nonlocal last
+                if time.monotonic() - last >= _PROGRESS_EVERY_S:
+                    last = time.monotonic()
+                    self._progress(jobs, stage="encode", chunks_done=stats["seen"],
+                                   chunks_total=totals["known"] if head.kind == "docx" else None)
+
+            def _commit_stage() -> None:
+                # ngay trước transaction công bố (ingest chưa giữ khoá ghi); từ đó tới lúc xong không ghi được tiến độ
+                self._progress(jobs, stage="commit")
+
+            with self._heartbeat(jobs):
+                if head.kind == "delete":
+                    self._progress(jobs, stage="index")
+                    res = delete_events(self.store_dir, **(head.params or {}), on_publish=_commit_stage)
+                else:
+                    self._progress(jobs, stage="parse", chunks_done=0)
+                    events = self._events(jobs, file_stats, totals)
+                    if head.mode == "rebuild":
+                        res = rebuild_events(events, self.store_dir, tag=head.tag, upload_id=head.upload_id,
+                                             on_batch=_batch, on_publish=_commit_stage, **opts)
+                    else:
+                        res = append_event_stream(events, self.store_dir, dedupe=head.dedupe,
+                                                  replace=(head.mode == "replace"), on_batch=_batch,
+                                                  on_publish=_commit_stage, **opts)
+            elapsed = time.perf_counter() - t0
+            res["elapsed_s"] = round(elapsed, 2)
+            if "seen" in res:
+                res["events_per_s"] = round(res["seen"] / elapsed, 1) if elapsed else None
+            if len(jobs) > 1:
+                res["coalesced_jobs"] = ids
+
+            added = self._added_by_upload(jobs)
+            for j in jobs:
+                out = dict(res, added=added.get(j.upload_id, 0))
+                if j.id in file_stats:
+                    out["files"] = with_rates(file_stats[j.id])
+                    out["files_failed"] = sum(1 for st in file_stats[j.id] if st["error"])
+                job_queue.log_upload(self.conn, j.upload_id, status="done", stage="done", added=out["added"],
+                                     total=res.get("total_after", 0), log=json.dumps(out, ensure_ascii=False))
+            job_queue.finish(self.conn, jobs, "done")
+        except Exception:
+            err = traceback.format_exc()
+            log.error("ingest jobs %s failed\n%s", ids, err)
+            for j in jobs:
+                job_queue.log_upload(self.conn, j.upload_id, status="failed", log=err)
+            job_queue.finish(self.conn, jobs, "failed", err)
+
+    def _added_by_upload(self, jobs: List[Job]) -> Dict[int, int]:
+        """Số dòng mới của từng upload (lượt gộp chỉ trả tổng)."""
+        ups = [j.upload_id for j in jobs]
+        cur = self.conn.execute(
+            f"SELECT upload_id, COUNT(*) FROM chunks WHERE upload_id IN ({','.join('?' * len(ups))}) "
+            "GROUP BY upload_id", ups)
+        return dict(cur.fetchall())
+
+
+def run_job(store_dir: str, upload_id: int, job_id: int, poll_s: float = INGEST_POLL_INTERVAL) -> Dict:
+    """
+    Cho CLI sau enqueue: chạy hàng đợi bằng run_once() (lấy lease như worker thường); worker khác đang giữ
+    lease thì chờ nó chạy xong job. Trả kết quả ghi trong uploads.log; job failed → RuntimeError.
+    """
+    worker = IngestWorker(store_dir)
+    try:
+        while True:
+            worker.run_once()
+            status, error = worker.conn.execute("SELECT status, error FROM ingest_jobs WHERE id=?",
+                                                (job_id,)).fetchone()
+            if status == "done":
+                row = worker.conn.execute("SELECT log FROM uploads WHERE id=?", (upload_id,)).fetchone()
+                return json.loads(row[0])
+            if status == "failed":
+                raise RuntimeError(f"ingest job {job_id} failed:\n{error}")
+            time.sleep(poll_s)
+    finally:
+        worker.close()
+
+
+def start_embedded(store_dir: str = STORE_DIR) -> threading.Event:
+    """Worker chạy trong thread của tiến trình API (INGEST_WORKER_EMBEDDED=1); set() event trả về để dừng."""
+    stop = threading.Event()
+
+    def _main():
+        worker = IngestWorker(store_dir)
+        try:
+            worker.run_forever(stop)
+        finally:
+            worker.close()
+
+    threading.Thread(target=_main, name="ingest-worker", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store-dir", default=STORE_DIR, help="directory for FAISS/SQLite (chứa cả hàng đợi job)")
+    ap.add_argument("--once", action="store_true", help="chạy hết job đang chờ rồi thoát")
+    ap.add_argument("--poll", type=float, default=INGEST_POLL_INTERVAL, help="chu kỳ poll (giây)")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    w = IngestWorker(args.store_dir)
+    try:
+        if args.once:
+            print(f"processed {w.run_once()} job(s)")
+        else:
+            w.run_forever(poll_s=args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        w.close()
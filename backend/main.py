@@ -1,6 +1,9 @@
 # backend/main.py
 from __future__ import annotations
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -19,7 +22,32 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 FRONT_USER   = PROJECT_ROOT / "frontend" / "user"
 FRONT_ADMIN  = PROJECT_ROOT / "frontend" / "admin"
 
-app = FastAPI(title="TMU Weekly Bot", version="1.0.0")
+# ===============
+# Startup warm-up
+# ===============
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nạp model embedding + FAISS + lịch trước khi nhận request (tránh cold start ở câu hỏi đầu)
+    try:
+        from backend.rag.settings import WARMUP_ON_STARTUP
+        if WARMUP_ON_STARTUP:
+            from backend.rag.service import warm_up
+            await asyncio.to_thread(warm_up)
+    except Exception:
+        # store chưa build / thiếu key: user_api sẽ báo lỗi khi có request
+        logging.getLogger(__name__).exception("RAG warm-up skipped")
+    # worker ingest trong tiến trình API chỉ khi bật rõ ràng; mặc định chạy riêng: python -m backend.ingest.worker
+    stop_worker = None
+    from backend.rag.settings import INGEST_WORKER_EMBEDDED
+    if INGEST_WORKER_EMBEDDED:
+        from backend.api.admin_api import STORE_DIR
+        from backend.ingest.worker import start_embedded
+        stop_worker = start_embedded(STORE_DIR)
+    yield
+    if stop_worker:
+        stop_worker.set()
+
+app = FastAPI(title="TMU Weekly Bot", version="1.0.0", lifespan=lifespan)
 
 # ===== CORS =====
 ALLOW_ORIGINS = [
@@ -1,2 +1,7 @@
 # rag/__init__.py
-from .service import ask, Ask
\ No newline at end of file
+# Import trễ: ingest/admin dùng rag.db, rag.parser mà không kéo theo service (cần store đã build).
+def __getattr__(name):
+    if name in ("ask", "Ask"):
+        from . import service
+        return getattr(service, name)
+    raise AttributeError(name)
\ No newline at end of file
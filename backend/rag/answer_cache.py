@@ -0,0 +1,143 @@
+# rag/answer_cache.py — cache câu trả lời đặt trước service.ask
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .io_store import store_generation, embed_query
+from .settings import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SEMANTIC_THRESHOLD
+from .normalize import RE_DOW_FOLDED, RE_RELATIVE_FOLDED, dow_key, fold
+from .query_parser import ParsedQuery, parse_query
+from .textkit import normalize_question
+
+# buổi trong ngày ở dạng fold (câu không dấu: parse_query chỉ nhận "sáng/chiều..." có dấu)
+_RE_PART_FOLDED = re.compile(r"\b(?:sang|trua|chieu|toi)\b")
+# từ gợi ý lịch ở dạng fold: câu có dấu bị nhánh hint/ngày của parse_query ăn, câu không dấu thì còn
+# nằm trong keywords → bỏ ra để "co hop khong" và "có họp không" cùng chữ ký
+_HINT_WORDS = frozenset("lich hop cong tac su kien ke hoach ngay gio dia diem thu hom nay mai tuan thang".split())
+
+def _signature(qn: str, pq: ParsedQuery) -> Tuple:
+    """
+    Các token quyết định ngữ nghĩa lịch; câu gần-trùng phải khớp y hệt phần này: số, thứ, ngày tương đối
+    (tính trên dạng fold nên "hom nay" / "hôm nay" như nhau và khác "ngay mai"), buổi, cùng khung giờ,
+    địa điểm và từ khoá mà planner lọc theo — "sáng thứ 5" ≠ "chiều thứ 5", "EMBA" ≠ "BGH".
+    pq = parse_query của chính câu hỏi, dùng lại bản service đã parse để route.
+    """
+    t = fold(qn)
+    parts = tuple(_RE_PART_FOLDED.findall(t))
+    return (
+        tuple(re.findall(r"\d+", t)),
+        tuple(dow_key(m.group(0)) for m in RE_DOW_FOLDED.finditer(t)),
+        tuple(" ".join(m.group(0).split()) for m in RE_RELATIVE_FOLDED.finditer(t)),
+        parts,
+        (pq.t_from, pq.t_to),
+        pq.location,
+        tuple(sorted(set(pq.keywords) - _HINT_WORDS - set(parts))),
+    )
+
+class AnswerCache:
+    """
+    2 tầng:
+      - exact: khoá = normalize_question(q), LRU + TTL
+      - gần-trùng (tuỳ chọn): cosine embedding >= ngưỡng và cùng _signature
+        (để "Thứ 5 có gì" không trả nhầm câu trả lời của "Thứ 6 có gì")
+    Khoá kèm ngày hiện tại (câu hỏi "hôm nay/ngày mai" đổi nghĩa qua ngày) và toàn bộ cache
+    bị xoá khi ingest công bố generation mới.
+    """
+
+    def __init__(self, max_items: int, ttl_sec: float, semantic_threshold: float = 0.0):
+        self.max_items = max(int(max_items), 1)
+        self.ttl_sec = ttl_sec
+        self.semantic_threshold = semantic_threshold
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, Dict, Tuple, Optional[np.ndarray]]]" = OrderedDict()
+        self._generation = store_generation()
+        self.hits = self.semantic_hits = self.misses = self.invalidations = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold > 0
+
+    def _key(self, q: str) -> str:
+        return f"{date.today().isoformat()}|{normalize_question(q)}"
+
+    def _check_generation(self) -> None:
+        gen = store_generation()
+        if gen != self._generation:
+            self._items.clear()
+            self._generation = gen
+            self.invalidations += 1
+
+    def _alive(self, entry) -> bool:
+        return time.monotonic() - entry[0] <= self.ttl_sec
+
+    def get(self, q: str) -> Optional[Dict]:
+        key = self._key(q)
+        with self._lock:
+            self._check_generation()
+            entry = self._items.get(key)
+            if entry and self._alive(entry):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._items[key]
+            if not self.semantic_enabled:
+                self.misses += 1
+        return None
+
+    def embed(self, q: str) -> np.ndarray:
+        return embed_query(q)
+
+    def get_similar(self, q: str, vec: np.ndarray, pq: Optional[ParsedQuery] = None) -> Optional[Dict]:
+        """Tầng gần-trùng; gọi sau get() trả None (vec = self.embed(q), tính ngoài event loop)."""
+        sig = _signature(normalize_question(q), pq or parse_query(q))
+        today = f"{date.today().isoformat()}|"
+        best, best_score = None, self.semantic_threshold
+        with self._lock:
+            self._check_generation()
+            for key, entry in self._items.items():
+                if (entry[3] is None or entry[2] != sig or not key.startswith(today)
+                        or not self._alive(entry)):
+                    continue
+                score = float(np.dot(entry[3], vec))
+                if score >= best_score:
+                    best, best_score = key, score
+            if best is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(best)
+            self.semantic_hits += 1
+            return self._items[best][1]
+
+    def put(self, q: str, result: Dict, vec: Optional[np.ndarray] = None, pq: Optional[ParsedQuery] = None) -> None:
+        key = self._key(q)
+        # chữ ký chỉ tầng gần-trùng dùng (entry có vec): không bật tầng đó thì khỏi tách câu hỏi lần nữa
+        sig = _signature(normalize_question(q), pq or parse_query(q)) if self.semantic_enabled and vec is not None else None
+        with self._lock:
+            self._check_generation()
+            self._items[key] = (time.monotonic(), result, sig, vec)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_items": self.max_items,
+            "ttl_sec": self.ttl_sec,
+            "generation": self._generation,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SEMANTIC_THRESHOLD)
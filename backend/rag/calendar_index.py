@@ -0,0 +1,130 @@
+# rag/calendar_index.py — lịch dựng sẵn trong bộ nhớ cho các intent tất định (ngày/thứ/cả tuần)
+from __future__ import annotations
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .db import read_conn
+from .io_store import store_generation
+from .settings import SQLITE_PATH
+from .normalize import dow_key, event_norm, iso_date, normalize_text
+from .textkit import TimeIndex, with_minutes
+
+_EVENT_COLS = ("id", "text", "date", "dow", "start", "end", "location", "participants", "title", "raw")
+# cột tính sẵn lúc ingest (rag/normalize.py); store cũ chưa có thì tính lúc dựng lịch
+_NORM_COLS = ("norm", "dow_key")
+_DATE_COLS = ("date_iso", "start_min", "end_min")
+_RE_WORD = re.compile(r"\w+")
+
+def _event_sort_key(ev: Dict):
+    # giống ORDER BY của get_events_by_date: không giờ xếp cuối, rồi start, rồi id
+    start = ev.get("start")
+    return (1 if not (start or "").strip() else 0, start or "", ev.get("id") or 0)
+
+class ScheduleCalendar:
+    """
+    Ảnh chụp bảng chunks tại một generation:
+      - by_date:      'dd/mm/yyyy' -> events (đã sắp như get_events_by_date)
+      - by_dow:       khoá thứ (normalize.dow_key: thu2..thu7, cn) -> các ngày
+      - by_month_day: (tháng, ngày) -> các ngày
+      - ngày theo thứ tự ISO (cột date_iso) cho truy vấn khoảng ngày
+      - TimeIndex theo từng ngày + cho cả tuần (event mang sẵn start_min/end_min)
+      - tập từ của cột norm + địa điểm đã chuẩn hoá theo id, cho planner lọc từ khoá/địa điểm
+    Thứ tự ngày = thứ tự xuất hiện đầu tiên theo id (như SELECT DISTINCT cũ).
+    Event dict dùng chung giữa các request: chỉ đọc, không sửa tại chỗ.
+    """
+
+    def __init__(self, events: List[Dict], generation: int = 0):
+        self.generation = generation
+        self.by_date: Dict[str, List[Dict]] = {}
+        self.by_dow: Dict[str, List[str]] = {}
+        self.by_month_day: Dict[Tuple[int, int], List[str]] = {}
+        # giữ ngoài event dict vì event được trả nguyên vào "hits" (phải serialize được)
+        self._words: Dict[int, frozenset] = {}
+        self._location: Dict[int, str] = {}
+        for ev in events:
+            ds = ev.get("date")
+            if not ds:
+                continue
+            self._words[ev["id"]] = frozenset(_RE_WORD.findall(ev.get("norm") or ""))
+            self._location[ev["id"]] = normalize_text(ev.get("location") or "")
+            day = self.by_date.get(ds)
+            if day is None:
+                day = self.by_date[ds] = []
+                try:
+                    dd, mm, _yy = ds.split("/")
+                    self.by_month_day.setdefault((int(mm), int(dd)), []).append(ds)
+                except ValueError:
+                    pass
+            day.append(ev if "start_min" in ev else with_minutes(ev))
+            key = ev.get("dow_key") or dow_key(ev.get("dow") or "")
+            if key:
+                dates = self.by_dow.setdefault(key, [])
+                if ds not in dates:
+                    dates.append(ds)
+        for day in self.by_date.values():
+            day.sort(key=_event_sort_key)
+        self.dates: List[str] = list(self.by_date)
+        self._time_by_date = {ds: TimeIndex(evs) for ds, evs in self.by_date.items()}
+        self._week_time = TimeIndex([ev for ds in self.dates for ev in self.by_date[ds]])
+
+    def events_on(self, date_str: str) -> List[Dict]:
+        return self.by_date.get(date_str, [])
+
+    def events_at(self, date_str: str, t_from: str, t_to: Optional[str] = None) -> List[Dict]:
+        """Như filter_events_by_time(events_on(date_str), ...) nhưng tra qua TimeIndex."""
+        idx = self._time_by_date.get(date_str)
+        return idx.query(t_from, t_to) if idx else []
+
+    def events_at_across_week(self, t_from: str, t_to: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """Các event trùng khung giờ trên mọi ngày, nhóm theo ngày (thứ tự như self.dates)."""
+        grouped: Dict[str, List[Dict]] = {}
+        for ev in self._week_time.query(t_from, t_to):
+            grouped.setdefault(ev["date"], []).append(ev)
+        return grouped
+
+    def dates_for_month_day(self, day: int, month: int) -> List[str]:
+        return self.by_month_day.get((month, day), [])
+
+    def dates_for_dow(self, key: Optional[str]) -> List[str]:
+        """key = normalize.dow_key(...) của câu hỏi ('thu5', 'cn')."""
+        return self.by_dow.get(key, []) if key else []
+
+    def event_words(self, ev: Dict) -> frozenset:
+        """Các từ (đã chuẩn hoá) của title/participants/location/raw."""
+        return self._words.get(ev.get("id"), frozenset())
+
+    def event_location(self, ev: Dict) -> str:
+        return self._location.get(ev.get("id"), "")
+
+def _load_calendar(generation: int) -> ScheduleCalendar:
+    cur = read_conn(SQLITE_PATH).cursor()
+    have = {r[1] for r in cur.execute("PRAGMA table_info(chunks)")}
+    cols = _EVENT_COLS + tuple(c for c in _NORM_COLS + _DATE_COLS if c in have)
+    cur.execute(f"SELECT {','.join(cols)} FROM chunks ORDER BY id")
+    events = []
+    for r in cur.fetchall():
+        ev = dict(zip(cols, r))
+        if ev.get("norm") is None:
+            ev["norm"] = event_norm(ev)
+        if ev.get("date_iso") is None:
+            # chưa backfill (hoặc ngày sai định dạng): tính như lúc ingest
+            ev["date_iso"] = iso_date(ev.get("date"))
+            with_minutes(ev)
+        events.append(ev)
+    return ScheduleCalendar(events, generation)
+
+_calendar: Optional[ScheduleCalendar] = None
+_build_lock = threading.Lock()
+
+def get_calendar() -> ScheduleCalendar:
+    """Lịch của generation hiện tại; chỉ đọc SQLite lại khi ingest công bố generation mới."""
+    global _calendar
+    gen = store_generation()
+    cal = _calendar
+    if cal is not None and cal.generation == gen:
+        return cal
+    with _build_lock:
+        if _calendar is None or _calendar.generation != gen:
+            _calendar = _load_calendar(gen)
+        return _calendar
@@ -0,0 +1,140 @@
+# rag/context_packer.py — gói các hit RAG thành ngữ cảnh gọn cho prompt + thống kê kích thước/độ trễ prompt
+from __future__ import annotations
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .normalize import normalize_text
+from .settings import CONTEXT_MIN_SCORE_RATIO, CONTEXT_TOKEN_BUDGET
+
+_RE_WORD = re.compile(r"[^\W\d_]+")
+# raw thường chỉ là dòng gốc "8h00 <tiêu đề> tại <địa điểm>"; chỉ giữ khi có thêm ≥ N từ mới
+_RAW_MIN_EXTRA_WORDS = 3
+
+def estimate_tokens(s: str) -> int:
+    """Ước lượng số token (~3 ký tự/token với tiếng Việt có dấu); đủ để giữ ngân sách, không cần tokenizer."""
+    return (len(s) + 2) // 3
+
+def _date_key(ds: str):
+    try:
+        d, m, y = ds.split("/")
+        return (0, int(y), int(m), int(d))
+    except (ValueError, AttributeError):
+        return (1, 0, 0, 0)
+
+def _raw_extra(h: Dict) -> Optional[str]:
+    raw = (h.get("raw") or "").strip()
+    if not raw:
+        return None
+    known = set(_RE_WORD.findall(normalize_text(" ".join(
+        h.get(k) or "" for k in ("title", "location", "participants", "dow")))))
+    extra = [w for w in _RE_WORD.findall(normalize_text(raw)) if w not in known]
+    return raw if len(extra) >= _RAW_MIN_EXTRA_WORDS else None
+
+def _event_line(h: Dict) -> str:
+    """1 dòng/1 event: mỗi trường 1 lần (text của chunk vốn lặp lại đúng các trường này nên bỏ)."""
+    start, end = (h.get("start") or "").strip(), (h.get("end") or "").strip()
+    when = f"{start}–{end}" if start and end else (start or "Cả ngày")
+    parts = [when, (h.get("title") or "").strip() or "(không tiêu đề)"]
+    if h.get("location"):
+        parts.append(f"Địa điểm: {h['location'].strip()}")
+    if h.get("participants"):
+        parts.append(f"TP: {h['participants'].strip()}")
+    line = "- " + " | ".join(parts)
+    raw = _raw_extra(h)
+    if raw:
+        line += f"\n  Nguyên văn: {raw}"
+    return line
+
+def pack_contexts(hits: List[Dict], budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+                  min_score_ratio: float = CONTEXT_MIN_SCORE_RATIO) -> Tuple[str, List[Dict]]:
+    """
+    (khối ngữ cảnh, các hit được giữ). hits đã sắp theo score giảm dần (hybrid_search):
+      - bỏ hit có cosine (dense_score) < min_score_ratio * cosine cao nhất; điểm RRF chỉ phản ánh
+        thứ hạng, chênh nhau quá ít để cắt theo tỉ lệ. Hit chỉ khớp BM25 (không có dense_score) được giữ;
+        hits không mang dense_score (vector_search) thì so trên score;
+      - lấy lần lượt tới khi hết budget_tokens (luôn giữ ít nhất 1 hit);
+      - trình bày nhóm theo ngày (tăng dần), trong ngày theo giờ bắt đầu.
+    """
+    if not hits:
+        return "", []
+    key = "dense_score" if any("dense_score" in h for h in hits) else "score"
+    top = max((h.get(key) or 0.0) for h in hits if key in h)
+    floor = top * min_score_ratio if top > 0 else None
+    kept: List[Tuple[Dict, str]] = []
+    used = 0
+    for h in hits:
+        if floor is not None and key in h and (h[key] or 0.0) < floor:
+            continue
+        line = _event_line(h)
+        cost = estimate_tokens(line) + 1
+        if kept and used + cost > budget_tokens:
+            continue
+        kept.append((h, line))
+        used += cost
+
+    by_date: Dict[str, List[Tuple[Dict, str]]] = {}
+    for h, line in kept:
+        by_date.setdefault(h.get("date") or "", []).append((h, line))
+    blocks = []
+    for ds in sorted(by_date, key=_date_key):
+        rows = sorted(by_date[ds], key=lambda x: (x[0].get("start") or "99:99", x[0].get("id") or 0))
+        dow = rows[0][0].get("dow")
+        head = f"[{ds}{', ' + dow if dow else ''}]" if ds else "[Không rõ ngày]"
+        blocks.append(head + "\n" + "\n".join(line for _, line in rows))
+    return "\n\n".join(blocks), [h for h, _ in kept]
+
+class PromptStats:
+    """Bộ đếm kích thước prompt / độ trễ các lời gọi RAG trong tiến trình (xem /api/admin/prompt)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_chars = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.contexts_in = 0
+        self.contexts_kept = 0
+        self.retrieve_ms = 0.0
+        self.llm_ms = 0.0
+        self.last: Dict = {}
+
+    def record(self, prompt: str, contexts_in: int, contexts_kept: int,
+               retrieve_ms: float, llm_ms: float) -> Dict:
+        row = {
+            "prompt_chars": len(prompt),
+            "prompt_tokens": estimate_tokens(prompt),
+            "contexts_in": contexts_in,
+            "contexts_kept": contexts_kept,
+            "retrieve_ms": round(retrieve_ms, 1),
+            "llm_ms": round(llm_ms, 1),
+        }
+        with self._lock:
+            self.requests += 1
+            self.prompt_chars += row["prompt_chars"]
+            self.prompt_tokens += row["prompt_tokens"]
+            self.max_prompt_tokens = max(self.max_prompt_tokens, row["prompt_tokens"])
+            self.contexts_in += contexts_in
+            self.contexts_kept += contexts_kept
+            self.retrieve_ms += retrieve_ms
+            self.llm_ms += llm_ms
+            self.last = row
+        return row
+
+    def stats(self) -> Dict:
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "token_budget": CONTEXT_TOKEN_BUDGET,
+            "min_score_ratio": CONTEXT_MIN_SCORE_RATIO,
+            "avg_prompt_chars": round(self.prompt_chars / n, 1),
+            "avg_prompt_tokens": round(self.prompt_tokens / n, 1),
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "avg_contexts_in": round(self.contexts_in / n, 2),
+            "avg_contexts_kept": round(self.contexts_kept / n, 2),
+            "avg_retrieve_ms": round(self.retrieve_ms / n, 1),
+            "avg_llm_ms": round(self.llm_ms / n, 1),
+            "last": self.last,
+        }
+
+prompt_stats = PromptStats()
@@ -0,0 +1,116 @@
+# rag/date_range.py — quy các cụm ngày tương đối / khoảng ngày trong câu hỏi về [ngày đầu, ngày cuối]
+from __future__ import annotations
+import calendar
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+DateRange = Tuple[date, date, str]   # (từ, đến, nhãn hiển thị)
+
+_NEXT, _THIS, _PREV = 1, 0, -1
+# từ chỉ hướng sau "tuần/tháng/cuối tuần" → độ lệch so với hiện tại
+_OFFSETS: Dict[str, int] = {
+    "": _THIS, "này": _THIS, "nay": _THIS,
+    "sau": _NEXT, "tới": _NEXT, "kế tiếp": _NEXT, "tiếp theo": _NEXT,
+    "trước": _PREV, "rồi": _PREV, "qua": _PREV,
+}
+_WEEK_NAMES = {_THIS: "tuần này", _NEXT: "tuần sau", _PREV: "tuần trước"}
+_MONTH_NAMES = {_THIS: "tháng này", _NEXT: "tháng sau", _PREV: "tháng trước"}
+_RELATIVE_DAYS = {"hôm qua": -1, "hôm kia": -2, "ngày kia": 2, "ngày mốt": 2}
+# "N ngày tới" nhìn về sau, "N ngày qua" nhìn về trước
+_FORWARD = {"tới", "sắp tới", "tiếp theo", "sau"}
+
+def _fmt(d: date) -> str:
+    return d.strftime("%d/%m/%Y")
+
+def _label(name: str, start: date, end: date) -> str:
+    span = _fmt(start) if start == end else f"{_fmt(start)}–{_fmt(end)}"
+    return f"{name} (**{span}**)"
+
+def _offset(word: Optional[str]) -> int:
+    return _OFFSETS.get(" ".join((word or "").split()), _THIS)
+
+def week(today: date, word: Optional[str] = None) -> DateRange:
+    """Tuần Thứ 2 → Chủ nhật chứa hôm nay, dời theo 'sau/trước'."""
+    off = _offset(word)
+    start = today - timedelta(days=today.weekday()) + timedelta(weeks=off)
+    end = start + timedelta(days=6)
+    return start, end, _label(_WEEK_NAMES[off], start, end)
+
+def weekend(today: date, word: Optional[str] = None) -> DateRange:
+    start, end, _ = week(today, word)
+    sat = start + timedelta(days=5)
+    name = "cuối " + _WEEK_NAMES[_offset(word)]
+    return sat, end, _label(name, sat, end)
+
+def month(today: date, word: Optional[str] = None, month_no: Optional[int] = None,
+          year: Optional[int] = None) -> Optional[DateRange]:
+    """'tháng này/sau/trước' hoặc 'tháng 8 (năm 2025)' (không có năm → năm nay)."""
+    if month_no is None:
+        off = _offset(word)
+        y, m = divmod(today.year * 12 + today.month - 1 + off, 12)
+        m += 1
+        name = _MONTH_NAMES[off]
+    else:
+        y, m = year or today.year, month_no
+        if not 1 <= m <= 12:
+            return None
+        name = f"tháng {m}/{y}"
+    start = date(y, m, 1)
+    end = date(y, m, calendar.monthrange(y, m)[1])
+    return start, end, _label(name, start, end)
+
+def next_days(today: date, n: int, direction: str) -> Optional[DateRange]:
+    """N ngày tính cả hôm nay: '3 ngày tới' = hôm nay → +2 ngày; '3 ngày qua' = -2 ngày → hôm nay."""
+    if n <= 0 or n > 366:
+        return None
+    direction = " ".join(direction.split())
+    if direction in _FORWARD:
+        start, end = today, today + timedelta(days=n - 1)
+    else:
+        start, end = today - timedelta(days=n - 1), today
+    return start, end, _label(f"{n} ngày {direction}", start, end)
+
+def relative_day(today: date, phrase: str) -> Optional[DateRange]:
+    delta = _RELATIVE_DAYS.get(" ".join(phrase.split()))
+    if delta is None:
+        return None
+    d = today + timedelta(days=delta)
+    return d, d, _label(" ".join(phrase.split()), d, d)
+
+def _has_year(s: str) -> bool:
+    return len(s.replace("-", "/").split("/")) > 2
+
+def parse_day(s: str, year: int) -> Optional[date]:
+    """'dd/mm', 'dd/mm/yy', 'dd/mm/yyyy'; không có năm thì dùng year."""
+    parts = s.replace("-", "/").split("/")
+    try:
+        d, m = int(parts[0]), int(parts[1])
+        y = int(parts[2]) if len(parts) > 2 else year
+        return date(y + 2000 if y < 100 else y, m, d)
+    except (ValueError, IndexError):
+        return None
+
+def span(today: date, a: str, b: str) -> Optional[DateRange]:
+    """
+    'từ 20/08 đến 25/08/2025' — đầu nào thiếu năm thì mượn năm của đầu kia, cả hai thiếu → năm nay;
+    ngược chiều thì đầu thiếu năm lùi/tiến 1 năm, chỉ đổi chỗ khi cả hai đều ghi năm.
+    """
+    year = today.year
+    for s in (a, b):
+        d = parse_day(s, year) if _has_year(s) else None
+        if d:
+            year = d.year
+    start, end = parse_day(a, year), parse_day(b, year)
+    if not start or not end:
+        return None
+    if end < start:
+        if not _has_year(b):
+            # "từ 28/12(/2024) đến 02/01": đầu sau thiếu năm → sang năm kế tiếp
+            end = parse_day(b, year + 1) or end
+        elif not _has_year(a):
+            # "từ 28/12 đến 02/01/2025": đầu trước thiếu năm → năm trước đó
+            start = parse_day(a, year - 1) or start
+        else:
+            # cả hai có năm mà ngược chiều: người hỏi gõ đảo thứ tự
+            start, end = end, start
+    return start, end, f"từ **{_fmt(start)}** đến **{_fmt(end)}**"
@@ -0,0 +1,41 @@
+# rag/db.py — lớp kết nối SQLite dùng chung cho đường đọc (chat) và đường ghi (ingest/admin)
+from __future__ import annotations
+import sqlite3
+import threading
+
+from .settings import SQLITE_MMAP_SIZE, SQLITE_CACHE_KB, SQLITE_BUSY_TIMEOUT_MS
+
+_local = threading.local()
+
+def read_conn(path: str) -> sqlite3.Connection:
+    """
+    Kết nối chỉ-đọc, mỗi thread giữ 1 kết nối cho mỗi file và dùng lại giữa các request.
+    Không đóng kết nối này; SELECT chạy autocommit nên mỗi lần đọc đều thấy bản commit mới nhất.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        # cached_statements: sqlite3 giữ sẵn prepared statement theo câu SQL trên kết nối này
+        conn = sqlite3.connect(path, cached_statements=256)
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conns[path] = conn
+    return conn
+
+def write_conn(path: str) -> sqlite3.Connection:
+    """
+    Kết nối ghi (ingest/admin), người gọi tự đóng.
+    Bật WAL (lưu bền trong file DB) để reader không bị chặn khi ingest đang commit.
+    """
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # INSERT OR REPLACE xoá dòng trùng ngầm; cần bật để trigger đồng bộ chunks_fts vẫn chạy
+    conn.execute("PRAGMA recursive_triggers=ON")
+    return conn
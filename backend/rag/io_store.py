@@ -1,66 +1,399 @@
 # rag/io_store.py
 from __future__ import annotations
+import json
+import logging
+import os
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import faiss, numpy as np
-from functools import lru_cache
 
-from .settings import SQLITE_PATH, FAISS_PATH, LOCAL_EMB_MODEL
+from .db import read_conn
+from .models import get_embedder
+from .settings import (
+    SQLITE_PATH, FAISS_PATH, LOCAL_EMB_MODEL, INDEX_RELOAD_INTERVAL, QUERY_EMB_CACHE_SIZE,
+    RETRIEVAL_WINDOW_DAYS, RETRIEVAL_RECENCY_HALF_LIFE_DAYS, FAISS_NPROBE, FAISS_HNSW_EF_SEARCH,
+    RETRIEVAL_TOP_K, HYBRID_CANDIDATES, HYBRID_RRF_K,
+    require_serving_store,
+)
+from .normalize import STOPWORDS, fold, iso_date
+from .textkit import normalize_question
+
+require_serving_store()
+log = logging.getLogger(__name__)
 
 # SQLite
-def get_events_by_date(date_str: str) -> List[Dict]:
-    conn = sqlite3.connect(SQLITE_PATH); cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, text, date, dow, start, end, location, participants, title, raw
-        FROM chunks
-        WHERE date = ?
-        ORDER BY 
-            CASE WHEN start IS NULL OR TRIM(start)='' THEN 1 ELSE 0 END,
-            start,
-            id
-        """,
-        (date_str,),
-    )
-    rows = cur.fetchall(); conn.close()
+_EVENT_SELECT = "SELECT id, text, date, dow, start, end, location, participants, title, raw FROM chunks"
+# không giờ xếp cuối, rồi giờ bắt đầu, rồi id
+_EVENT_ORDER = "ORDER BY start_min IS NULL, start_min, id"
+
+def _event_rows(rows) -> List[Dict]:
     return [
         {"id": r[0], "text": r[1], "date": r[2], "dow": r[3], "start": r[4],
          "end": r[5], "location": r[6], "participants": r[7], "title": r[8], "raw": r[9]}
         for r in rows
     ]
 
-def list_all_dates() -> List[str]:
-    conn = sqlite3.connect(SQLITE_PATH); cur = conn.cursor()
-    cur.execute("SELECT DISTINCT date FROM chunks"); dates = [r[0] for r in cur.fetchall() if r[0]]
-    conn.close()
-    return dates
+def get_events_by_date(date_str: str) -> List[Dict]:
+    cur = read_conn(SQLITE_PATH).cursor()
+    iso = iso_date(date_str)
+    try:
+        # idx_chunks_date_start (date_iso, start_min): tra index + thứ tự sẵn, không quét bảng / sort chuỗi
+        cur.execute(f"{_EVENT_SELECT} WHERE date_iso = ? {_EVENT_ORDER}", (iso,))
+    except sqlite3.OperationalError:     # store chưa migrate (chưa chạy ingest mới)
+        cur.execute(
+            f"""{_EVENT_SELECT} WHERE date = ?
+            ORDER BY CASE WHEN start IS NULL OR TRIM(start)='' THEN 1 ELSE 0 END, start, id""",
+            (date_str,),
+        )
+    return _event_rows(cur.fetchall())
 
-def _fetch_all_date_dow_pairs() -> List[Tuple[str, str]]:
-    conn = sqlite3.connect(SQLITE_PATH); cur = conn.cursor()
-    cur.execute("SELECT DISTINCT date, dow FROM chunks"); pairs = cur.fetchall()
-    conn.close()
-    return [(d, dw) for (d, dw) in pairs if d and dw]
+def get_events_in_range(date_from: date, date_to: date) -> List[Dict]:
+    """Mọi event có ngày trong [date_from, date_to], sắp theo ngày rồi giờ — 1 lần quét khoảng trên index."""
+    cur = read_conn(SQLITE_PATH).cursor()
+    bounds = (date_from.isoformat(), date_to.isoformat())
+    try:
+        cur.execute(
+            f"{_EVENT_SELECT} WHERE date_iso BETWEEN ? AND ? ORDER BY date_iso, start_min IS NULL, start_min, id",
+            bounds,
+        )
+    except sqlite3.OperationalError:     # store chưa migrate: tính ISO từ chuỗi dd/mm/yyyy (quét bảng)
+        iso = "substr(date,7,4)||'-'||substr(date,4,2)||'-'||substr(date,1,2)"
+        cur.execute(
+            f"""{_EVENT_SELECT} WHERE {iso} BETWEEN ? AND ?
+            ORDER BY {iso}, CASE WHEN start IS NULL OR TRIM(start)='' THEN 1 ELSE 0 END, start, id""",
+            bounds,
+        )
+    return _event_rows(cur.fetchall())
+
+def _read_manifest() -> Tuple[int, str]:
+    """
+    (generation, file FAISS) do ingest công bố cùng 1 transaction trong bảng meta.
+    Store cũ chưa có meta.faiss_file thì dùng FAISS_PATH; chưa có generation thì 0.
+    """
+    try:
+        meta = dict(read_conn(SQLITE_PATH).execute(
+            "SELECT k, v FROM meta WHERE k IN ('generation', 'faiss_file')").fetchall())
+    except sqlite3.OperationalError:
+        meta = {}
+    try:
+        gen = int(meta.get("generation") or 0)
+    except ValueError:
+        gen = 0
+    name = meta.get("faiss_file")
+    return gen, (os.path.join(os.path.dirname(FAISS_PATH), name) if name else FAISS_PATH)
 
 # ---------- FAISS ----------
-_index = faiss.read_index(FAISS_PATH)
+def _inner_index(index: faiss.Index) -> faiss.Index:
+    return faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+
+def _load_index(path: str) -> faiss.Index:
+    """Đọc index (flat / hnsw / ivf_flat / ivf_pq, xem ingest_lib._make_index) và gắn tham số tìm."""
+    index = faiss.read_index(path)
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(FAISS_NPROBE, index.nlist)
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    return index
+
+class _IndexManager:
+    """
+    Giữ FAISS index đang phục vụ kèm generation của nó.
+    Một thread nền theo dõi meta.generation; khi ingest công bố generation mới thì
+    nạp index mới rồi thay cả tuple (generation, index) bằng một phép gán duy nhất.
+    Request chỉ đọc self._current nên không phải chờ khoá và không cần restart.
+    """
+
+    def __init__(self, interval: float):
+        self._interval = max(float(interval), 0.1)
+        gen, path = _read_manifest()
+        self._db_generation = gen
+        self._current: Tuple[int, faiss.Index] = (gen, _load_index(path))
+        threading.Thread(target=self._watch, name="faiss-reloader", daemon=True).start()
+
+    @property
+    def index(self) -> faiss.Index:
+        return self._current[1]
+
+    @property
+    def generation(self) -> int:
+        return self._current[0]
+
+    @property
+    def db_generation(self) -> int:
+        return self._db_generation
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            try:
+                gen, path = _read_manifest()
+                self._db_generation = gen
+                if gen != self._current[0]:
+                    self._current = (gen, _load_index(path))
+                    log.info("FAISS index reloaded: generation=%s ntotal=%s", gen, self._current[1].ntotal)
+            except Exception:
+                log.exception("FAISS reload failed; keep serving generation %s", self._current[0])
+
+_index_mgr = _IndexManager(INDEX_RELOAD_INTERVAL)
+
+def store_generation() -> int:
+    """Generation mới nhất đã thấy trong SQLite (dùng để vô hiệu hoá cache theo ingest)."""
+    return _index_mgr.db_generation
 
-@lru_cache(maxsize=1)
 def _st_model():
-    from sentence_transformers import SentenceTransformer
-    return SentenceTransformer(LOCAL_EMB_MODEL)
+    return get_embedder(LOCAL_EMB_MODEL)
+
+class _QueryEmbeddingCache:
+    """LRU embedding câu hỏi: khoá = normalize_question(q), giá trị = vector float32 (dim,)."""
+
+    def __init__(self, max_items: int):
+        self.max_items = max(int(max_items), 1)
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            v = self._items.get(key)
+            if v is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return v
+
+    def put(self, key: str, vec: np.ndarray) -> None:
+        with self._lock:
+            self._items[key] = vec
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+_query_emb_cache = _QueryEmbeddingCache(QUERY_EMB_CACHE_SIZE)
 
-def vector_search(q: str, k: int = 10) -> List[Dict]:
-    v = _st_model().encode([q], normalize_embeddings=True)
-    D, I = _index.search(np.asarray(v, dtype="float32"), k)
+def embed_query(q: str) -> np.ndarray:
+    """Vector chuẩn hoá (dim,) của câu hỏi; encode 1 lần cho mỗi câu đã chuẩn hoá."""
+    key = normalize_question(q)
+    v = _query_emb_cache.get(key)
+    if v is None:
+        v = np.ascontiguousarray(_st_model().encode([key], normalize_embeddings=True)[0], dtype="float32")
+        v.setflags(write=False)
+        _query_emb_cache.put(key, v)
+    return v
+
+def warm_up() -> None:
+    """Nạp model + chạy 1 lần encode/search để request đầu tiên sau deploy không chịu cold start."""
+    v = np.asarray(_st_model().encode(["khởi động"], normalize_embeddings=True), dtype="float32")
+    if _index_mgr.index.ntotal:
+        _index_mgr.index.search(v, 1)
+
+# ---------- Lọc theo metadata ----------
+def _day_ordinal(date_str: Optional[str]) -> int:
+    try:
+        return datetime.strptime((date_str or "").strip(), "%d/%m/%Y").toordinal()
+    except ValueError:
+        return -1
+
+class _ChunkMeta:
+    """(id, ngày, tag) của mọi chunk tại 1 generation; dựng tập id cho IDSelector mà không chạy SQL mỗi câu hỏi."""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        cur = read_conn(SQLITE_PATH).cursor()
+        try:
+            cur.execute("SELECT id, date, tag FROM chunks")
+        except sqlite3.OperationalError:
+            cur.execute("SELECT id, date, NULL FROM chunks")   # store cũ chưa có cột tag
+        rows = cur.fetchall()
+        self.ids = np.array([r[0] for r in rows], dtype="int64")
+        self.days = np.array([_day_ordinal(r[1]) for r in rows], dtype="int64")
+        self.tags = np.array([r[2] or "" for r in rows], dtype=object)
+
+    def select(self, day_from: Optional[int], day_to: Optional[int], tag: Optional[str]) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        if day_from is not None:
+            mask &= self.days >= day_from
+        if day_to is not None:
+            mask &= (self.days <= day_to) & (self.days >= 0)
+        if tag:
+            mask &= self.tags == tag
+        return self.ids[mask]
+
+_chunk_meta: Optional[_ChunkMeta] = None
+_chunk_meta_lock = threading.Lock()
+
+def _get_chunk_meta() -> _ChunkMeta:
+    global _chunk_meta
+    gen = store_generation()
+    cm = _chunk_meta
+    if cm is not None and cm.generation == gen:
+        return cm
+    with _chunk_meta_lock:
+        if _chunk_meta is None or _chunk_meta.generation != gen:
+            _chunk_meta = _ChunkMeta(gen)
+        return _chunk_meta
+
+def _scope_ids(date_from: Optional[date], date_to: Optional[date],
+               tag: Optional[str]) -> Optional[np.ndarray]:
+    """
+    id các chunk trong phạm vi tìm. Không truyền điều kiện nào thì dùng cửa sổ ±RETRIEVAL_WINDOW_DAYS
+    quanh hôm nay; cửa sổ mặc định rỗng (hoặc tắt) → None = tìm toàn bộ index.
+    """
+    explicit = bool(date_from or date_to or tag)
+    if not explicit:
+        if RETRIEVAL_WINDOW_DAYS <= 0:
+            return None
+        today = date.today()
+        date_from = today - timedelta(days=RETRIEVAL_WINDOW_DAYS)
+        date_to = today + timedelta(days=RETRIEVAL_WINDOW_DAYS)
+    ids = _get_chunk_meta().select(date_from.toordinal() if date_from else None,
+                                   date_to.toordinal() if date_to else None, tag)
+    if not len(ids) and not explicit:
+        return None
+    return ids
+
+def _scoped_search(index: faiss.Index, v: np.ndarray, k: int,
+                   ids: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    if ids is None:
+        return index.search(v, k)
+    if isinstance(_inner_index(index), faiss.IndexHNSW):
+        # đồ thị HNSW + bộ lọc hẹp dễ trả về rỗng → chấm điểm chính xác đúng các vector trong phạm vi
+        known = ids[np.isin(ids, faiss.vector_to_array(index.id_map))]
+        scores = index.reconstruct_batch(known) @ v[0] if len(known) else np.zeros(0, dtype="float32")
+        top = np.argsort(-scores)[:k]
+        return scores[top][None, :], known[top][None, :]
+    sel = faiss.IDSelectorBatch(ids)
+    if isinstance(index, faiss.IndexIVF):
+        # quét mọi list nhưng chỉ tính khoảng cách cho id trong phạm vi (nprobe nhỏ dễ bỏ sót)
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=index.nlist)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return index.search(v, k, params=params)
+
+def _apply_recency(hits: List[Dict]) -> List[Dict]:
+    """score *= 0.5^(|ngày - hôm nay| / half_life); event không rõ ngày giữ nguyên score."""
+    today = date.today().toordinal()
+    for h in hits:
+        day = _day_ordinal(h.get("date"))
+        if day >= 0:
+            h["score"] *= 0.5 ** (abs(day - today) / RETRIEVAL_RECENCY_HALF_LIFE_DAYS)
+    hits.sort(key=lambda h: h["score"], reverse=True)
+    return hits
+
+_HYDRATE_COLS = "id,text,date,dow,start,end,location,participants,title,raw"
+
+def _hydrate(cur: sqlite3.Cursor, ids: List[int], scores: List[float]) -> List[Dict]:
+    """Lấy toàn bộ hit bằng 1 truy vấn IN (...), giữ nguyên thứ hạng + score của FAISS."""
+    hits = [(int(i), float(s)) for i, s in zip(ids, scores) if int(i) >= 0]
+    if not hits:
+        return []
+    uniq = list(dict.fromkeys(i for i, _ in hits))
+    cur.execute(
+        f"SELECT {_HYDRATE_COLS} FROM chunks WHERE id IN ({','.join('?' * len(uniq))})",
+        uniq,
+    )
+    by_id = {r[0]: r for r in cur.fetchall()}
     rows = []
-    conn = sqlite3.connect(SQLITE_PATH); cur = conn.cursor()
-    for idx, score in zip(I[0].tolist(), D[0].tolist()):
-        cur.execute("""SELECT id,text,date,dow,start,end,location,participants,title,raw 
-                       FROM chunks WHERE id=?""", (int(idx),))
-        r = cur.fetchone()
+    for idx, score in hits:
+        r = by_id.get(idx)
         if r:
             rows.append({"id": r[0], "text": r[1], "date": r[2], "dow": r[3], "start": r[4],
                          "end": r[5], "location": r[6], "participants": r[7], "title": r[8],
-                         "raw": r[9], "score": float(score)})
-    conn.close()
-    return rows
\ No newline at end of file
+                         "raw": r[9], "score": score})
+    return rows
+
+def vector_search(q: str, k: int = 10, date_from: Optional[date] = None,
+                  date_to: Optional[date] = None, tag: Optional[str] = None) -> List[Dict]:
+    """
+    Top-k theo cosine trong phạm vi metadata (khoảng ngày / tag upload, xem _scope_ids)
+    thay vì toàn bộ các tuần đã từng ingest; bật RETRIEVAL_RECENCY_HALF_LIFE_DAYS để ưu tiên lịch gần hôm nay.
+    """
+    ids = _scope_ids(date_from, date_to, tag)
+    if ids is not None and not len(ids):
+        return []
+    return _vector_hits(q, k, ids)
+
+def _vector_hits(q: str, k: int, ids: Optional[np.ndarray]) -> List[Dict]:
+    recency = RETRIEVAL_RECENCY_HALF_LIFE_DAYS > 0
+    fetch = k * 3 if recency else k          # lấy dư để xếp hạng lại theo độ gần
+    if ids is not None:
+        fetch = min(fetch, len(ids))
+    v = embed_query(q).reshape(1, -1)
+    D, I = _scoped_search(_index_mgr.index, v, fetch, ids)
+    hits = _hydrate(read_conn(SQLITE_PATH).cursor(), I[0].tolist(), D[0].tolist())
+    return _apply_recency(hits)[:k] if recency else hits
+
+# ---------- FTS5 / BM25 ----------
+_RE_FTS_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def _fts_query(q: str) -> str:
+    """Câu hỏi → biểu thức MATCH: các token (đã bỏ dấu để so stopword) nối bằng OR, mỗi token trong ngoặc kép."""
+    terms = []
+    for tok in _RE_FTS_TOKEN.findall(q.lower()):
+        plain = fold(tok)
+        if plain in STOPWORDS or (len(plain) < 2 and not plain.isdigit()):
+            continue
+        if tok not in terms:
+            terms.append(tok)
+    return " OR ".join(f'"{t}"' for t in terms[:16])
+
+def _lexical_hits(q: str, k: int, ids: Optional[np.ndarray]) -> List[Dict]:
+    match = _fts_query(q)
+    if not match:
+        return []
+    cur = read_conn(SQLITE_PATH).cursor()
+    # trọng số cột: title > participants = location > raw
+    sql = ("SELECT rowid, bm25(chunks_fts, 2.0, 1.5, 1.5, 1.0) AS s FROM chunks_fts "
+           "WHERE chunks_fts MATCH ?")
+    params: list = [match]
+    if ids is not None:
+        sql += " AND rowid IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(ids.tolist()))
+    try:
+        cur.execute(sql + " ORDER BY s LIMIT ?", (*params, k))
+        rows = cur.fetchall()
+    except sqlite3.OperationalError:
+        return []       # store cũ / SQLite không có FTS5
+    # bm25() càng âm càng khớp → đổi dấu làm score
+    return _hydrate(cur, [r[0] for r in rows], [-r[1] for r in rows])
+
+def lexical_search(q: str, k: int = 10, date_from: Optional[date] = None,
+                   date_to: Optional[date] = None, tag: Optional[str] = None) -> List[Dict]:
+    """Top-k BM25 trên chunks_fts (title/participants/location/raw), cùng phạm vi như vector_search."""
+    ids = _scope_ids(date_from, date_to, tag)
+    if ids is not None and not len(ids):
+        return []
+    return _lexical_hits(q, k, ids)
+
+def hybrid_search(q: str, k: int = RETRIEVAL_TOP_K, date_from: Optional[date] = None,
+                  date_to: Optional[date] = None, tag: Optional[str] = None) -> List[Dict]:
+    """
+    Ghép FAISS (ngữ nghĩa) và BM25 (tên riêng, viết tắt như "EMBA", "BGH", tên phòng) bằng
+    reciprocal rank fusion: score = Σ 1 / (HYBRID_RRF_K + hạng). Trả ít đoạn hơn nhưng trúng hơn.
+    Hit có mặt ở nhánh vector mang thêm dense_score = cosine (sau recency decay nếu bật).
+    """
+    ids = _scope_ids(date_from, date_to, tag)
+    if ids is not None and not len(ids):
+        return []
+    dense = _vector_hits(q, HYBRID_CANDIDATES, ids)
+    fused: Dict[int, Dict] = {}
+    for hits in (dense, _lexical_hits(q, HYBRID_CANDIDATES, ids)):
+        for rank, h in enumerate(hits, start=1):
+            f = fused.get(h["id"])
+            if f is None:
+                f = fused[h["id"]] = dict(h, score=0.0)
+            f["score"] += 1.0 / (HYBRID_RRF_K + rank)
+    # cosine của nhánh vector: context_packer lọc theo nó (RRF chỉ phản ánh thứ hạng)
+    for h in dense:
+        fused[h["id"]]["dense_score"] = h["score"]
+    return sorted(fused.values(), key=lambda h: h["score"], reverse=True)[:k]
@@ -0,0 +1,30 @@
+# rag/models.py — registry model embedding dùng chung trong tiến trình (serving + ingest)
+from __future__ import annotations
+import threading
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+_models: Dict[str, "SentenceTransformer"] = {}
+_lock = threading.Lock()
+
+def get_embedder(name: str) -> "SentenceTransformer":
+    """Mỗi tên model chỉ nạp 1 lần / tiến trình; ingest chạy nền trong API dùng lại weights đã nạp."""
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = _models[name] = SentenceTransformer(name)
+    return model
+
+def embedding_dim(model: "SentenceTransformer") -> int:
+    try:
+        dim = model.get_sentence_embedding_dimension()
+        if dim:
+            return int(dim)
+    except Exception:
+        pass
+    return int(model.encode(["a"]).shape[1])
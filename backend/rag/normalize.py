@@ -0,0 +1,107 @@
+# rag/normalize.py — chuẩn hoá tiếng Việt dùng chung cho ingest (cột norm/dow_key) và câu hỏi
+from __future__ import annotations
+import re
+import unicodedata
+from datetime import date
+from typing import Dict, Optional
+
+def strip_diacritics(s: str) -> str:
+    """Bỏ dấu tiếng Việt (kể cả đ/Đ, vốn không tách được bằng NFD)."""
+    s = (s or "").replace("đ", "d").replace("Đ", "D")
+    return "".join(ch for ch in unicodedata.normalize("NFD", s) if not unicodedata.combining(ch))
+
+def fold(s: str) -> str:
+    """Chữ thường, bỏ dấu, gộp khoảng trắng: dạng so khớp chung cho mọi nơi."""
+    return re.sub(r"\s+", " ", strip_diacritics(s).lower()).strip()
+
+# từ hỏi/hư từ gần như câu nào cũng có (dạng đã fold); bỏ đi để từ khoá chỉ còn tên riêng, đơn vị, phòng...
+STOPWORDS = frozenset({
+    "co", "gi", "o", "dau", "nao", "khong", "la", "khi", "bao", "gio", "may", "ai", "cho", "toi",
+    "minh", "ban", "xem", "voi", "duoc", "thi", "va", "cua", "cac", "nhung", "nhe", "a", "vay",
+    "luc", "tu", "den", "vao", "trong",
+})
+
+# ---------- Thứ ----------
+# khoá chuẩn: thu2..thu7, cn (chạy trên chuỗi đã fold)
+RE_DOW_FOLDED = re.compile(
+    r"\b(?:thu\s*(?P<n>[2-7])|thu\s*(?P<w>hai|ba|tu|nam|sau|bay)|th(?P<n2>[2-7])|t(?P<n3>[2-7])|chu\s*nhat|cn)\b"
+)
+# cùng các cách viết trên chuỗi gốc (còn dấu, chưa fold): normalize_question thay tại chỗ mà giữ dấu phần còn lại
+RE_DOW = re.compile(
+    r"\b(t(h(ứ|u))\s*(2|3|4|5|6|7|hai|ba|tư|nam|năm|sáu|sau|bảy)|t[2-7]|chủ nhật|chu nhat|cn)\b",
+    re.IGNORECASE
+)
+_DOW_WORDS = {"hai": "2", "ba": "3", "tu": "4", "nam": "5", "sau": "6", "bay": "7"}
+
+DOW_KEYS = ("thu2", "thu3", "thu4", "thu5", "thu6", "thu7", "cn")
+# nhãn chữ thường (khoá cache/normalize_question) và nhãn hiển thị (cột dow do parser ghi)
+DOW_LABELS: Dict[str, str] = {**{f"thu{i}": f"thứ {i}" for i in range(2, 8)}, "cn": "chủ nhật"}
+DOW_DISPLAY: Dict[str, str] = {**{f"thu{i}": f"Thứ {i}" for i in range(2, 8)}, "cn": "Chủ nhật"}
+
+def _dow_match_key(m: re.Match) -> str:
+    num = m.group("n") or m.group("n2") or m.group("n3") or _DOW_WORDS.get(m.group("w") or "")
+    return f"thu{num}" if num else "cn"
+
+def dow_key(s: str, at_start: bool = False) -> Optional[str]:
+    """
+    'Thứ Năm' / 'thu 5' / 'T5' / 'th5' -> 'thu5'; 'Chủ nhật' / 'CN' -> 'cn'; không phải thứ -> None.
+    at_start=True: thứ phải đứng đầu chuỗi (ô tiêu đề ngày), không tìm ở giữa.
+    """
+    t = fold(s)
+    m = RE_DOW_FOLDED.match(t) if at_start else RE_DOW_FOLDED.search(t)
+    return _dow_match_key(m) if m else None
+
+# ---------- Ngày tương đối ----------
+# "hôm nay", "sáng mai", "tuần sau", "3 ngày tới"... (chạy trên chuỗi đã fold, nên có dấu hay không đều khớp)
+RE_RELATIVE_FOLDED = re.compile(
+    r"\b(?:today|tomorrow|yesterday|hom\s*(?:nay|qua|kia)|ngay\s*(?:mai|kia|mot)"
+    r"|(?:sang|trua|chieu|toi)\s+(?:nay|mai)"
+    r"|(?:cuoi\s+)?(?:tuan|thang|nam)\s+(?:nay|sau|toi|truoc|roi|qua|ke\s+tiep|tiep\s+theo)"
+    r"|\d+\s+ngay\s+(?:sap\s+toi|toi|tiep\s+theo|sau|vua\s+qua|qua|truoc))\b"
+)
+
+# ---------- Giờ / ngày ----------
+def canon_time(h, m=None) -> str:
+    return f"{int(h):02d}:{int(m or 0):02d}"
+
+def canon_date(d, m, y) -> str:
+    y = int(y)
+    if y < 100:
+        y += 2000
+    return f"{int(d):02d}/{int(m):02d}/{y:04d}"
+
+def iso_date(date_str: Optional[str]) -> Optional[str]:
+    """'dd/mm/yyyy' (cột chunks.date) -> 'yyyy-mm-dd' (cột date_iso, so sánh/sắp xếp được); sai định dạng -> None."""
+    try:
+        d, m, y = (date_str or "").strip().split("/")
+        return date(int(y), int(m), int(d)).isoformat()
+    except ValueError:
+        return None
+
+def time_minutes(t: Optional[str]) -> Optional[int]:
+    """'HH:MM' -> số phút trong ngày (cột start_min/end_min); rỗng/sai định dạng -> None."""
+    try:
+        h, m = (t or "").strip().split(":")
+        return int(h) * 60 + int(m)
+    except ValueError:
+        return None
+
+_RE_DATE_FOLDED = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4}|\d{2})\b")
+_RE_TIME_FOLDED = re.compile(r"\b(\d{1,2})\s*(?::|h)\s*(\d{2})?\b")
+
+def normalize_text(s: str) -> str:
+    """
+    fold() rồi đưa token về dạng chuẩn: thứ -> thu2..thu7/cn, giờ '8h30'/'8:30'/'8h' -> '08:30',
+    ngày 'd/m/yy(yy)' -> 'dd/mm/yyyy'. Dùng cho cột chunks.norm và cho câu hỏi, để so khớp
+    từ khoá chỉ là phép tìm chuỗi con trên dữ liệu đã chuẩn hoá sẵn.
+    """
+    t = fold(s)
+    t = _RE_DATE_FOLDED.sub(lambda m: canon_date(*m.groups()), t)
+    t = RE_DOW_FOLDED.sub(_dow_match_key, t)
+    return _RE_TIME_FOLDED.sub(lambda m: canon_time(m.group(1), m.group(2)), t)
+
+_NORM_FIELDS = ("title", "participants", "location", "raw")
+
+def event_norm(ev: Dict) -> str:
+    """Giá trị cột chunks.norm: các trường văn bản của event, chuẩn hoá, nối bằng ' | '."""
+    return " | ".join(normalize_text(ev.get(k) or "") for k in _NORM_FIELDS)
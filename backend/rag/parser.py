@@ -1,12 +1,24 @@
 # rag/parser.py — TMU Weekly (state-machine parser, finalized)
 from __future__ import annotations
+import hashlib
+import io
+import json
+import logging
+import os
 import re
 import datetime as dt
-from typing import List, Dict, Optional, Tuple
+from typing import IO, List, Dict, Optional, Tuple, Union
 from docx import Document
+from docx.oxml.ns import qn
+
+from .normalize import DOW_DISPLAY, dow_key
+
+log = logging.getLogger(__name__)
 
 # Regex
-RE_DOW_HDR    = re.compile(r"\b(Thứ\s*[2-7]|Chủ\s*nhật|CN|cn|thu\s*[2-7])\b", re.I)
+# tiêu đề ngày lẫn trong cột phải / đoạn văn: chỉ dạng số ở đầu dòng ("Thứ ba" ở đó thường là số thứ tự:
+# "Kỳ họp thứ ba ..."); cột trái thì nhận mọi cách viết của normalize.dow_key, nhưng cũng phải ở đầu ô
+RE_DOW_HDR    = re.compile(r"^(?:Thứ\s*[2-7]|Chủ\s*nhật|CN|thu\s*[2-7])\b", re.I)
 RE_DDMM       = re.compile(r"\b(\d{1,2})[\/\-](\d{1,2})\b")
 RE_DDMMYY     = re.compile(r"\b(\d{1,2})[\/\-](\d{1,2})[\/\-](\d{2,4})\b")
 
@@ -27,6 +39,8 @@ RE_BULLET     = re.compile(r"^[\*\-\u2022]+\s*")
 # TP / Thành phần / Mời dự
 RE_TP         = re.compile(r"^(TP|Thành\s*phần|Mời\s*dự)\s*[:：\-]\s*(.+)$", re.I)
 
+_W_P, _W_TBL = qn("w:p"), qn("w:tbl")
+
 DOW_VI = ["Thứ 2","Thứ 3","Thứ 4","Thứ 5","Thứ 6","Thứ 7","Chủ nhật"]
 
 # Helpers
@@ -68,56 +82,89 @@ def _norm_time(s: str) -> Tuple[Optional[str], Optional[str]]:
         return f"{int(hh.group(1)):02d}:00", None
     return None, None
 
-def infer_year_from_doc(doc: Document) -> Optional[int]:
-    # đoán năm xuất hiện trong file
-    def _scan(text: str) -> Optional[int]:
-        for m in re.finditer(r"\b(20\d{2})\b", text):
-            y = int(m.group(1))
-            if 2000 <= y <= 2100:
-                return y
-        return None
-    y = _scan(" ".join(p.text for p in doc.paragraphs))
+def _scan_year(text: str) -> Optional[int]:
+    for m in re.finditer(r"\b(20\d{2})\b", text):
+        y = int(m.group(1))
+        if 2000 <= y <= 2100:
+            return y
+    return None
+
+def _tc_text(tc) -> str:
+    # = _Cell.text: các đoạn con trực tiếp của ô, nối bằng \n
+    return "\n".join(p.text for p in tc.p_lst)
+
+def _walk_docx(doc: Document) -> Tuple[List[str], List[List[List[str]]]]:
+    """
+    Đi qua XML của body đúng 1 lần: (các đoạn văn cấp cao nhất, các bảng = list dòng = list text ô).
+    Ô gộp ngang lặp lại theo gridSpan, ô gộp dọc (vMerge=continue) lấy text ô gốc phía trên — giống
+    row.cells của python-docx nhưng không phải dò lại bảng cho mỗi lần truy cập ô.
+    """
+    paragraphs: List[str] = []
+    tables: List[List[List[str]]] = []
+    for el in doc.element.body.iterchildren():
+        if el.tag == _W_P:
+            paragraphs.append(el.text)
+        elif el.tag == _W_TBL:
+            rows: List[List[str]] = []
+            above: Dict[int, str] = {}      # cột lưới → text ô gốc (cho ô gộp dọc bên dưới)
+            for tr in el.tr_lst:
+                cells: List[str] = []
+                col = tr.grid_before
+                for tc in tr.tc_lst:
+                    span = tc.grid_span
+                    text = above.get(col, "") if tc.vMerge == "continue" else _tc_text(tc)
+                    above[col] = text
+                    cells.extend([text] * span)
+                    col += span
+                rows.append(cells)
+            tables.append(rows)
+    return paragraphs, tables
+
+def _infer_year(paragraphs: List[str], tables: List[List[List[str]]]) -> Optional[int]:
+    y = _scan_year(" ".join(paragraphs))
     if y: return y
-    for tb in doc.tables:
-        for r in tb.rows:
-            y = _scan(" | ".join(c.text for c in r.cells))
+    for rows in tables:
+        for cells in rows:
+            y = _scan_year(" | ".join(cells))
             if y: return y
     return None
 
+def infer_year_from_doc(doc: Document) -> Optional[int]:
+    # đoán năm xuất hiện trong file
+    return _infer_year(*_walk_docx(doc))
+
 # Core Parser
-def parse_docx_as_table(path: str, default_year: Optional[int] = None) -> List[Dict]:
+def parse_docx_as_table(path: Union[str, IO[bytes]], default_year: Optional[int] = None) -> List[Dict]:
     """
-    Parser chuyên TMU:
+    Parser chuyên TMU (path: đường dẫn hoặc file-like, vd BytesIO của 1 file trong zip):
       - Cột trái: 'Thứ X' + 'dd/mm'
       - Cột phải: từng dòng/bullet là một sự kiện
       - Dòng 'TP/Thành phần/Mời dự' ghép vào event trước đó
     Trả về: [{date,dow,start,end,location,participants,title,raw}]
+    default_year=None → dò năm trên chính các đoạn/ô đã đọc (XML chỉ được duyệt 1 lần, xem _walk_docx).
     """
-    doc  = Document(path)
-    year = default_year or infer_year_from_doc(doc) or dt.date.today().year
+    paragraphs, tables = _walk_docx(Document(path))
+    year = default_year or _infer_year(paragraphs, tables) or dt.date.today().year
 
     events: List[Dict] = []
     cur_date: Optional[str] = None
     cur_dow:  Optional[str] = None
     last_event_idx: Optional[int] = None
 
-    def _scan_day_and_date(s: str) -> bool:
+    def _scan_day_and_date(s: str, left_col: bool = False) -> bool:
         nonlocal cur_date, cur_dow
         s1 = " ".join(s.split())
-        m_dow = RE_DOW_HDR.search(s1)
+        # dòng tiêu đề ngày = bắt đầu bằng thứ + có dd/mm; ngoài cột trái thì thứ phải ở dạng RE_DOW_HDR
+        m_hdr = RE_DOW_HDR.match(s1)
+        key = dow_key(s1, at_start=True) if left_col else (dow_key(m_hdr.group(0)) if m_hdr else None)
         m_dm  = RE_DDMM.search(s1) or RE_DDMMYY.search(s1)
-        if m_dow and m_dm:
+        if key and m_dm:
             d = int(m_dm.group(1)); m = int(m_dm.group(2))
             y = int(m_dm.group(3)) + 2000 if (m_dm.lastindex == 3 and len(m_dm.group(3)) == 2) else year
             d_real = _coerce_year(d, m, y)
             if d_real:
                 cur_date = _fmt_date(d_real)
-                w = m_dow.group(1).lower()
-                if "chủ nhật" in w or w in ("cn","CN"):
-                    cur_dow = "Chủ nhật"
-                else:
-                    num = re.search(r"[2-7]", w)
-                    cur_dow = f"Thứ {num.group(0)}" if num else None
+                cur_dow = DOW_DISPLAY[key]
                 return True
         return False
 
@@ -179,14 +226,14 @@ def parse_docx_as_table(path: str, default_year: Optional[int] = None) -> List[D
         last_event_idx = len(events) - 1
 
     # Scan tài liệu
-    if doc.tables:
-        for tb in doc.tables:
-            for row in tb.rows:
-                left  = row.cells[0].text if len(row.cells) >= 1 else ""
-                right = row.cells[1].text if len(row.cells) >= 2 else ""
+    if tables:
+        for rows in tables:
+            for cells in rows:
+                left  = cells[0] if len(cells) >= 1 else ""
+                right = cells[1] if len(cells) >= 2 else ""
 
                 if left.strip():
-                    _scan_day_and_date(left)
+                    _scan_day_and_date(left, left_col=True)
 
                 for line in (l.strip() for l in right.split("\n")):
                     if not line:
@@ -201,8 +248,8 @@ def parse_docx_as_table(path: str, default_year: Optional[int] = None) -> List[D
 
 
     else:
-        for p in doc.paragraphs:
-            line = p.text.strip()
+        for line in paragraphs:
+            line = line.strip()
             if not line:
                 continue
             m_tp = RE_TP.match(line)
@@ -223,4 +270,51 @@ def parse_docx_as_table(path: str, default_year: Optional[int] = None) -> List[D
             except Exception:
                 pass
 
-    return events
\ No newline at end of file
+    return events
+
+# Cache kết quả parse: <sha1 nội dung>.events.jsonl cạnh file upload (dòng đầu là {"_meta": ...}).
+# /upload/preview parse + ghi cache, /ingest đọc lại đúng các events admin vừa xem thay vì parse lần 2.
+PARSER_VERSION = 4   # tăng khi đổi logic parse → cache cũ tự mất hiệu lực
+
+def parse_cache_path(path: str, digest: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(path)), f"{digest}.events.jsonl")
+
+def _read_parse_cache(cache_path: str) -> Tuple[Optional[Dict], List[Dict]]:
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return None, []
+    if not rows or "_meta" not in rows[0]:
+        return None, []
+    return rows[0]["_meta"], rows[1:]
+
+def _write_parse_cache(cache_path: str, meta: Dict, events: List[Dict]) -> None:
+    tmp = cache_path + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"_meta": meta}, ensure_ascii=False) + "\n")
+            for ev in events:
+                f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        log.warning("cannot write parse cache %s: %s", cache_path, e)
+
+def parse_docx_cached(path: str, default_year: Optional[int] = None) -> Tuple[List[Dict], bool]:
+    """
+    (events, lấy từ cache?). File chỉ được đọc 1 lần để băm + parse từ bộ nhớ.
+    default_year=None dùng lại cache bất kể năm lúc preview (đúng bản admin đã xem);
+    có default_year khác năm trong cache thì parse lại và ghi đè.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    cache_path = parse_cache_path(path, digest)
+    meta, events = _read_parse_cache(cache_path)
+    if (meta and meta.get("parser") == PARSER_VERSION and meta.get("sha1") == digest
+            and default_year in (None, meta.get("year"))):
+        return events, True
+    events = parse_docx_as_table(io.BytesIO(data), default_year)
+    _write_parse_cache(cache_path, {"sha1": digest, "parser": PARSER_VERSION, "year": default_year,
+                                    "count": len(events)}, events)
+    return events, False
@@ -0,0 +1,104 @@
+# rag/planner.py — ghép nhiều điều kiện (ngày/thứ/khoảng ngày, buổi/giờ, địa điểm, từ khoá, đếm) trên lịch
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from .calendar_index import ScheduleCalendar
+from .io_store import get_events_in_range
+from .normalize import DOW_LABELS, dow_key
+from .query_parser import ParsedQuery
+from .textkit import filter_events_by_time, format_events_matching
+
+# khung giờ của từng buổi (so trùng như filter_events_by_time với t_to)
+PART_WINDOWS = {
+    "sang": ("00:00", "11:59"),
+    "trua": ("11:00", "13:59"),
+    "chieu": ("12:00", "17:59"),
+    "toi": ("18:00", "23:59"),
+}
+_PART_LABELS = {"sang": "buổi sáng", "trua": "buổi trưa", "chieu": "buổi chiều", "toi": "buổi tối"}
+
+def _scope(pq: ParsedQuery, cal: ScheduleCalendar) -> Dict[str, List[Dict]]:
+    """Ngày → events cần xét; câu hỏi không nêu ngày/thứ/khoảng ngày → mọi ngày đang có trong lịch."""
+    if pq.relative_day is not None:
+        dates = [(datetime.now() + timedelta(days=pq.relative_day)).strftime("%d/%m/%Y")]
+    elif pq.date:
+        dates = [pq.date]
+    elif pq.day_month:
+        dates = cal.dates_for_month_day(*pq.day_month)
+    elif pq.date_from:
+        # khoảng ngày: 1 lần quét khoảng trên idx_chunks_date_start, đã sắp theo ngày/giờ
+        grouped: Dict[str, List[Dict]] = {}
+        for ev in get_events_in_range(pq.date_from, pq.date_to):
+            if pq.dow and dow_key(ev.get("dow") or "") != pq.dow:
+                continue
+            grouped.setdefault(ev["date"], []).append(ev)
+        return grouped
+    elif pq.dow:
+        dates = cal.dates_for_dow(pq.dow)
+    else:
+        dates = cal.dates
+    return {ds: cal.events_on(ds) for ds in dates if cal.events_on(ds)}
+
+def _window(pq: ParsedQuery):
+    if pq.t_from:
+        return pq.t_from, pq.t_to
+    if pq.part_of_day:
+        return PART_WINDOWS[pq.part_of_day]
+    return None, None
+
+def _criteria(pq: ParsedQuery) -> str:
+    bits = []
+    if pq.keywords:
+        bits.append("liên quan " + ", ".join(f"“{w}”" for w in pq.keywords))
+    if pq.location:
+        bits.append(f"tại **{pq.location_text}**")
+    if pq.t_from:
+        bits.append(f"lúc **{pq.t_from}**" if not pq.t_to else f"trong khung **{pq.t_from}–{pq.t_to}**")
+    elif pq.part_of_day:
+        bits.append(_PART_LABELS[pq.part_of_day])
+    if pq.date_from:
+        if pq.dow:
+            bits.append(f"vào **{DOW_LABELS[pq.dow]}**")
+        bits.append(pq.range_label)
+    elif pq.date:
+        bits.append(f"ngày **{pq.date}**")
+    elif pq.day_month:
+        bits.append("ngày **%02d/%02d**" % pq.day_month)
+    elif pq.dow:
+        bits.append(f"vào **{DOW_LABELS[pq.dow]}**")
+    elif pq.relative_day is not None:
+        bits.append("hôm nay" if pq.relative_day == 0 else "ngày mai")
+    else:
+        bits.append("trong lịch tuần")
+    return " ".join(bits)
+
+def run_plan(pq: ParsedQuery, cal: ScheduleCalendar) -> Optional[Dict]:
+    """
+    Lọc AND mọi điều kiện có trong câu hỏi: ngày/thứ → khung giờ/buổi → địa điểm (chuỗi con
+    của địa điểm đã chuẩn hoá) → từ khoá (mọi từ phải có trong cột norm: tiêu đề, thành phần,
+    địa điểm, nội dung, nên bao cả đơn vị/người tham dự như "BGH").
+    Khoảng ngày (tuần sau, 3 ngày tới, từ X đến Y...) lấy thẳng từ SQLite bằng get_events_in_range.
+    Trả None khi không áp dụng được, để _route đi tiếp các nhánh cũ / RAG:
+      - ngày/thứ được hỏi không có trong lịch (khoảng ngày rỗng thì vẫn trả lời "không thấy");
+      - có từ khoá mà không event nào khớp (từ khoá có thể là từ thừa → để RAG xử lý).
+    """
+    scope = _scope(pq, cal)
+    if not scope and not pq.date_from:
+        return None
+    t_from, t_to = _window(pq)
+    keywords = set(pq.keywords)
+    grouped: Dict[str, List[Dict]] = {}
+    for ds, evs in scope.items():
+        if t_from:
+            evs = filter_events_by_time(evs, t_from, t_to)
+        if pq.location:
+            evs = [ev for ev in evs if pq.location in cal.event_location(ev)]
+        if keywords:
+            evs = [ev for ev in evs if keywords <= cal.event_words(ev)]
+        if evs:
+            grouped[ds] = evs
+    if not grouped and keywords:
+        return None
+    hits = [ev for evs in grouped.values() for ev in evs]
+    return {"answer": format_events_matching(grouped, _criteria(pq), count=pq.count), "hits": hits}
@@ -0,0 +1,206 @@
+# rag/query_parser.py — tách câu hỏi 1 lượt thành ParsedQuery (intent, ngày, thứ, giờ, buổi, địa điểm, từ khoá)
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from functools import cached_property
+from typing import List, Optional, Tuple
+
+from . import date_range
+from .normalize import STOPWORDS, canon_date, canon_time, fold, normalize_text
+
+# Một regex duy nhất, quét 1 lần bằng finditer. Thứ tự nhánh = độ ưu tiên khi trùng vị trí:
+# ngày đầy đủ > dd/mm > thứ > giờ > cụm cố định. Vì "thứ 5" đã bị nhánh dow ăn nên nhánh giờ
+# không còn nhầm thành 05:00 (trước đây phải nhìn lùi 6 ký tự). Chỉ thử các nhánh ở đầu từ
+# (lookbehind/lookahead đầu mẫu, nên nhánh không cần \b ở đầu), và mỗi nhánh có lookahead ký tự đầu
+# để bỏ qua ngay từ không khớp.
+# (tên, ký tự đầu, mẫu)
+_BRANCHES = (
+    ("span", "t", r"từ\s+(?:ngày\s+)?(?P<s1>\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)\s*(?:đến|tới|-|–)\s*"
+                  r"(?:ngày\s+)?(?P<s2>\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)\b"),
+    ("vidate", "n0-9", r"(?:ngày\s+)?(?P<vd>\d{1,2})\s+tháng\s+(?P<vm>\d{1,2})(?:\s+năm\s+(?P<vy>\d{4}))?\b"),
+    ("ndays", "0-9", r"(?P<n>\d{1,3})\s+ngày\s+(?P<nd>tới|sắp\s+tới|tiếp\s+theo|sau|qua|vừa\s+qua|trước)\b"),
+    ("weekend", "c", r"cuối\s+tuần(?:\s+(?P<we>này|nay|sau|tới|trước|rồi|qua)\b)?"),
+    ("relweek", "t", r"tuần\s+(?P<rw>này|nay|sau|tới|kế\s+tiếp|tiếp\s+theo|trước|rồi|qua)\b"),
+    ("relmonth", "t", r"tháng\s+(?P<rm>này|nay|sau|tới|trước|rồi|qua)\b"),
+    ("month", "t", r"tháng\s+(?P<mm>\d{1,2})(?:\s*(?:/|năm)\s*(?P<my>\d{4}))?\b"),
+    ("relday", "hn", r"(?:hôm\s+qua|hôm\s+kia|ngày\s+kia|ngày\s+mốt)\b"),
+    ("date", "0-9", r"(?P<d1>\d{1,2})[/-](?P<m1>\d{1,2})[/-](?P<y1>\d{4})\b"),
+    ("dm", "0-9", r"(?P<d2>\d{1,2})[/-](?P<m2>\d{1,2})\b"),
+    ("dow", "tc", r"(?:th(?:ứ|u)\s*(?P<dw>[2-7]|hai|ba|tư|nam|năm|sáu|sau|bảy)|t(?P<dn>[2-7])|chủ nhật|chu nhat|cn)\b"),
+    ("time", "0-9", r"(?P<h>\d{1,2})(?::|h)\s?(?P<mi>\d{2})?\b"),
+    ("today", "ht", r"h[oô]m\s*nay|today"),
+    ("tomorrow", "nt", r"ngày mai|tomorrow"),
+    ("count", "mbs", r"(?:mấy|bao nhiêu|số)\s+(?:lần|cuộc(?:\s+họp)?|buổi|hoạt động|sự kiện)\b"),
+    ("part", "bstc", r"(?:buổi\s+)?(?P<pd>sáng|trưa|chiều|tối)(?:\s+(?P<pr>nay|mai))?\b"),
+    ("loc", "ởt", r"(?:ở|tại)\s+(?P<place>[^?.!,]+?)(?=\s+(?:không|ko|chưa|vào|lúc|có|từ|trong|ngày|hôm|thứ|"
+                  r"sáng|trưa|chiều|tối|buổi|tuần|mấy|bao|những|với)\b|\s*[?.!,]|\s*$)"),
+    ("week", "lt", r"(?:lịch\s+toàn\s+tuần|toàn\s+tuần)\b"),
+    ("define", "lw", r"(?:là gì|là cái gì|what\s+is)\b"),
+    ("smalltalk", "xchbgtlw", r"(?:xin chào|chào|hello|hi|bạn là ai|giới thiệu|tên bạn|làm công việc gì|what do you do|help|giúp)\b"),
+    ("hint", "lhcskxtngđ", r"(?:lịch|họp|công tác|sự kiện|kế hoạch|khai giảng|xét tuyển|hội đồng|tuần này|thứ|ngày|giờ|địa điểm)\b"),
+    ("qword", "dmb", r"(?:date|mấy|bao nhiêu)\b"),
+)
+# nhánh khoảng ngày → hàm trong rag/date_range.py
+_RANGE_KINDS = {"span", "ndays", "weekend", "relweek", "relmonth", "month", "relday"}
+# Nhánh khoảng ngày / địa điểm hiếm gặp mà tốn nhất: chỉ bật khi câu có từ khoá bắt buộc của chúng.
+# Thiếu hết các từ này thì các nhánh đó không thể khớp, nên regex rút gọn cho đúng kết quả như regex đủ.
+_RARE_KINDS = _RANGE_KINDS | {"vidate", "loc"}
+_RE_RARE_CUE = re.compile(r"từ\s+(?:ngày\s+)?\d{1,2}[/-]|tháng|tuần\s|ở|tại|\d\s+ngày|hôm\s+(?:qua|kia)|ngày\s+(?:kia|mốt)")
+
+def _compile_query(kinds) -> re.Pattern:
+    return re.compile(r"(?<!\w)(?=\w)(?:" + "|".join(
+        f"(?=[{first}])(?P<{name}>{body})" for name, first, body in _BRANCHES if name in kinds) + ")")
+
+_RE_QUERY = _compile_query({name for name, _, _ in _BRANCHES})
+_RE_QUERY_BASE = _compile_query({name for name, _, _ in _BRANCHES} - _RARE_KINDS)
+_RE_WORD = re.compile(r"\w+")
+# "thứ Năm" → 5 (nhánh dow đọc thẳng số thứ, khỏi fold lại như dow_key)
+_DOW_NUM = {"hai": "2", "ba": "3", "tư": "4", "nam": "5", "năm": "5", "sáu": "6", "sau": "6", "bảy": "7"}
+_PARTS = {"sáng": "sang", "trưa": "trua", "chiều": "chieu", "tối": "toi"}
+# "ở đâu" / "ở chỗ nào" là câu hỏi địa điểm, không phải điều kiện lọc (dạng gốc để khỏi normalize, và dạng đã fold)
+_WHERE_WORDS = {"đâu", "nào", "chỗ nào", "đâu vậy", "dau", "nao", "cho nao", "dau vay"}
+# cụm chung chung không dùng làm từ khoá lọc (dạng đã fold)
+_RE_FILLER = re.compile(r"\b(?:hoat dong|cuoc|buoi|lan|nhung|tat ca|khong|ko|chua|co)\b")
+# nhánh nào cũng bật cờ calendar-hint như RE_CALENDAR_HINT cũ
+_HINT_KINDS = {"today", "tomorrow", "hint", "vidate"} | _RANGE_KINDS
+# tín hiệu hỏi lịch/ngày đi kèm "hôm nay/ngày mai" ("hôm nay bạn thế nào" thì không có)
+_DAY_CUE_KINDS = {"hint", "qword", "count", "time", "part", "loc", "week"}
+# nhánh chỉ cần ghi nhận trong kinds, không trích gì thêm
+_FLAG_KINDS = {"hint", "qword", "today", "tomorrow", "week", "define", "smalltalk"}
+# hint mang nội dung → vẫn giữ làm từ khoá
+_TOPIC_HINTS = {"khai giảng", "xét tuyển", "hội đồng"}
+
+@dataclass
+class ParsedQuery:
+    text: str
+    intent: str = "GENERAL"                     # GENERAL | SMALLTALK | DEFINE | SCHEDULE | SCHEDULE_ALL
+    relative_day: Optional[int] = None          # 0 = hỏi hôm nay, 1 = hỏi ngày mai
+    date: Optional[str] = None                  # dd/mm/yyyy đầu tiên trong câu
+    day_month: Optional[Tuple[int, int]] = None # dd/mm (không có năm) đầu tiên
+    dow: Optional[str] = None                   # khoá thu2..thu7 / cn
+    dow_text: Optional[str] = None              # nguyên văn trong câu, dùng khi trả lời
+    date_from: Optional[date] = None            # khoảng ngày (tuần sau, 3 ngày tới, từ X đến Y...)
+    date_to: Optional[date] = None
+    range_label: Optional[str] = None
+    t_from: Optional[str] = None
+    t_to: Optional[str] = None
+    part_of_day: Optional[str] = None           # sang | trua | chieu | toi
+    location: Optional[str] = None              # cụm sau "ở/tại", đã normalize_text
+    location_text: Optional[str] = None         # nguyên văn, dùng khi trả lời
+    count: bool = False                         # hỏi "mấy lần / bao nhiêu cuộc"
+    rest: str = field(default="", repr=False)   # phần câu hỏi ngoài các token lịch ở trên
+
+    @property
+    def has_date(self) -> bool:
+        return bool(self.date or self.day_month or self.dow or self.date_from)
+
+    @property
+    def has_filters(self) -> bool:
+        """Có điều kiện ngoài ngày/giờ → cần planner (rag/planner.py) thay vì nhánh ngày/thứ đơn."""
+        return bool(self.part_of_day or self.location or self.count or self.keywords)
+
+    @cached_property
+    def keywords(self) -> List[str]:
+        """Từ còn lại (đã fold, bỏ hư từ, không trùng); chỉ tính khi handler cần."""
+        out: List[str] = []
+        for w in _RE_WORD.findall(_RE_FILLER.sub(" ", fold(self.rest))):
+            if w not in STOPWORDS and (len(w) > 1 or w.isdigit()) and w not in out:
+                out.append(w)
+        return out
+
+def _resolve_range(kind: str, m: re.Match, today: date) -> Optional[date_range.DateRange]:
+    if kind == "span":
+        return date_range.span(today, m.group("s1"), m.group("s2"))
+    if kind == "ndays":
+        return date_range.next_days(today, int(m.group("n")), m.group("nd"))
+    if kind == "weekend":
+        return date_range.weekend(today, m.group("we"))
+    if kind == "relweek":
+        return date_range.week(today, m.group("rw"))
+    if kind == "relmonth":
+        return date_range.month(today, m.group("rm"))
+    if kind == "month":
+        return date_range.month(today, month_no=int(m.group("mm")), year=int(m.group("my") or 0) or None)
+    return date_range.relative_day(today, m.group(0))
+
+def parse_query(q: str, today: Optional[date] = None) -> ParsedQuery:
+    text = (q or "").strip()
+    pq = ParsedQuery(text=text)
+    ql = text.lower()
+    if not ql:
+        return pq
+    # lower() giữ nguyên độ dài với tiếng Việt; nếu không thì lấy nguyên văn từ ql
+    src = text if len(ql) == len(text) else ql
+    kinds = set()
+    times: List[str] = []
+    rest: List[str] = []
+    pos = 0
+    for m in (_RE_QUERY if _RE_RARE_CUE.search(ql) else _RE_QUERY_BASE).finditer(ql):
+        kind = m.lastgroup          # nhóm ngoài cùng đóng sau cùng → luôn là tên nhánh
+        kinds.add(kind)
+        if kind == "hint" and m.group(0) in _TOPIC_HINTS:
+            continue
+        rest.append(ql[pos:m.start()])
+        pos = m.end()
+        if kind in _FLAG_KINDS:
+            continue
+        if kind in _RANGE_KINDS:
+            if pq.date_from is None:
+                rng = _resolve_range(kind, m, today or date.today())
+                if rng:
+                    pq.date_from, pq.date_to, pq.range_label = rng
+        elif kind == "vidate":
+            # "20 tháng 8 (năm 2025)": có năm như dd/mm/yyyy, không có năm như dd/mm
+            if m.group("vy") and pq.date is None:
+                pq.date = canon_date(m.group("vd"), m.group("vm"), m.group("vy"))
+            elif not m.group("vy") and pq.day_month is None:
+                pq.day_month = (int(m.group("vd")), int(m.group("vm")))
+        elif kind == "date" and pq.date is None:
+            pq.date = canon_date(m.group("d1"), m.group("m1"), m.group("y1"))
+        elif kind == "dm" and pq.day_month is None:
+            pq.day_month = (int(m.group("d2")), int(m.group("m2")))
+        elif kind == "dow" and pq.dow is None:
+            num = m.group("dn") or _DOW_NUM.get(m.group("dw"), m.group("dw"))
+            pq.dow, pq.dow_text = (f"thu{num}" if num else "cn"), src[m.start():m.end()]
+        elif kind == "time":
+            times.append(canon_time(m.group("h"), m.group("mi")))
+        elif kind == "part":
+            if pq.part_of_day is None:
+                pq.part_of_day = _PARTS[m.group("pd")]
+            # "sáng nay" / "chiều mai" = hôm nay / ngày mai
+            if m.group("pr"):
+                kinds.add("today" if m.group("pr") == "nay" else "tomorrow")
+        elif kind == "loc" and pq.location is None and m.group("place") not in _WHERE_WORDS:
+            place = normalize_text(m.group("place"))
+            if place not in _WHERE_WORDS:
+                pq.location, pq.location_text = place, src[m.start("place"):m.end("place")]
+        elif kind == "count":
+            pq.count = True
+
+    rest.append(ql[pos:])
+    pq.rest = " ".join(rest)
+    if times:
+        if pq.part_of_day in ("chieu", "toi"):
+            # "2h chiều" → 14:00, "7h tối" → 19:00
+            times = [canon_time(int(t[:2]) + 12, t[3:]) if t < "12:00" else t for t in times]
+        times.sort()
+        pq.t_from, pq.t_to = times[0], (times[-1] if len(times) > 1 else None)
+    # "hôm nay/ngày mai" giới hạn vào ngày đó khi câu có từ hỏi ("là ngày mấy") hoặc gợi ý lịch ("có họp")
+    if kinds & _DAY_CUE_KINDS:
+        if "today" in kinds:
+            pq.relative_day = 0
+        elif "tomorrow" in kinds:
+            pq.relative_day = 1
+
+    if "smalltalk" in kinds:
+        pq.intent = "SMALLTALK"
+    elif "define" in kinds:
+        pq.intent = "DEFINE"
+    elif pq.has_date:
+        pq.intent = "SCHEDULE"
+    elif "week" in kinds:
+        pq.intent = "SCHEDULE_ALL"
+    elif kinds & _HINT_KINDS:
+        pq.intent = "SCHEDULE"
+    return pq
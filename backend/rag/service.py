@@ -1,39 +1,38 @@
 # rag/service.py
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional
 from pydantic import BaseModel, Field, validator
 from datetime import datetime, timedelta
 from google import genai
 
-from .settings import GEMINI_API_KEY, GEMINI_MODEL
-from .io_store import (
-    get_events_by_date,
-    list_all_dates,
-    vector_search,
-    _fetch_all_date_dow_pairs,
-)
+from .settings import GEMINI_API_KEY, GEMINI_MODEL, GEMINI_TIMEOUT, LLM_MAX_CONCURRENCY, RETRIEVAL_TOP_K
+from .io_store import hybrid_search, warm_up as _warm_up_index
+from .calendar_index import get_calendar
+from .answer_cache import answer_cache
+from .query_parser import ParsedQuery, parse_query
+from .planner import run_plan
+from .context_packer import pack_contexts, prompt_stats
 from .textkit import (
     TMU_WEEKLY_KB,
     GENERAL_PERSONA,
     SMALLTALK_TEMPLATES,
-    RE_DDMMYYYY,
-    RE_DDMM,
-    RE_DOW,
-    RE_WEEK,
-    RE_DEFINE,
-    RE_CALENDAR_HINT,
-    RE_SMALLTALK,
-    parse_times,
-    filter_events_by_time,
     format_events_full,
     format_events_time_in_day,
     format_events_by_time_across_week,
-    _canon_dow,
 )
 
-# LLM client
+log = logging.getLogger(__name__)
+
+# LLM client (gclient.aio dùng chung 1 HTTP client → tái sử dụng kết nối)
 gclient = genai.Client(api_key=GEMINI_API_KEY)
+# giới hạn số lời gọi Gemini đồng thời; intent tất định không đi qua đây nên không phải chờ
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+LLM_BUSY_REPLY = "Hệ thống đang bận, bạn vui lòng hỏi lại sau ít phút nhé."
 
 SYSTEM_PROMPT = (
     "Bạn là trợ lý lịch công tác. Trả lời BẰNG TIẾNG VIỆT và CHỈ dựa trên ngữ cảnh cung cấp. "
@@ -48,32 +47,9 @@ def _fmt_vi_date(d: datetime) -> tuple[str, str]:
     """Trả về (dd/mm/yyyy, 'Thứ x' hoặc 'Chủ nhật')."""
     return d.strftime("%d/%m/%Y"), VI_DOW[d.weekday()]
 
-def _is_today_question(q: str) -> bool:
-    ql = q.lower()
-    return ("hôm nay" in ql or "today" in ql) and any(k in ql for k in ["ngày", "date", "mấy", "bao nhiêu", "thứ"])
-
-def _is_tomorrow_question(q: str) -> bool:
-    ql = q.lower()
-    return ("ngày mai" in ql or "tomorrow" in ql) and any(k in ql for k in ["ngày", "date", "mấy", "thứ"])
-
 # intent
 def classify_intent(q: str) -> str:
-    qn = (q or "").strip().lower()
-    if not qn:
-        return "GENERAL"
-    if RE_SMALLTALK.search(qn):
-        return "SMALLTALK"
-    if RE_DEFINE.search(qn):
-        return "DEFINE"
-    # có ngày/tháng/năm hoặc thứ → SCHEDULE
-    has_date = bool(RE_DDMMYYYY.search(qn) or RE_DDMM.search(qn) or RE_DOW.search(qn))
-    if has_date:
-        return "SCHEDULE"
-    if RE_WEEK.search(qn):
-        return "SCHEDULE_ALL"
-    if RE_CALENDAR_HINT.search(qn):
-        return "SCHEDULE"
-    return "GENERAL"
+    return parse_query(q).intent
 
 def _smalltalk_reply(q: str) -> str:
     ql = q.lower()
@@ -85,9 +61,7 @@ def _smalltalk_reply(q: str) -> str:
         return SMALLTALK_TEMPLATES["help"]
     return "Chào bạn! Mình là trợ lý lịch công tác của TMU. Bạn cần mình kiểm tra ngày/thứ nào không?"
 
-def _general_reply(q: str) -> str:
-    prompt = f"{GENERAL_PERSONA}\n\n[Người dùng]: {q}\n[Trợ lý]:"
-    resp = gclient.models.generate_content(model=GEMINI_MODEL, contents=prompt)
+def _response_text(resp) -> str:
     text = getattr(resp, "text", None) or getattr(resp, "output_text", None)
     if text:
         return text.strip()
@@ -99,44 +73,66 @@ def _general_reply(q: str) -> str:
         return resp.candidates[0].content[0].text.strip()
     except Exception:
         pass
-    return "Mình chưa chắc câu này. Bạn có thể hỏi lại ngắn gọn hơn không?"
+    return ""
 
-# LLM prompt builder
-def build_prompt(question: str, contexts: List[Dict]) -> str:
-    header = SYSTEM_PROMPT + "\n\n[CÁC ĐOẠN LIÊN QUAN]\n"
-    ctx = ""
-    for i, c in enumerate(contexts, 1):
-        meta = []
-        if c.get("date"):
-            meta.append(f"Ngày: {c['date']}")
-        if c.get("dow"):
-            meta.append(f"Thứ: {c['dow']}")
-        if c.get("start"):
-            meta.append(f"Giờ: {c['start']}")
-        if c.get("location"):
-            meta.append(f"Địa điểm: {c['location']}")
-        if c.get("participants"):
-            meta.append(f"TP: {c['participants']}")
-        score = c.get("score")
-        head = f"\n--- ĐOẠN {i}" + (f" (score={score:.3f})" if score is not None else "") + " ---\n"
-        ctx += head + (" | ".join(meta)) + "\n" + (c.get("text") or "") + "\n"
-    user = f"\n[CÂU HỎI]\n{question}\n\n[HƯỚNG DẪN]\nNếu nhiều sự kiện cùng ngày, hãy liệt kê TẤT CẢ."
-    return header + ctx + user
-
-def call_gemini(prompt: str) -> str:
-    resp = gclient.models.generate_content(model=GEMINI_MODEL, contents=prompt)
-    text = getattr(resp, "text", None) or getattr(resp, "output_text", None)
-    if text:
-        return text.strip()
+async def _generate(prompt: str) -> str:
+    """Gọi Gemini bất đồng bộ; deadline GEMINI_TIMEOUT tính cả thời gian chờ slot."""
+    async def _call():
+        async with _llm_slots:
+            return await gclient.aio.models.generate_content(model=GEMINI_MODEL, contents=prompt)
+    resp = await asyncio.wait_for(_call(), timeout=GEMINI_TIMEOUT)
+    return _response_text(resp)
+
+async def _generate_stream(prompt: str) -> AsyncIterator[str]:
+    """Stream token từ Gemini; giữ slot suốt stream, deadline áp cho toàn bộ lời gọi."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + GEMINI_TIMEOUT
+
+    def remaining() -> float:
+        return max(deadline - loop.time(), 0.0)
+
+    await asyncio.wait_for(_llm_slots.acquire(), timeout=remaining())
     try:
-        return resp.candidates[0].content.parts[0].text.strip()
-    except Exception:
-        pass
+        stream = await asyncio.wait_for(
+            gclient.aio.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt),
+            timeout=remaining(),
+        )
+        while True:
+            try:
+                chunk = await asyncio.wait_for(anext(stream), timeout=remaining())
+            except StopAsyncIteration:
+                break
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+    finally:
+        _llm_slots.release()
+
+async def _general_reply(q: str) -> str:
+    prompt = f"{GENERAL_PERSONA}\n\n[Người dùng]: {q}\n[Trợ lý]:"
     try:
-        return resp.candidates[0].content[0].text.strip()
+        text = await _generate(prompt)
+    except asyncio.TimeoutError:
+        log.warning("Gemini timeout (general reply)")
+        return LLM_BUSY_REPLY
     except Exception:
-        pass
-    return ""
+        log.exception("Gemini error (general reply)")
+        return LLM_BUSY_REPLY
+    return text or "Mình chưa chắc câu này. Bạn có thể hỏi lại ngắn gọn hơn không?"
+
+# LLM prompt builder
+def _rag_prompt(question: str, contexts: List[Dict]) -> tuple[str, List[Dict]]:
+    """(prompt, các hit thực sự đưa vào prompt sau khi context_packer lọc theo score/ngân sách)."""
+    ctx, kept = pack_contexts(contexts)
+    header = SYSTEM_PROMPT + "\n\n[LỊCH LIÊN QUAN]\n"
+    user = f"\n\n[CÂU HỎI]\n{question}\n\n[HƯỚNG DẪN]\nNếu nhiều sự kiện cùng ngày, hãy liệt kê TẤT CẢ."
+    return header + ctx + user, kept
+
+def build_prompt(question: str, contexts: List[Dict]) -> str:
+    return _rag_prompt(question, contexts)[0]
+
+async def call_gemini(prompt: str) -> str:
+    return await _generate(prompt)
 
 # pydantic I/O
 class Ask(BaseModel):
@@ -147,32 +143,39 @@ class Ask(BaseModel):
         return (v or "").strip()
 
 # main service
-def ask(payload: Ask):
-    q = (payload.question or "").strip()
-    t_from, t_to = parse_times(q)
+RAG_PREFIX = "Mình vừa xem trong lịch tuần và tổng hợp được như sau:\n\n"
+RAG_SUFFIX = "\n\nBạn cần mình kiểm tra thêm ngày/đơn vị khác không?"
+NOT_FOUND_REPLY = "Mình không tìm thấy thông tin trong lịch tuần này."
 
-    # Câu hỏi “HÔM NAY/NGÀY MAI là ngày bao nhiêu/thứ mấy?”
-    if _is_today_question(q):
-        today = datetime.now()
-        date_str, dow = _fmt_vi_date(today)
+ROUTE_GENERAL = "GENERAL"   # trả lời tự do bằng Gemini
+ROUTE_RAG     = "RAG"       # hybrid_search + Gemini
 
-        # Map sang date có trong DB (nếu tuần đang nạp có chứa ngày hôm nay)
-        # Nếu không có, vẫn trả lời ngày/thứ cho người dùng.
-        events = get_events_by_date(date_str)
-        if events:
-            return {"answer": format_events_full(events), "hits": events}
-        return {"answer": f"Hôm nay là **{date_str}, {dow}**. Mình chưa thấy lịch ngày này trong dữ liệu tuần đang có.", "hits": []}
+def _route(q: str, pq: Optional[ParsedQuery] = None) -> Dict | str:
+    """Trả lời ngay các intent tất định (dict); còn lại trả về ROUTE_GENERAL / ROUTE_RAG."""
+    pq = pq or parse_query(q)
+    t_from, t_to = pq.t_from, pq.t_to
+    cal = get_calendar()
+
+    # Khoảng ngày hoặc nhiều điều kiện (buổi, địa điểm, từ khoá, đếm) → planner
+    if (pq.has_filters or pq.date_from) and (pq.intent in ("SCHEDULE", "SCHEDULE_ALL") or pq.relative_day is not None):
+        planned = run_plan(pq, cal)
+        if planned is not None:
+            return planned
 
-    if _is_tomorrow_question(q):
-        tomorrow = datetime.now() + timedelta(days=1)
-        date_str, dow = _fmt_vi_date(tomorrow)
-        events = get_events_by_date(date_str)
+    # Câu hỏi “HÔM NAY/NGÀY MAI là ngày bao nhiêu/thứ mấy?”
+    if pq.relative_day is not None:
+        day = datetime.now() + timedelta(days=pq.relative_day)
+        date_str, dow = _fmt_vi_date(day)
+        label = "Hôm nay" if pq.relative_day == 0 else "Ngày mai"
+
+        # Map sang date có trong DB (nếu tuần đang nạp có chứa ngày này)
+        # Nếu không có, vẫn trả lời ngày/thứ cho người dùng.
+        events = cal.events_on(date_str)
         if events:
             return {"answer": format_events_full(events), "hits": events}
-        return {"answer": f"Ngày mai là **{date_str}, {dow}**. Mình chưa thấy lịch ngày này trong dữ liệu tuần đang có.", "hits": []}
+        return {"answer": f"{label} là **{date_str}, {dow}**. Mình chưa thấy lịch ngày này trong dữ liệu tuần đang có.", "hits": []}
 
-    # Phân loại intent còn lại
-    intent = classify_intent(q)
+    intent = pq.intent
 
     # DEFINE
     if intent == "DEFINE":
@@ -183,22 +186,22 @@ def ask(payload: Ask):
                 ans = f"{TMU_WEEKLY_KB['definition']}\n\n**Chức năng chính:**\n{bullets}\n\n{TMU_WEEKLY_KB['closing']}"
                 return {"answer": ans, "hits": []}
             return {"answer": f"{TMU_WEEKLY_KB['definition']}\n\n{TMU_WEEKLY_KB['closing']}", "hits": []}
-        return {"answer": _general_reply(q), "hits": []}
+        return ROUTE_GENERAL
 
     if intent == "SMALLTALK":
         return {"answer": _smalltalk_reply(q), "hits": []}
 
     if intent == "GENERAL":
-        return {"answer": _general_reply(q), "hits": []}
+        return ROUTE_GENERAL
 
     # SCHEDULE_ALL
     if intent == "SCHEDULE_ALL":
-        dates = list_all_dates()
+        dates = cal.dates
         if not dates:
             return {"answer": "Mình không tìm thấy thông tin trong lịch tuần này.", "hits": []}
         answers, all_hits = [], []
         for ds in dates:
-            evs = get_events_by_date(ds)
+            evs = cal.events_on(ds)
             if evs:
                 answers.append(format_events_full(evs))
                 all_hits.extend(evs)
@@ -207,14 +210,13 @@ def ask(payload: Ask):
 
     # SCHEDULE (theo ngày/giờ)
     # dd/mm/yyyy
-    m = RE_DDMMYYYY.search(q)
-    if m:
-        date_str = f"{int(m.group(1)):02d}/{int(m.group(2)):02d}/{int(m.group(3)):04d}"
-        events = get_events_by_date(date_str)
+    if pq.date:
+        date_str = pq.date
+        events = cal.events_on(date_str)
         if not events:
             return {"answer": f"Mình không tìm thấy hoạt động nào vào {date_str}.", "hits": []}
         if t_from:
-            filtered = filter_events_by_time(events, t_from, t_to)
+            filtered = cal.events_at(date_str, t_from, t_to)
             return {
                 "answer": format_events_time_in_day(filtered, date_str, events[0]["dow"], t_from, t_to),
                 "hits": filtered,
@@ -222,60 +224,151 @@ def ask(payload: Ask):
         return {"answer": format_events_full(events), "hits": events}
 
     # dd/mm
-    m2 = RE_DDMM.search(q)
-    if m2 and not m:
-        d, mth = int(m2.group(1)), int(m2.group(2))
-        for ds in list_all_dates():
-            dd, mm, _yy = ds.split("/")
-            if int(dd) == d and int(mm) == mth:
-                events = get_events_by_date(ds)
-                if events:
-                    if t_from:
-                        filtered = filter_events_by_time(events, t_from, t_to)
-                        return {
-                            "answer": format_events_time_in_day(filtered, ds, events[0]["dow"], t_from, t_to),
-                            "hits": filtered,
-                        }
-                    return {"answer": format_events_full(events), "hits": events}
-
-    # Thứ ...
-    mdow = RE_DOW.search(q)
-    if mdow:
-        canon_q = _canon_dow(mdow.group(0))
-        for d, dw in _fetch_all_date_dow_pairs():
-            if _canon_dow(dw) == canon_q or canon_q in _canon_dow(dw):
-                date_str = d
-                events = get_events_by_date(date_str)
-                if not events:
-                    return {"answer": f"Mình không tìm thấy hoạt động nào vào {mdow.group(0)}.", "hits": []}
+    if pq.day_month:
+        for ds in cal.dates_for_month_day(*pq.day_month):
+            events = cal.events_on(ds)
+            if events:
                 if t_from:
-                    filtered = filter_events_by_time(events, t_from, t_to)
+                    filtered = cal.events_at(ds, t_from, t_to)
                     return {
-                        "answer": format_events_time_in_day(filtered, date_str, events[0]["dow"], t_from, t_to),
+                        "answer": format_events_time_in_day(filtered, ds, events[0]["dow"], t_from, t_to),
                         "hits": filtered,
                     }
                 return {"answer": format_events_full(events), "hits": events}
 
+    # Thứ ...
+    if pq.dow:
+        for date_str in cal.dates_for_dow(pq.dow):
+            events = cal.events_on(date_str)
+            if not events:
+                return {"answer": f"Mình không tìm thấy hoạt động nào vào {pq.dow_text}.", "hits": []}
+            if t_from:
+                filtered = cal.events_at(date_str, t_from, t_to)
+                return {
+                    "answer": format_events_time_in_day(filtered, date_str, events[0]["dow"], t_from, t_to),
+                    "hits": filtered,
+                }
+            return {"answer": format_events_full(events), "hits": events}
+
     # Chỉ có giờ -> quét cả tuần
-    if t_from and not (m or m2 or mdow):
-        grouped, all_hits = {}, []
-        for ds in list_all_dates():
-            evs = get_events_by_date(ds)
-            hit = filter_events_by_time(evs, t_from, t_to)
-            if hit:
-                grouped[ds] = hit
-                all_hits.extend(hit)
+    if t_from and not pq.has_date:
+        grouped = cal.events_at_across_week(t_from, t_to)
+        all_hits = [ev for hit in grouped.values() for ev in hit]
         return {"answer": format_events_by_time_across_week(grouped, t_from, t_to), "hits": all_hits}
 
     # Fallback: RAG + LLM
-    hits = vector_search(q, k=20)
-    prompt = build_prompt(q, hits)
-    txt = call_gemini(prompt).strip()
-    wrapped = (
-        "Mình vừa xem trong lịch tuần và tổng hợp được như sau:\n\n"
-        + txt
-        + "\n\nBạn cần mình kiểm tra thêm ngày/đơn vị khác không?"
-        if txt
-        else "Mình không tìm thấy thông tin trong lịch tuần này."
-    )
-    return {"answer": wrapped, "hits": hits}
\ No newline at end of file
+    return ROUTE_RAG
+
+async def _retrieve(q: str) -> List[Dict]:
+    # encode + FAISS + FTS5 tốn CPU → chạy ở thread để không chặn event loop
+    return await asyncio.to_thread(hybrid_search, q, RETRIEVAL_TOP_K)
+
+def warm_up() -> None:
+    """Gọi lúc khởi động app: nạp model embedding, chạy thử FAISS, dựng sẵn lịch trong bộ nhớ."""
+    _warm_up_index()
+    get_calendar()
+
+def _record_prompt(prompt: str, hits: List[Dict], kept: List[Dict], t0: float, t1: float) -> None:
+    """Log + cộng dồn kích thước prompt, thời gian retrieval (t0→t1) và gọi LLM (t1→nay) của 1 request RAG."""
+    row = prompt_stats.record(prompt, len(hits), len(kept), (t1 - t0) * 1000, (time.perf_counter() - t1) * 1000)
+    log.info("RAG prompt chars=%(prompt_chars)d tokens~%(prompt_tokens)d contexts=%(contexts_kept)d/%(contexts_in)d "
+             "retrieve=%(retrieve_ms).1fms llm=%(llm_ms).1fms", row)
+
+async def _cache_lookup(q: str):
+    """
+    (kết quả cache hoặc None, vector câu hỏi, ParsedQuery); exact miss mới tách câu hỏi 1 lần,
+    bản đó dùng chung cho chữ ký gần-trùng, _route và answer_cache.put.
+    """
+    hit = answer_cache.get(q)
+    if hit is not None:
+        return hit, None, None
+    pq = parse_query(q)
+    if not answer_cache.semantic_enabled:
+        return None, None, pq
+    vec = await asyncio.to_thread(answer_cache.embed, q)
+    return answer_cache.get_similar(q, vec, pq), vec, pq
+
+def _cache_store(q: str, result: Dict, vec=None, pq: Optional[ParsedQuery] = None) -> None:
+    if result.get("answer") and result["answer"] != LLM_BUSY_REPLY:
+        answer_cache.put(q, result, vec, pq)
+
+async def ask(payload: Ask):
+    q = (payload.question or "").strip()
+    cached, vec, pq = await _cache_lookup(q)
+    if cached is not None:
+        return cached
+    res = await _ask_uncached(q, pq)
+    _cache_store(q, res, vec, pq)
+    return res
+
+async def _ask_uncached(q: str, pq: Optional[ParsedQuery] = None) -> Dict:
+    # _route đọc calendar/planner (đồng bộ, có thể phải dựng lại lịch từ SQLite) → chạy ở thread
+    routed = await asyncio.to_thread(_route, q, pq)
+    if isinstance(routed, dict):
+        return routed
+    if routed == ROUTE_GENERAL:
+        return {"answer": await _general_reply(q), "hits": []}
+
+    t0 = time.perf_counter()
+    hits = await _retrieve(q)
+    t1 = time.perf_counter()
+    prompt, kept = _rag_prompt(q, hits)
+    try:
+        txt = (await call_gemini(prompt)).strip()
+    except asyncio.TimeoutError:
+        log.warning("Gemini timeout (RAG fallback)")
+        return {"answer": LLM_BUSY_REPLY, "hits": kept}
+    except Exception:
+        log.exception("Gemini error (RAG fallback)")
+        return {"answer": LLM_BUSY_REPLY, "hits": kept}
+    finally:
+        _record_prompt(prompt, hits, kept, t0, t1)
+    wrapped = RAG_PREFIX + txt + RAG_SUFFIX if txt else NOT_FOUND_REPLY
+    return {"answer": wrapped, "hits": kept}
+
+async def ask_stream(payload: Ask) -> AsyncIterator[str]:
+    """
+    Như ask() nhưng trả từng đoạn text. Intent tất định/GENERAL ra 1 đoạn duy nhất;
+    nhánh RAG gửi RAG_PREFIX ngay (trước cả retrieval) rồi stream token từ Gemini.
+    """
+    q = (payload.question or "").strip()
+    cached, vec, pq = await _cache_lookup(q)
+    if cached is not None:
+        yield cached["answer"]
+        return
+    routed = await asyncio.to_thread(_route, q, pq)
+    if isinstance(routed, dict):
+        _cache_store(q, routed, vec, pq)
+        yield routed["answer"]
+        return
+    if routed == ROUTE_GENERAL:
+        res = {"answer": await _general_reply(q), "hits": []}
+        _cache_store(q, res, vec, pq)
+        yield res["answer"]
+        return
+
+    yield RAG_PREFIX
+    t0 = time.perf_counter()
+    hits = await _retrieve(q)
+    t1 = time.perf_counter()
+    prompt, kept = _rag_prompt(q, hits)
+    pieces: List[str] = []
+    try:
+        async for piece in _generate_stream(prompt):
+            pieces.append(piece)
+            yield piece
+    except asyncio.TimeoutError:
+        log.warning("Gemini timeout (RAG stream)")
+        yield ("\n\n" if pieces else "") + LLM_BUSY_REPLY
+        return
+    except Exception:
+        log.exception("Gemini error (RAG stream)")
+        yield ("\n\n" if pieces else "") + LLM_BUSY_REPLY
+        return
+    finally:
+        _record_prompt(prompt, hits, kept, t0, t1)
+    if not pieces:
+        yield NOT_FOUND_REPLY
+        return
+    yield RAG_SUFFIX
+    _cache_store(q, {"answer": RAG_PREFIX + "".join(pieces).strip() + RAG_SUFFIX, "hits": kept}, vec, pq)
\ No newline at end of file
@@ -6,6 +6,9 @@ load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "").strip()
 GEMINI_MODEL   = os.getenv("GEMINI_MODEL", "gemini-2.0-flash").strip()
+# deadline (giây) cho mỗi lời gọi Gemini và số lời gọi đồng thời tối đa / worker
+GEMINI_TIMEOUT      = float(os.getenv("GEMINI_TIMEOUT", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
 
 STORE_DIR   = os.getenv("STORE_DIR", "rag_store")
 SQLITE_PATH = os.path.join(STORE_DIR, "chunks.sqlite")
@@ -13,9 +16,75 @@ FAISS_PATH  = os.path.join(STORE_DIR, "index.faiss")
 
 LOCAL_EMB_MODEL = os.getenv("LOCAL_EMB_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 
-if not GEMINI_API_KEY:
-    raise RuntimeError("Missing GEMINI_API_KEY in .env")
-if not os.path.exists(SQLITE_PATH):
-    raise RuntimeError(f"SQLite DB not found: {SQLITE_PATH}")
-if not os.path.exists(FAISS_PATH):
-    raise RuntimeError(f"FAISS index not found: {FAISS_PATH}")
\ No newline at end of file
+# loại FAISS index dựng khi rebuild: auto | flat | hnsw | ivf_flat | ivf_pq
+# auto = flat khi số vector < FAISS_ANN_THRESHOLD, từ ngưỡng trở lên dùng ivf_flat (vẫn xoá được theo id)
+FAISS_INDEX_TYPE    = os.getenv("FAISS_INDEX_TYPE", "auto").strip().lower()
+FAISS_ANN_THRESHOLD = int(os.getenv("FAISS_ANN_THRESHOLD", "20000"))
+FAISS_IVF_NLIST     = int(os.getenv("FAISS_IVF_NLIST", "0"))    # 0 = tự chọn ~4*sqrt(n)
+FAISS_PQ_M          = int(os.getenv("FAISS_PQ_M", "0"))         # 0 = tự chọn (ước của dim)
+FAISS_HNSW_M        = int(os.getenv("FAISS_HNSW_M", "32"))
+# tham số lúc tìm (serving)
+FAISS_NPROBE         = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+# chu kỳ (giây) kiểm tra generation mới sau ingest để nạp lại FAISS
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "2"))
+
+# LRU embedding câu hỏi (io_store.embed_query) và warm-up model khi khởi động app
+QUERY_EMB_CACHE_SIZE = int(os.getenv("QUERY_EMB_CACHE_SIZE", "2048"))
+WARMUP_ON_STARTUP    = os.getenv("WARMUP_ON_STARTUP", "1").strip().lower() not in ("0", "false", "no")
+
+# phạm vi mặc định của vector_search: ±N ngày quanh hôm nay (0 = toàn bộ lịch sử; cửa sổ rỗng cũng tìm toàn bộ)
+# và chu kỳ bán rã (ngày) của trọng số gần-đây nhân vào score (0 = tắt)
+RETRIEVAL_WINDOW_DAYS            = int(os.getenv("RETRIEVAL_WINDOW_DAYS", "14"))
+RETRIEVAL_RECENCY_HALF_LIFE_DAYS = float(os.getenv("RETRIEVAL_RECENCY_HALF_LIFE_DAYS", "0"))
+
+# truy hồi lai (io_store.hybrid_search): số đoạn đưa vào prompt, số ứng viên mỗi nhánh (FAISS / FTS5 BM25)
+# và hằng số k của reciprocal rank fusion
+RETRIEVAL_TOP_K   = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "30"))
+HYBRID_RRF_K      = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# gói ngữ cảnh cho prompt RAG (rag/context_packer.py): ngân sách token ước lượng cho phần ngữ cảnh
+# và ngưỡng bỏ hit yếu theo tỉ lệ so với score cao nhất (0 = giữ hết)
+CONTEXT_TOKEN_BUDGET    = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.3"))
+
+# nạp hàng loạt (backend/ingest/bulk_import.py): số event mỗi lô encode + ghi SQLite, batch_size của encoder
+# và số tiến trình parse .docx (0 = số CPU)
+INGEST_BATCH_SIZE  = int(os.getenv("INGEST_BATCH_SIZE", "512"))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+INGEST_WORKERS     = int(os.getenv("INGEST_WORKERS", "0"))
+
+# hàng đợi ingest (backend/ingest/job_queue.py + worker.py): chu kỳ poll, job "running" không heartbeat quá
+# N giây coi như worker đã chết (cũng là thời hạn lease worker), số lần chạy lại tối đa, số job append gộp 1 lượt.
+# INGEST_WORKER_EMBEDDED=1 chạy worker trong tiến trình API (tiện khi dev; production nên chạy worker riêng)
+INGEST_POLL_INTERVAL    = float(os.getenv("INGEST_POLL_INTERVAL", "2"))
+INGEST_JOB_STALE_S      = float(os.getenv("INGEST_JOB_STALE_S", "300"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+INGEST_COALESCE_MAX     = int(os.getenv("INGEST_COALESCE_MAX", "16"))
+INGEST_WORKER_EMBEDDED  = os.getenv("INGEST_WORKER_EMBEDDED", "0").strip().lower() in ("1", "true", "yes")
+
+# cache câu trả lời (xem rag/answer_cache.py); ngưỡng cosine = 0 → tắt tầng gần-trùng
+ANSWER_CACHE_SIZE               = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL                = float(os.getenv("ANSWER_CACHE_TTL", "900"))
+ANSWER_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+# SQLite (xem rag/db.py)
+SQLITE_MMAP_SIZE       = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB        = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def require_serving_store() -> None:
+    """
+    Đường phục vụ chat cần đủ key + store đã ingest (gọi khi import io_store).
+    Ingest/admin chỉ import settings/db nên vẫn chạy được khi store còn trống.
+    """
+    if not GEMINI_API_KEY:
+        raise RuntimeError("Missing GEMINI_API_KEY in .env")
+    if not os.path.exists(SQLITE_PATH):
+        raise RuntimeError(f"SQLite DB not found: {SQLITE_PATH}")
+    # index được công bố theo generation (index.<gen>.faiss, trỏ bởi meta.faiss_file); store cũ dùng FAISS_PATH
+    if not os.path.exists(FAISS_PATH) and not any(
+            f.startswith("index.") and f.endswith(".faiss") for f in os.listdir(STORE_DIR)):
+        raise RuntimeError(f"FAISS index not found in {STORE_DIR}")
\ No newline at end of file
@@ -1,67 +1,81 @@
 # rag/textkit.py
 from __future__ import annotations
 import re
+from bisect import bisect_left, bisect_right
 from typing import Dict, List, Optional
 
-# Regex & parsing
-RE_DDMMYYYY = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b")
-RE_DDMM     = re.compile(r"\b(\d{1,2})[/-](\d{1,2})\b")
-RE_DOW = re.compile(
-    r"\b(t(h(ứ|u))\s*(2|3|4|5|6|7|hai|ba|tư|nam|năm|sáu|sau|bảy)|t[2-7]|chủ nhật|chu nhat|cn)\b",
-    re.IGNORECASE
-)
-RE_WEEK = re.compile(r"\b(lịch\s+toàn\s+tuần|toàn\s+tuần)\b", re.IGNORECASE)
-RE_DEFINE   = re.compile(r"\b(là gì|là cái gì|what\s+is)\b", re.IGNORECASE)
-RE_TIME     = re.compile(r"\b(\d{1,2})(?:(?::|[hH])\s?(\d{2})?)\b")
-RE_CALENDAR_HINT = re.compile(
-    r"\b(lịch|họp|công tác|sự kiện|kế hoạch|khai giảng|xét tuyển|hội đồng|hôm nay|tuần này|ngày mai|thứ|ngày|giờ|địa điểm)\b",
-    re.IGNORECASE,
-)
-RE_SMALLTALK = re.compile(
-    r"\b(xin chào|chào|hello|hi|bạn là ai|giới thiệu|tên bạn|làm công việc gì|what do you do|help|giúp)\b",
-    re.IGNORECASE,
-)
-
-# Hỏi ngày hôm nay (hoặc today)
-RE_TODAY = re.compile(
-    r"(h[oô]m\s*nay|today)", re.IGNORECASE
-)
+from .normalize import DOW_LABELS, RE_DOW, dow_key, iso_date
 
 
 def _time_to_int(t: str) -> int:
     h, m = t.split(":")
     return int(h) * 60 + int(m)
 
-def parse_times(query: str) -> tuple[Optional[str], Optional[str]]:
-    matches: List[str] = []
-    for m in RE_TIME.finditer(query):
-        prev = query[max(0, m.start()-6):m.start()].lower()
-        if re.search(r"thứ\s*$", prev):  # tránh nhầm "Thứ 5" -> 05:00
-            continue
-        h, mm = m.group(1), m.group(2) or "00"
-        matches.append(f"{int(h):02d}:{int(mm):02d}")
-    if not matches: return (None, None)
-    if len(matches) == 1: return (matches[0], None)
-    matches.sort()
-    return (matches[0], matches[-1])
+def _safe_minutes(t: Optional[str]) -> Optional[int]:
+    try:
+        return _time_to_int(t) if t else None
+    except (ValueError, AttributeError):
+        return None
+
+def with_minutes(ev: Dict) -> Dict:
+    """Gắn sẵn start_min/end_min (phút trong ngày) để khỏi parse 'HH:MM' mỗi request."""
+    ev["start_min"] = _safe_minutes(ev.get("start"))
+    ev["end_min"] = _safe_minutes(ev.get("end"))
+    return ev
+
+def _event_minutes(ev: Dict) -> tuple[Optional[int], Optional[int]]:
+    if "start_min" in ev:
+        return ev["start_min"], ev.get("end_min")
+    return _safe_minutes(ev.get("start")), _safe_minutes(ev.get("end"))
+
+def _time_match(si: int, ei: Optional[int], tf: int, tt: Optional[int], tolerance_min: int) -> bool:
+    if tt is None:
+        return abs(si - tf) <= tolerance_min or (si <= tf <= (si if ei is None else ei))
+    if ei is None:
+        return tf <= si <= tt
+    return max(si, tf) <= min(ei, tt)
 
 def filter_events_by_time(events: List[Dict], t_from: str, t_to: Optional[str] = None, tolerance_min: int = 5) -> List[Dict]:
     tf = _time_to_int(t_from)
     tt = _time_to_int(t_to) if t_to else None
     out: List[Dict] = []
     for ev in events:
-        s = ev.get("start"); e = ev.get("end")
-        if not s: continue
-        si = _time_to_int(s); ei = _time_to_int(e) if e else si
+        si, ei = _event_minutes(ev)
+        if si is None: continue
+        if _time_match(si, ei, tf, tt, tolerance_min):
+            out.append(ev)
+    return out
+
+class TimeIndex:
+    """
+    Chỉ mục theo đầu mút: events sắp theo start_min + độ dài lớn nhất.
+    Truy vấn chỉ bisect ra cửa sổ start có thể trùng rồi kiểm tra đúng điều kiện của
+    filter_events_by_time, nên O(log n + số ứng viên); kết quả giữ thứ tự đầu vào.
+    """
+
+    def __init__(self, events: List[Dict]):
+        entries = []
+        for pos, ev in enumerate(events):
+            si, ei = _event_minutes(ev)
+            if si is not None:
+                entries.append((si, pos, ei, ev))
+        entries.sort(key=lambda x: (x[0], x[1]))
+        self._starts = [e[0] for e in entries]
+        self._entries = entries
+        self._max_span = max((e[2] - e[0] for e in entries if e[2] is not None), default=0)
+        self._max_span = max(self._max_span, 0)
+
+    def query(self, t_from: str, t_to: Optional[str] = None, tolerance_min: int = 5) -> List[Dict]:
+        tf = _time_to_int(t_from)
+        tt = _time_to_int(t_to) if t_to else None
         if tt is None:
-            if abs(si - tf) <= tolerance_min or (si <= tf <= ei):
-                out.append(ev)
+            lo, hi = tf - max(tolerance_min, self._max_span), tf + tolerance_min
         else:
-            if not e:
-                if tf <= si <= tt: out.append(ev)
-            else:
-                if max(si, tf) <= min(ei, tt): out.append(ev)
-    return out
+            lo, hi = tf - self._max_span, tt
+        i, j = bisect_left(self._starts, lo), bisect_right(self._starts, hi)
+        found = [e for e in self._entries[i:j] if _time_match(e[0], e[2], tf, tt, tolerance_min)]
+        found.sort(key=lambda e: e[1])
+        return [e[3] for e in found]
 
 # KB & DOW normalization
 TMU_WEEKLY_KB = {
@@ -90,32 +104,15 @@ SMALLTALK_TEMPLATES = {
     "help": "Bạn có thể hỏi: “Thứ 5 có gì?”, “20/08/2025 họp gì?”, hoặc “các hoạt động về EMBA”.",
 }
 
-_DOW_ALIASES = {
-    "thu2": {"thu2", "thứ 2", "thứ hai", "t2", "thu hai", "thu 2"},
-    "thu3": {"thu3", "thứ 3", "thứ ba", "t3", "thu ba", "thu 3"},
-    "thu4": {"thu4", "thứ 4", "thứ tư", "t4", "thu tu", "thu 4"},
-    "thu5": {"thu5", "thứ 5", "thứ năm", "t5", "thu nam", "thu 5"},
-    "thu6": {"thu6", "thứ 6", "thứ sáu", "t6", "thu sau", "thu 6"},
-    "thu7": {"thu7", "thứ 7", "thứ bảy", "t7", "thu bay", "thu 7"},
-    "cn":   {"cn", "chủ nhật", "chu nhat", "chủ nhật"},
-}
-
-_DOW_MAP = {
-    "thứ 2": ["thứ hai", "thu hai", "th2", "t2", "thứ 2"],
-    "thứ 3": ["thứ ba", "thu ba", "th3", "t3", "thứ 3"],
-    "thứ 4": ["thứ tư", "thu tu", "th4", "t4", "thứ 4"],
-    "thứ 5": ["thứ năm", "thu nam", "th5", "t5", "thứ 5"],
-    "thứ 6": ["thứ sáu", "thu sau", "th6", "t6", "thứ 6"],
-    "thứ 7": ["thứ bảy", "thu bay", "th7", "t7", "thứ 7"],
-    "chủ nhật": ["chủ nhật", "chu nhat", "cn"],
-}
-
 def _canon_dow(s: str) -> str:
-    q = re.sub(r"\s+", " ", (s or "").strip().lower())
-    for canon, variants in _DOW_MAP.items():
-        if any(q == v for v in variants) or any(v in q for v in variants):
-            return canon
-    return q
+    """Nhãn thứ chuẩn ('thứ 5', 'chủ nhật') qua rag/normalize.dow_key; không phải thứ thì giữ nguyên (chữ thường)."""
+    key = dow_key(s)
+    return DOW_LABELS[key] if key else re.sub(r"\s+", " ", (s or "").strip().lower())
+
+def normalize_question(q: str) -> str:
+    """Khoá so khớp câu hỏi: chữ thường, gộp khoảng trắng, bỏ dấu câu cuối, thứ về dạng chuẩn."""
+    qn = re.sub(r"\s+", " ", (q or "").strip().lower()).rstrip(" ?!.…")
+    return RE_DOW.sub(lambda m: _canon_dow(m.group(0)), qn)
 
 # Formatters
 def _format_event_lines(events: list[dict]) -> list[str]:
@@ -141,6 +138,10 @@ def _format_event_lines(events: list[dict]) -> list[str]:
         out_blocks.append("\n".join(block_lines))
     return out_blocks
 
+def _date_order(date_str: str, evs: list[dict]) -> str:
+    """Khoá sắp ngày: date_iso tính sẵn lúc ingest (calendar/SQLite), thiếu thì mới tự chuyển."""
+    return (evs[0].get("date_iso") if evs else None) or iso_date(date_str) or date_str
+
 def format_events_full(events: list[dict]) -> str:
     if not events:
         return "Mình không tìm thấy thông tin trong lịch tuần này"
@@ -164,9 +165,25 @@ def format_events_by_time_across_week(grouped, t_from, t_to):
     if not grouped:
         return f"Mình đã rà cả tuần nhưng không thấy hoạt động nào đúng vào {pretty}."
     parts = [f"Mình vừa lọc các hoạt động trong tuần theo khung giờ {pretty}:\n"]
-    for date_str in sorted(grouped.keys(), key=lambda d: tuple(map(int, d.split('/')[::-1]))):
+    for date_str in sorted(grouped, key=lambda d: _date_order(d, grouped[d])):
         evs = grouped[date_str]; dw = evs[0].get("dow")
         parts.append(f"\n**{date_str}, {dw}:**")
         parts.append("\n\n".join(_format_event_lines(evs)))
     parts.append("\n\nBạn muốn mình xem ngày/đơn vị khác không?")
-    return "\n".join(parts)
\ No newline at end of file
+    return "\n".join(parts)
+
+def format_events_matching(grouped, criteria: str, count: bool = False):
+    """grouped: 'dd/mm/yyyy' -> events khớp planner; criteria: mô tả điều kiện lọc (đã định dạng)."""
+    if not grouped:
+        return f"Mình đã rà lịch nhưng không thấy hoạt động nào {criteria}."
+    n = sum(len(evs) for evs in grouped.values())
+    if count:
+        parts = [f"Mình đếm được **{n}** hoạt động {criteria}:\n"]
+    else:
+        parts = [f"Đây là các hoạt động {criteria}:\n"]
+    for date_str in sorted(grouped, key=lambda d: _date_order(d, grouped[d])):
+        evs = grouped[date_str]; dw = evs[0].get("dow")
+        parts.append(f"\n**{date_str}, {dw}:**")
+        parts.append("\n\n".join(_format_event_lines(evs)))
+    parts.append("\n\nBạn muốn mình lọc thêm theo ngày/khung giờ/đơn vị khác không?")
+    return "\n".join(parts)
@@ -370,6 +370,16 @@ async function loadUploads(){
   }
 }
 
+// "running · encode 120/480" khi worker đang chạy job; các trạng thái khác giữ nguyên
+function uploadStatus(it){
+  const st = it.status ?? "";
+  if (st !== "running" || !it.stage) return st;
+  // zip đọc dần nên chưa biết tổng: chỉ hiện số đoạn đã xử lý
+  const n = it.chunks_total ? ` ${it.chunks_done ?? 0}/${it.chunks_total}`
+          : it.chunks_done ? ` ${it.chunks_done}` : "";
+  return `${st} · ${it.stage}${n}`;
+}
+
 function renderUploadsTable(items){
   if (!tbl) return;
   if (!items || items.length === 0) {
@@ -400,7 +410,7 @@ function renderUploadsTable(items){
       <td>${escapeHtml(it.mode ?? "")}</td>
       <td>${it.added_events ?? ""}</td>
       <td>${it.total_events ?? ""}</td>
-      <td>${escapeHtml(it.status ?? "")}</td>
+      <td>${escapeHtml(uploadStatus(it))}</td>
       <td>${escapeHtml(it.created_at ?? "")}</td>
     </tr>
   `).join("");
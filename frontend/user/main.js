@@ -146,6 +146,62 @@
     return res.json();
   }
 
+  // ---- Gọi backend dạng stream (SSE qua fetch, vì EventSource không hỗ trợ POST) ----
+  async function askBackendStream(message, onDelta) {
+    const res = await fetch("/api/chat/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+      body: JSON.stringify({ message }),
+    });
+    if (!res.ok || !res.body) {
+      const text = await res.text().catch(() => "");
+      throw new Error(`HTTP ${res.status} ${res.statusText}${text ? ` - ${text}` : ""}`);
+    }
+
+    const reader  = res.body.getReader();
+    const decoder = new TextDecoder("utf-8");
+    let buf = "";
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+
+      // mỗi event SSE kết thúc bằng 1 dòng trống
+      let sep;
+      while ((sep = buf.indexOf("\n\n")) >= 0) {
+        const raw = buf.slice(0, sep);
+        buf = buf.slice(sep + 2);
+        let event = "message", data = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        const payload = data ? JSON.parse(data) : {};
+        if (event === "error") throw new Error(payload.detail || "stream error");
+        if (event === "done") return;
+        if (payload.delta) onDelta(payload.delta);
+      }
+    }
+  }
+
+  // Vẽ lại bubble theo từng khung hình khi text đang stream về
+  function streamRenderer(el) {
+    let text = "", pending = false;
+    return {
+      push(delta) {
+        text += delta;
+        if (pending) return;
+        pending = true;
+        requestAnimationFrame(() => {
+          pending = false;
+          el.innerHTML = md(text);
+          if (!autoScrollLocked && isNearBottom(chat)) scrollToBottom(false);
+        });
+      },
+      get text() { return text; },
+    };
+  }
+
   // ---- Form submit ----
   form.addEventListener("submit", async (e) => {
     e.preventDefault();
@@ -166,15 +222,35 @@
       dotsOn = !dotsOn;
     }, 400);
 
+    const view = streamRenderer(placeholder);
     try {
-      const data = await askBackend(msg);
-      clearInterval(dotsTimer);
-      // trước khi type: nếu người dùng đang xem lịch sử, không kéo
-      typeWriter(placeholder, data?.answer || "Xin lỗi, mình chưa có câu trả lời phù hợp.");
-    } catch (err) {
+      await askBackendStream(msg, (delta) => {
+        clearInterval(dotsTimer);
+        view.push(delta);
+      });
       clearInterval(dotsTimer);
-      placeholder.innerHTML = `<p class="error">⚠️ Lỗi: ${escapeHtml(String(err))}</p>`;
+      if (!view.text) {
+        placeholder.innerHTML = md("Xin lỗi, mình chưa có câu trả lời phù hợp.");
+      }
       if (!autoScrollLocked) scrollToBottom(true);
+      input.focus({ preventScroll: true });
+    } catch (streamErr) {
+      // stream lỗi trước khi có chữ nào → thử lại bằng /api/chat thường
+      if (view.text) {
+        clearInterval(dotsTimer);
+        placeholder.innerHTML = md(view.text) + `<p class="error">⚠️ Lỗi: ${escapeHtml(String(streamErr))}</p>`;
+        return;
+      }
+      try {
+        const data = await askBackend(msg);
+        clearInterval(dotsTimer);
+        // trước khi type: nếu người dùng đang xem lịch sử, không kéo
+        typeWriter(placeholder, data?.answer || "Xin lỗi, mình chưa có câu trả lời phù hợp.");
+      } catch (err) {
+        clearInterval(dotsTimer);
+        placeholder.innerHTML = `<p class="error">⚠️ Lỗi: ${escapeHtml(String(err))}</p>`;
+        if (!autoScrollLocked) scrollToBottom(true);
+      }
     }
   });
 
@@ -0,0 +1,14 @@
+# tests/conftest.py — store rỗng (SQLite + FAISS index 0 vector) để import được rag.io_store/planner
+# (require_serving_store + nạp index lúc import); test chỉ dùng lịch dựng sẵn trong bộ nhớ.
+import os
+import sqlite3
+import tempfile
+
+import faiss
+
+_STORE = tempfile.mkdtemp(prefix="rag_store_test_")
+sqlite3.connect(os.path.join(_STORE, "chunks.sqlite")).close()
+faiss.write_index(faiss.IndexIDMap2(faiss.IndexFlatIP(8)), os.path.join(_STORE, "index.faiss"))
+
+os.environ["STORE_DIR"] = _STORE
+os.environ.setdefault("GEMINI_API_KEY", "test")
@@ -0,0 +1,53 @@
+# tests/test_answer_cache.py — chữ ký ngữ nghĩa lịch của cache gần-trùng
+import numpy as np
+
+from backend.rag import answer_cache as ac
+from backend.rag.answer_cache import _signature
+from backend.rag.query_parser import parse_query
+from backend.rag.textkit import normalize_question
+
+
+def _sig(q):
+    return _signature(normalize_question(q), parse_query(q))
+
+
+def test_relative_day_without_diacritics():
+    assert _sig("hom nay co hop khong") != _sig("ngay mai co hop khong")
+    assert _sig("hom nay co hop khong") == _sig("hôm nay có họp không")
+    assert _sig("ngay mai co hop khong") == _sig("Ngày mai có họp không?")
+
+
+def test_part_of_day_relative():
+    assert _sig("sáng nay có gì") != _sig("sáng mai có gì")
+
+
+def test_dow_spellings_share_signature():
+    assert _sig("thứ 5 có họp gì") == _sig("thu nam co hop gi") == _sig("T5 có họp gì")
+    assert _sig("thứ 5 có họp gì") != _sig("thứ 6 có họp gì")
+
+
+def test_numbers_and_ranges():
+    assert _sig("20/08 có gì") != _sig("21/08 có gì")
+    assert _sig("3 ngày tới có gì") != _sig("3 ngày qua có gì")
+    assert _sig("tuần sau có gì") != _sig("tuan truoc co gi")
+
+
+def test_part_of_day_location_and_keywords():
+    assert _sig("sáng thứ 5 có gì") != _sig("chiều thứ 5 có gì")
+    assert _sig("EMBA họp khi nào") != _sig("BGH họp khi nào")
+    assert _sig("có họp ở hội trường A không") != _sig("có họp ở hội trường B không")
+    assert _sig("2h chiều có họp không") != _sig("2h sáng có họp không")
+    assert _sig("EMBA họp khi nào") == _sig("emba hop khi nao")
+
+
+def test_put_skips_signature_without_semantic_tier(monkeypatch):
+    def _boom(q):
+        raise AssertionError("parse_query called")
+    monkeypatch.setattr(ac, "parse_query", _boom)
+    cache = ac.AnswerCache(4, 60)
+    cache.put("thứ 5 có gì", {"answer": "x"})
+    assert cache.get("Thứ 5 có gì?") == {"answer": "x"}
+    # tầng gần-trùng bật: dùng ParsedQuery service đã có, không parse lại
+    cache = ac.AnswerCache(4, 60, semantic_threshold=0.9)
+    cache.put("thứ 5 có gì", {"answer": "x"}, np.ones(2, dtype="float32"), parse_query("thứ 5 có gì"))
+    assert cache._items[cache._key("thứ 5 có gì")][2] == _sig("thứ 5 có gì")
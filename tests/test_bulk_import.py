@@ -0,0 +1,22 @@
+# tests/test_bulk_import.py — parse_stream: process pool (spawn) cho cùng events, cùng thứ tự file như parse tuần tự
+from docx import Document
+
+from backend.ingest.bulk_import import iter_sources, parse_stream
+
+
+def _week(path, day):
+    doc = Document()
+    t = doc.add_table(rows=1, cols=2)
+    t.cell(0, 0).text, t.cell(0, 1).text = f"Thứ 2\n{day}/08", "8h00 Họp giao ban"
+    doc.save(path)
+
+
+def test_pool_matches_serial(tmp_path):
+    for name, day in (("a.docx", 18), ("b.docx", 25), ("c.docx", 11)):
+        _week(tmp_path / name, day)
+    stats = []
+    pooled = list(parse_stream(iter_sources(str(tmp_path)), workers=2, year=2025, file_stats=stats))
+    serial = list(parse_stream(iter_sources(str(tmp_path)), workers=1, year=2025))
+    assert pooled == serial
+    assert [ev["date"] for ev in pooled] == ["18/08/2025", "25/08/2025", "11/08/2025"]
+    assert [st["file"] for st in stats] == ["a.docx", "b.docx", "c.docx"]
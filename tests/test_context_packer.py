@@ -0,0 +1,35 @@
+# tests/test_context_packer.py — lọc hit theo cosine và ngân sách token khi gói ngữ cảnh
+from backend.rag.context_packer import pack_contexts
+
+
+def _hit(id_, score, dense=None, date="20/08/2025", start="08:00"):
+    h = {"id": id_, "date": date, "dow": "Thứ 4", "start": start, "end": None, "title": f"Họp {id_}",
+         "location": None, "participants": None, "raw": None, "score": score}
+    if dense is not None:
+        h["dense_score"] = dense
+    return h
+
+
+def test_min_score_ratio_uses_dense_score():
+    # điểm RRF sát nhau (~0.68x top), cosine thì hit 3 rất xa
+    hits = [_hit(1, 0.0328, 0.82), _hit(2, 0.0323, 0.71), _hit(3, 0.0222, 0.12)]
+    _, kept = pack_contexts(hits, budget_tokens=1000, min_score_ratio=0.3)
+    assert [h["id"] for h in kept] == [1, 2]
+
+
+def test_lexical_only_hit_is_kept():
+    hits = [_hit(1, 0.0328, 0.82), _hit(2, 0.0161)]
+    _, kept = pack_contexts(hits, budget_tokens=1000, min_score_ratio=0.3)
+    assert [h["id"] for h in kept] == [1, 2]
+
+
+def test_plain_scores_and_date_grouping():
+    hits = [_hit(1, 0.9, date="21/08/2025"), _hit(2, 0.8, start="14:00"), _hit(3, 0.1)]
+    ctx, kept = pack_contexts(hits, budget_tokens=1000, min_score_ratio=0.3)
+    assert [h["id"] for h in kept] == [1, 2]
+    assert ctx.index("[20/08/2025") < ctx.index("[21/08/2025")
+
+
+def test_budget_keeps_at_least_one():
+    _, kept = pack_contexts([_hit(1, 0.9, 0.9), _hit(2, 0.8, 0.8)], budget_tokens=1, min_score_ratio=0.0)
+    assert [h["id"] for h in kept] == [1]
@@ -0,0 +1,71 @@
+# tests/test_date_range.py — biên [từ, đến] (tính cả 2 đầu) của các cụm ngày trong câu hỏi
+from datetime import date
+
+from backend.rag import date_range
+from backend.rag.query_parser import parse_query
+
+TODAY = date(2025, 8, 20)   # thứ 4
+
+
+def _bounds(rng):
+    return rng[0], rng[1]
+
+
+def test_week():
+    assert _bounds(date_range.week(TODAY)) == (date(2025, 8, 18), date(2025, 8, 24))
+    assert _bounds(date_range.week(TODAY, "sau")) == (date(2025, 8, 25), date(2025, 8, 31))
+    assert _bounds(date_range.week(TODAY, "trước")) == (date(2025, 8, 11), date(2025, 8, 17))
+
+
+def test_week_starts_monday_on_sunday():
+    assert _bounds(date_range.week(date(2025, 8, 24))) == (date(2025, 8, 18), date(2025, 8, 24))
+
+
+def test_weekend():
+    assert _bounds(date_range.weekend(TODAY)) == (date(2025, 8, 23), date(2025, 8, 24))
+    assert _bounds(date_range.weekend(TODAY, "tới")) == (date(2025, 8, 30), date(2025, 8, 31))
+
+
+def test_month():
+    assert _bounds(date_range.month(TODAY)) == (date(2025, 8, 1), date(2025, 8, 31))
+    assert _bounds(date_range.month(TODAY, "trước")) == (date(2025, 7, 1), date(2025, 7, 31))
+    assert _bounds(date_range.month(date(2025, 12, 5), "sau")) == (date(2026, 1, 1), date(2026, 1, 31))
+    assert _bounds(date_range.month(TODAY, month_no=2, year=2024)) == (date(2024, 2, 1), date(2024, 2, 29))
+    assert date_range.month(TODAY, month_no=13) is None
+
+
+def test_next_days_counts_today():
+    # "3 ngày tới" = đúng 3 ngày lịch: hôm nay, mai, kia
+    assert _bounds(date_range.next_days(TODAY, 3, "tới")) == (date(2025, 8, 20), date(2025, 8, 22))
+    assert _bounds(date_range.next_days(TODAY, 1, "sắp tới")) == (TODAY, TODAY)
+
+
+def test_past_days_counts_today():
+    assert _bounds(date_range.next_days(TODAY, 3, "qua")) == (date(2025, 8, 18), date(2025, 8, 20))
+    assert _bounds(date_range.next_days(TODAY, 7, "vừa  qua")) == (date(2025, 8, 14), date(2025, 8, 20))
+
+
+def test_next_days_out_of_range():
+    assert date_range.next_days(TODAY, 0, "tới") is None
+    assert date_range.next_days(TODAY, 400, "tới") is None
+
+
+def test_explicit_span():
+    assert _bounds(date_range.span(TODAY, "20/08", "25/08/2025")) == (date(2025, 8, 20), date(2025, 8, 25))
+    # đầu thiếu năm mượn năm của đầu kia; ngược chiều thì đầu thiếu năm sang năm kế / lùi năm trước
+    assert _bounds(date_range.span(TODAY, "28/12/2024", "02/01")) == (date(2024, 12, 28), date(2025, 1, 2))
+    assert _bounds(date_range.span(TODAY, "28/12", "02/01")) == (date(2025, 12, 28), date(2026, 1, 2))
+    assert _bounds(date_range.span(TODAY, "28/12", "02/01/2025")) == (date(2024, 12, 28), date(2025, 1, 2))
+    assert _bounds(date_range.span(TODAY, "20/08", "25/08/2024")) == (date(2024, 8, 20), date(2024, 8, 25))
+    # chỉ đổi chỗ khi cả hai đầu đều ghi năm
+    assert _bounds(date_range.span(TODAY, "25/08/2025", "20/08/2025")) == (date(2025, 8, 20), date(2025, 8, 25))
+    assert date_range.span(TODAY, "32/08", "25/08") is None
+
+
+def test_parse_query_ranges():
+    pq = parse_query("3 ngày tới có họp gì", today=TODAY)
+    assert (pq.date_from, pq.date_to) == (date(2025, 8, 20), date(2025, 8, 22))
+    pq = parse_query("cuối tuần này có lịch gì không", today=TODAY)
+    assert (pq.date_from, pq.date_to) == (date(2025, 8, 23), date(2025, 8, 24))
+    pq = parse_query("từ 20/08 đến 25/08 có họp hội đồng không", today=TODAY)
+    assert (pq.date_from, pq.date_to) == (date(2025, 8, 20), date(2025, 8, 25))
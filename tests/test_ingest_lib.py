@@ -0,0 +1,85 @@
+# tests/test_ingest_lib.py — chunks_fts (FTS5) đồng bộ với chunks qua trigger khi thêm / xoá / thay dòng; hook on_publish
+import sqlite3
+
+import faiss
+import numpy as np
+import pytest
+
+from backend.ingest import ingest_lib
+from backend.rag.db import write_conn
+
+
+def _ev(title, participants="", date="20/08/2025"):
+    return {"date": date, "dow": "Thứ 4", "start": "08:00", "end": None, "location": "Phòng họp số 1",
+            "participants": participants, "title": title, "raw": f"8h00 {title}"}
+
+
+@pytest.fixture
+def conn(tmp_path):
+    c = write_conn(str(tmp_path / "chunks.sqlite"))
+    ingest_lib._ensure_schema(c)
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE name='chunks_fts'").fetchone():
+        pytest.skip("SQLite without FTS5")
+    yield c
+    c.close()
+
+
+def _match(conn, term):
+    return [r[0] for r in conn.execute("SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY rowid",
+                                       (f'"{term}"',))]
+
+
+def _add(conn, first_id, events):
+    ingest_lib._insert_records(conn.cursor(), first_id, ingest_lib._load_events_texts(events), "t", None)
+    conn.commit()
+
+
+def test_fts_follows_insert_and_delete(conn):
+    _add(conn, 0, [_ev("Họp EMBA", "Khoa Sau đại học"), _ev("Họp giao ban", "BGH")])
+    assert _match(conn, "emba") == [0]
+    # không dấu vẫn khớp (tokenize remove_diacritics)
+    assert _match(conn, "hop giao ban") == [1]
+
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    index.add_with_ids(np.eye(2, 4, dtype="float32"), np.arange(2, dtype="int64"))
+    assert ingest_lib._remove_ids(conn, index, [0]) == 1
+    conn.commit()
+    assert _match(conn, "emba") == []
+    assert _match(conn, "bgh") == [1]
+
+
+def test_fts_follows_update_and_replace(conn):
+    _add(conn, 0, [_ev("Họp EMBA"), _ev("Họp giao ban", "BGH")])
+    conn.execute("UPDATE chunks SET title='Hội đồng xét tuyển' WHERE id=0")
+    conn.commit()
+    assert _match(conn, "emba") == [0]              # raw vẫn còn "EMBA"
+    assert _match(conn, "tuyển") == [0]
+
+    # thay dòng trùng hash (INSERT OR REPLACE, recursive_triggers): nội dung cũ rời FTS, nội dung mới vào
+    conn.execute("INSERT OR REPLACE INTO chunks(id, hash, title, participants, location, raw) "
+                 "SELECT 5, hash, 'Lễ khai giảng', 'Toàn trường', location, 'Lễ khai giảng' FROM chunks WHERE id=1")
+    conn.commit()
+    assert _match(conn, "bgh") == _match(conn, "giao") == []
+    assert _match(conn, "khai giang") == [5]
+
+
+def test_delete_calls_on_publish_before_taking_write_lock(conn, tmp_path):
+    _add(conn, 0, [_ev("Họp EMBA", date="20/08/2025"), _ev("Họp giao ban", date="21/08/2025")])
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(4))
+    index.add_with_ids(np.eye(2, 4, dtype="float32"), np.arange(2, dtype="int64"))
+    ingest_lib._publish(conn, str(tmp_path / "index.faiss"), index)
+
+    calls = []
+
+    def _on_publish():
+        # worker ghi stage="commit" qua kết nối khác: lúc này ingest chưa được giữ khoá ghi
+        other = sqlite3.connect(str(tmp_path / "chunks.sqlite"), timeout=0)
+        other.execute("BEGIN IMMEDIATE")
+        other.rollback()
+        other.close()
+        calls.append(True)
+
+    res = ingest_lib.delete_events(str(tmp_path), date_from="20/08/2025", date_to="20/08/2025",
+                                   on_publish=_on_publish)
+    assert calls == [True]
+    assert (res["removed"], res["total_after"]) == (1, 1)
@@ -0,0 +1,85 @@
+# tests/test_io_store.py — phạm vi tìm vector theo ngày/tag (_scope_ids) và tìm có IDSelector (_scoped_search)
+from datetime import date
+
+import faiss
+import numpy as np
+import pytest
+
+from backend.rag import io_store
+
+DIM = 8
+# id → (ngày, tag); id 13 không rõ ngày
+ROWS = {
+    10: ("18/08/2025", "w34"),
+    11: ("20/08/2025", "w34"),
+    12: ("25/08/2025", "w35"),
+    13: ("", "w35"),
+}
+
+
+def _meta():
+    cm = object.__new__(io_store._ChunkMeta)
+    cm.generation = 0
+    cm.ids = np.array(list(ROWS), dtype="int64")
+    cm.days = np.array([io_store._day_ordinal(d) for d, _ in ROWS.values()], dtype="int64")
+    cm.tags = np.array([t for _, t in ROWS.values()], dtype=object)
+    return cm
+
+
+@pytest.fixture
+def meta(monkeypatch):
+    monkeypatch.setattr(io_store, "_get_chunk_meta", _meta)
+
+
+def test_scope_by_date_window(meta):
+    ids = io_store._scope_ids(date(2025, 8, 19), date(2025, 8, 24), None)
+    assert ids.tolist() == [11]
+    # chỉ có cận dưới: ngày không rõ (13) vẫn bị loại
+    assert io_store._scope_ids(date(2025, 8, 20), None, None).tolist() == [11, 12]
+
+
+def test_scope_by_tag_and_empty(meta):
+    assert io_store._scope_ids(None, None, "w35").tolist() == [12, 13]
+    assert io_store._scope_ids(date(2025, 8, 18), date(2025, 8, 24), "w35").tolist() == []
+
+
+def _vectors():
+    rng = np.random.default_rng(0)
+    vecs = rng.normal(size=(len(ROWS), DIM)).astype("float32")
+    faiss.normalize_L2(vecs)
+    return vecs
+
+
+def _flat(vecs, ids):
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(DIM))
+    index.add_with_ids(vecs, ids)
+    return index
+
+
+def _hnsw(vecs, ids):
+    index = faiss.IndexIDMap2(faiss.IndexHNSWFlat(DIM, 16, faiss.METRIC_INNER_PRODUCT))
+    index.add_with_ids(vecs, ids)
+    return index
+
+
+def _ivf(vecs, ids):
+    index = faiss.IndexIVFFlat(faiss.IndexFlatIP(DIM), DIM, 2, faiss.METRIC_INNER_PRODUCT)
+    rng = np.random.default_rng(1)
+    index.train(np.vstack([vecs, rng.normal(size=(80, DIM)).astype("float32")]))
+    index.add_with_ids(vecs, ids)
+    index.nprobe = 1
+    return index
+
+
+@pytest.mark.parametrize("build", [_flat, _hnsw, _ivf])
+def test_scoped_search_returns_only_in_scope_ids(meta, build):
+    vecs = _vectors()
+    ids = np.array(list(ROWS), dtype="int64")
+    index = build(vecs, ids)
+    scope = io_store._scope_ids(date(2025, 8, 19), date(2025, 8, 31), None)     # 11, 12
+    # câu hỏi trùng đúng vector của id 10 (ngoài phạm vi): không lọc thì nó đứng đầu, có lọc thì không lọt vào
+    assert io_store._scoped_search(index, vecs[:1], 1, None)[1][0][0] == 10
+    D, I = io_store._scoped_search(index, vecs[:1], 4, scope)
+    found = [i for i in I[0].tolist() if i >= 0]
+    assert sorted(found) == [11, 12]
+    assert list(D[0][:2]) == sorted(D[0][:2], reverse=True)
@@ -0,0 +1,91 @@
+# tests/test_job_queue.py — hàng đợi ingest: gộp job append, lease worker, đưa job của worker chết về hàng đợi
+import time
+
+import pytest
+
+from backend.ingest import job_queue
+from backend.rag.db import write_conn
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "chunks.sqlite")
+    conn = write_conn(path)
+    job_queue.ensure_tables(conn)
+    yield path, conn
+    conn.close()
+
+
+def _status(conn, job_id):
+    return conn.execute("SELECT status, owner, attempts FROM ingest_jobs WHERE id=?", (job_id,)).fetchone()
+
+
+def test_claim_coalesces_append_jobs_only(db):
+    path, conn = db
+    _, a = job_queue.enqueue(path, "docx", "append", "a.docx")
+    _, b = job_queue.enqueue(path, "docx", "append", "b.docx")
+    _, r = job_queue.enqueue(path, "docx", "replace", "c.docx")
+    _, d = job_queue.enqueue(path, "docx", "append", "d.docx")
+
+    jobs = job_queue.claim(conn, "w1")
+    assert [j.id for j in jobs] == [a, b]
+    assert _status(conn, a) == _status(conn, b) == ("running", "w1", 1)
+    # replace chạy riêng, và job append xếp sau nó không bị kéo lên trước
+    assert [j.id for j in job_queue.claim(conn, "w1")] == [r]
+    assert [j.id for j in job_queue.claim(conn, "w1")] == [d]
+    assert job_queue.claim(conn, "w1") == []
+
+
+def test_lease_is_exclusive_until_expired(db):
+    _, conn = db
+    assert job_queue.acquire_lease(conn, "w1", 60)
+    assert not job_queue.acquire_lease(conn, "w2", 60)
+    assert job_queue.acquire_lease(conn, "w1", 60)          # gia hạn
+    assert job_queue.acquire_lease(conn, "w1", -1)          # hết hạn ngay
+    assert job_queue.acquire_lease(conn, "w2", 60)
+
+
+def test_stale_job_is_requeued_exactly_once(db):
+    path, conn = db
+    upload_id, job_id = job_queue.enqueue(path, "docx", "append", "a.docx")
+    jobs = job_queue.claim(conn, "w1")
+    # worker w1 chết: heartbeat dừng từ 10 phút trước
+    conn.execute("UPDATE ingest_jobs SET heartbeat_at=? WHERE id=?", (time.time() - 600, job_id))
+    conn.commit()
+
+    assert job_queue.recover_stale(conn, "w2", 300) == 1
+    assert _status(conn, job_id) == ("queued", None, 1)
+    assert conn.execute("SELECT status FROM uploads WHERE id=?", (upload_id,)).fetchone()[0] == "queued"
+    assert job_queue.recover_stale(conn, "w2", 300) == 0
+
+    again = job_queue.claim(conn, "w2")
+    assert [j.id for j in again] == [j.id for j in jobs]
+    assert _status(conn, job_id) == ("running", "w2", 2)
+    # job đang có heartbeat mới không bị worker khác lấy lại
+    job_queue.heartbeat(conn, again, "w2", 300)
+    assert job_queue.recover_stale(conn, "w3", 300) == 0
+
+
+def test_stale_job_fails_after_max_attempts(db, monkeypatch):
+    path, conn = db
+    monkeypatch.setattr(job_queue, "INGEST_JOB_MAX_ATTEMPTS", 1)
+    _, job_id = job_queue.enqueue(path, "docx", "append", "a.docx")
+    job_queue.claim(conn, "w1")
+    assert job_queue.recover_stale(conn, "w1", 300) == 1     # chính owner vừa khởi động lại
+    assert _status(conn, job_id)[0] == "failed"
+
+
+def test_run_job_goes_through_queue_and_lease(tmp_path):
+    from backend.ingest import worker
+
+    store = str(tmp_path / "store")
+    upload_id, job_id = job_queue.enqueue(f"{store}/chunks.sqlite", "delete", "delete", "", params={"tag": "w34"})
+    res = worker.run_job(store, upload_id, job_id)
+    assert (res["removed"], res["total_after"]) == (0, 0)
+    conn = write_conn(f"{store}/chunks.sqlite")
+    try:
+        assert _status(conn, job_id)[0] == "done"
+        # lease được trả lại khi CLI xong, worker chính lấy lại được ngay
+        assert job_queue.acquire_lease(conn, "w1", 60)
+    finally:
+        conn.close()
@@ -0,0 +1,52 @@
+# tests/test_parser.py — nhận dòng tiêu đề ngày trong bảng lịch tuần
+from docx import Document
+
+from backend.rag.parser import parse_docx_as_table
+
+
+def _docx(tmp_path, rows):
+    doc = Document()
+    t = doc.add_table(rows=len(rows), cols=2)
+    for i, (left, right) in enumerate(rows):
+        t.cell(i, 0).text, t.cell(i, 1).text = left, right
+    path = tmp_path / "lich.docx"
+    doc.save(path)
+    return str(path)
+
+
+def test_day_headers_in_any_dow_spelling(tmp_path):
+    path = _docx(tmp_path, [
+        ("Thứ 2\n18/08", "8h00 Họp giao ban"),
+        ("Thứ Ba\n19/8", "9h Tiếp đoàn"),
+        ("thu 4 20/08", "14h Hội đồng xét tuyển"),
+        ("CN 24/8", "Cả ngày: Lễ khai giảng"),
+    ])
+    events = parse_docx_as_table(path, 2025)
+    assert [(ev["date"], ev["dow"]) for ev in events] == [
+        ("18/08/2025", "Thứ 2"), ("19/08/2025", "Thứ 3"), ("20/08/2025", "Thứ 4"), ("24/08/2025", "Chủ nhật"),
+    ]
+
+
+def test_ordinal_event_line_is_not_a_day_header(tmp_path):
+    # "thứ ba" trong cột phải là số thứ tự, không phải tiêu đề ngày
+    path = _docx(tmp_path, [
+        ("Thứ 2\n18/08", "8h00 Kỳ họp thứ ba của Hội đồng trường, ngày 25/8\n14h Họp giao ban"),
+    ])
+    events = parse_docx_as_table(path, 2025)
+    assert [(ev["date"], ev["dow"], ev["start"]) for ev in events] == [
+        ("18/08/2025", "Thứ 2", "08:00"), ("18/08/2025", "Thứ 2", "14:00"),
+    ]
+    assert events[0]["title"].startswith("Kỳ họp thứ ba")
+
+
+def test_left_cell_dow_must_lead_the_cell(tmp_path):
+    # ô trái có dd/mm và "t3"/"cn"/"th5" ở giữa (phòng, ghi chú) không phải tiêu đề ngày
+    path = _docx(tmp_path, [
+        ("Thứ 2\n18/08", "8h00 Họp giao ban"),
+        ("Phòng T3 nhà A, dời từ 20/08", "14h Họp BGH"),
+        ("Hạn nộp 22/08 (cn, th5)", "16h Họp Khoa"),
+    ])
+    events = parse_docx_as_table(path, 2025)
+    assert [(ev["date"], ev["dow"], ev["start"]) for ev in events] == [
+        ("18/08/2025", "Thứ 2", "08:00"), ("18/08/2025", "Thứ 2", "14:00"), ("18/08/2025", "Thứ 2", "16:00"),
+    ]
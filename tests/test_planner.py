@@ -0,0 +1,44 @@
+# tests/test_planner.py — phạm vi ngày của planner với "hôm nay / ngày mai / sáng nay"
+from datetime import datetime, timedelta
+
+from backend.rag.calendar_index import ScheduleCalendar
+from backend.rag.normalize import event_norm
+from backend.rag.planner import run_plan
+from backend.rag.query_parser import parse_query
+
+
+def _day(offset: int) -> str:
+    return (datetime.now() + timedelta(days=offset)).strftime("%d/%m/%Y")
+
+
+def _ev(id_, date, start, title, location="", participants=""):
+    ev = {"id": id_, "date": date, "dow": "", "start": start, "end": None, "title": title,
+          "location": location, "participants": participants, "raw": title}
+    ev["norm"] = event_norm(ev)
+    return ev
+
+
+def _calendar() -> ScheduleCalendar:
+    return ScheduleCalendar([
+        _ev(1, _day(0), "08:00", "Họp giao ban", "Phòng họp số 1", "BGH"),
+        _ev(2, _day(0), "14:00", "Họp hội đồng", "Phòng họp số 2", "BGH"),
+        _ev(3, _day(1), "09:00", "Họp BGH", "Phòng họp số 1", "BGH"),
+        _ev(4, _day(2), "08:00", "Họp tổ", "Phòng họp số 1", "Khoa CNTT"),
+    ])
+
+
+def test_today_location_scoped_to_today():
+    res = run_plan(parse_query("hôm nay có họp ở phòng họp số 1 không"), _calendar())
+    assert [ev["id"] for ev in res["hits"]] == [1]
+    assert "hôm nay" in res["answer"] and "trong lịch tuần" not in res["answer"]
+
+
+def test_tomorrow_keyword_scoped_to_tomorrow():
+    res = run_plan(parse_query("ngày mai BGH có họp không"), _calendar())
+    assert [ev["id"] for ev in res["hits"]] == [3]
+    assert "ngày mai" in res["answer"]
+
+
+def test_part_of_day_today():
+    res = run_plan(parse_query("sáng nay có họp gì"), _calendar())
+    assert [ev["id"] for ev in res["hits"]] == [1]
@@ -0,0 +1,86 @@
+# tests/test_query_parser.py — parse_query: intent, ngày, thứ, giờ, hôm nay/ngày mai, từ khoá
+from backend.rag.query_parser import parse_query
+
+
+def test_today_without_question_word():
+    pq = parse_query("hôm nay có họp ở phòng họp số 1 không")
+    assert pq.relative_day == 0
+    assert pq.location == "phong hop so 1"
+    assert pq.intent == "SCHEDULE"
+
+
+def test_tomorrow_without_question_word():
+    pq = parse_query("ngày mai BGH có họp không")
+    assert pq.relative_day == 1
+    assert pq.keywords == ["bgh"]
+
+
+def test_part_of_day_nay_is_today():
+    pq = parse_query("sáng nay có họp gì")
+    assert pq.relative_day == 0
+    assert pq.part_of_day == "sang"
+    assert "nay" not in pq.keywords
+
+
+def test_today_question():
+    assert parse_query("hôm nay là ngày mấy").relative_day == 0
+    assert parse_query("chiều mai có lịch gì").relative_day == 1
+
+
+def test_relative_day_needs_schedule_cue():
+    assert parse_query("hôm nay bạn thế nào?").relative_day is None
+    assert parse_query("ngày mai trời mưa không").relative_day is None
+
+
+def test_intent():
+    assert parse_query("xin chào").intent == "SMALLTALK"
+    assert parse_query("Lịch tuần là gì").intent == "DEFINE"
+    assert parse_query("lịch toàn tuần").intent == "SCHEDULE_ALL"
+    assert parse_query("21/08/2025 họp gì").intent == "SCHEDULE"
+    assert parse_query("thời tiết thế nào").intent == "GENERAL"
+    assert parse_query("").intent == "GENERAL"
+
+
+def test_dates():
+    assert parse_query("21/08/2025 họp gì").date == "21/08/2025"
+    assert parse_query("20 tháng 8 năm 2025 có gì").date == "20/08/2025"
+    pq = parse_query("18/08 lúc 14h")
+    assert pq.date is None and pq.day_month == (18, 8)
+
+
+def test_dow():
+    pq = parse_query("Thứ 5 có gì?")
+    assert (pq.dow, pq.dow_text) == ("thu5", "Thứ 5")
+    assert parse_query("thu nam co gi").dow == "thu5"
+    assert parse_query("chủ nhật có gì").dow == "cn"
+
+
+def test_time_range():
+    pq = parse_query("thứ 3 từ 13h30 đến 17h có họp gì")
+    # "thứ 3" là thứ, không bị đọc thành 03:00
+    assert (pq.dow, pq.t_from, pq.t_to) == ("thu3", "13:30", "17:00")
+    pq = parse_query("18/08 lúc 14h")
+    assert (pq.t_from, pq.t_to) == ("14:00", None)
+    pq = parse_query("2h chiều có họp không")
+    assert (pq.part_of_day, pq.t_from) == ("chieu", "14:00")
+
+
+def test_keywords_and_count():
+    pq = parse_query("BGH họp mấy lần trong tuần")
+    assert pq.count and "bgh" in pq.keywords
+    assert parse_query("EMBA ở đâu").keywords == ["emba"]
+    # hint mang nội dung ("khai giảng") vẫn là từ khoá; hư từ bị bỏ
+    assert parse_query("lễ khai giảng tổ chức khi nào").keywords[:3] == ["le", "khai", "giang"]
+    assert parse_query("21/08/2025 họp gì").keywords == []
+
+
+def test_rare_branches_gated_by_cue():
+    from backend.rag import query_parser as qp
+    # câu không có từ khoá của nhánh khoảng ngày/địa điểm đi regex rút gọn: kết quả phải y như regex đủ
+    for q in ("thứ 3 từ 13h30 đến 17h có họp gì", "hôm nay là ngày mấy", "lịch toàn tuần", "3 ngày tới có gì",
+              "từ 18/08 đến 22/08", "họp gì ở Hội trường", "tháng 9/2025", "hôm qua họp gì", "cuối tuần này"):
+        ql = q.lower()
+        gated = qp._RE_QUERY if qp._RE_RARE_CUE.search(ql) else qp._RE_QUERY_BASE
+        assert [(m.lastgroup, m.span()) for m in gated.finditer(ql)] == \
+               [(m.lastgroup, m.span()) for m in qp._RE_QUERY.finditer(ql)], q
+    assert parse_query("thứ Năm có gì").dow == "thu5"